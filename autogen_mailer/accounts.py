@@ -0,0 +1,134 @@
+"""Sending accounts: per-account quota, sharding recipients, and routing replies.
+
+Without any active EmailAccount everything goes through the single mailbox
+behind GOOGLE_OAUTH_TOKEN_PATH, represented by ``account=None``.
+"""
+import heapq
+import logging
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import timedelta
+
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from .models import AudienceDelivery, EmailAccount, Recipient
+from .transports import gmail_transport
+
+logger = logging.getLogger(__name__)
+
+# Gmail counts sending limits over a rolling day
+QUOTA_WINDOW = timedelta(days=1)
+
+
+class QuotaTracker:
+    """Sends left in the quota window and per-second pacing for each account.
+
+    Usage is counted from ``Recipient.sent_at`` and ``AudienceDelivery.sent_at``
+    when the tracker is built, so every process starts from the same numbers.
+    """
+
+    def __init__(self, accounts, now=None):
+        since = (now or timezone.now()) - QUOTA_WINDOW
+        used = Counter(dict(
+            # A member's Recipient (made when they reply) repeats their delivery
+            Recipient.objects.filter(account__in=accounts, is_sent=True, sent_at__gte=since, member__isnull=True)
+            .values_list('account')
+            .annotate(sent=Count('id'))
+        ))
+        # Sends to audience members are recorded as AudienceDeliveries
+        used.update(dict(
+            AudienceDelivery.objects.filter(account__in=accounts, state='sent', sent_at__gte=since)
+            .values_list('account')
+            .annotate(sent=Count('id'))
+        ))
+        self.accounts = {account.id: account for account in accounts}
+        self.remaining = {
+            account.id: max(account.daily_quota - used.get(account.id, 0), 0)
+            for account in accounts
+        }
+        self._next_send = dict.fromkeys(self.accounts, 0.0)
+        self._lock = threading.Lock()
+
+    def reserve(self, account_id):
+        with self._lock:
+            self.remaining[account_id] -= 1
+
+    def wait(self, account):
+        """Sleep until ``account`` may send again under its max_per_second"""
+        interval = 1.0 / account.max_per_second if account.max_per_second > 0 else 0.0
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_send[account.id])
+            self._next_send[account.id] = slot + interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+def shard_recipients(recipients, tracker):
+    """Assign each recipient to the account with the most quota left.
+
+    Quota is reserved as recipients are assigned, which also interleaves
+    accounts with similar headroom. Returns ``(assignments, deferred)``:
+    ``(recipient, account)`` pairs in send order, and the recipients no
+    account has quota for.
+    """
+    heap = [(-left, account_id) for account_id, left in tracker.remaining.items() if left > 0]
+    heapq.heapify(heap)
+    assignments = []
+    deferred = []
+    for recipient in recipients:
+        if not heap:
+            deferred.append(recipient)
+            continue
+        negative_left, account_id = heapq.heappop(heap)
+        tracker.reserve(account_id)
+        assignments.append((recipient, tracker.accounts[account_id]))
+        if negative_left + 1 < 0:
+            heapq.heappush(heap, (negative_left + 1, account_id))
+    return assignments, deferred
+
+
+@dataclass
+class SendPlan:
+    assignments: list
+    deferred: list = field(default_factory=list)
+    tracker: QuotaTracker = None
+
+
+def plan_sends(recipients, tracker=None):
+    """Shard ``recipients`` across the active accounts by remaining quota.
+
+    Passing the ``tracker`` of an earlier plan shards another chunk of the
+    same campaign against the quota that plan left.
+    """
+    if tracker is None:
+        accounts = list(EmailAccount.objects.filter(is_active=True))
+        if not accounts:
+            return SendPlan([(recipient, None) for recipient in recipients])
+        tracker = QuotaTracker(accounts)
+    assignments, deferred = shard_recipients(recipients, tracker)
+    if deferred:
+        logger.debug(
+            "%s recipients deferred: sending quota of all %s accounts is used up",
+            len(deferred), len(tracker.accounts)
+        )
+    return SendPlan(assignments, deferred, tracker)
+
+
+def discover_replies(campaign):
+    """Look for replies in every mailbox the campaign was sent from"""
+    mailboxes = list(EmailAccount.objects.filter(
+        Q(recipients__campaign=campaign) | Q(audience_deliveries__campaign=campaign)
+    ).distinct())
+    if (not mailboxes or campaign.recipients.filter(is_sent=True, account__isnull=True).exists()
+            or campaign.audience_deliveries.filter(state='sent', account__isnull=True).exists()):
+        mailboxes.append(None)
+    found = 0
+    for account in mailboxes:
+        # Pooled clients shared with sending, so a mailbox is not authenticated per run
+        with gmail_transport(account).client() as service:
+            found += service.process_replies_for_campaign(campaign)
+    return found
@@ -1,6 +1,6 @@
 from django.contrib import admin
 from .models import EmailCampaign, Recipient, GeneratedEmail
-from .models import EmailReply
+from .models import EmailReply, LLMCallMetric, EmailAccount, SuppressedAddress, Audience
 
 admin.site.register(EmailReply)
 
@@ -21,17 +21,41 @@ class EmailCampaignAdmin(admin.ModelAdmin):
     search_fields = ('name', 'topic')
     inlines = [RecipientInline, GeneratedEmailInline]
     fieldsets = (
-        (None, {'fields': ( 'name', 'topic')}),
+        (None, {'fields': ( 'name', 'topic', 'audience')}),
         ('Content', {'fields': ('details', 'tone')}),
     )
 
 @admin.register(Recipient)
 class RecipientAdmin(admin.ModelAdmin):
-    list_display = ('email', 'name', 'campaign', 'is_sent', 'sent_at')
-    list_filter = ('is_sent', 'campaign')
+    list_display = ('email', 'name', 'campaign', 'account', 'is_sent', 'sent_at')
+    list_filter = ('is_sent', 'campaign', 'account')
     search_fields = ('email', 'name')
 
 @admin.register(GeneratedEmail)
 class GeneratedEmailAdmin(admin.ModelAdmin):
     list_display = ('campaign', 'generated_at')
-    readonly_fields = ('generated_at',)
\ No newline at end of file
+    readonly_fields = ('generated_at',)
+
+@admin.register(LLMCallMetric)
+class LLMCallMetricAdmin(admin.ModelAdmin):
+    list_display = ('call_type', 'campaign', 'model', 'latency_ms', 'prompt_tokens', 'completion_tokens', 'success', 'created_at')
+    list_filter = ('call_type', 'success', 'backend')
+
+@admin.register(EmailAccount)
+class EmailAccountAdmin(admin.ModelAdmin):
+    list_display = ('email', 'display_name', 'daily_quota', 'max_per_second', 'is_active', 'last_sync')
+    list_filter = ('is_active',)
+    search_fields = ('email', 'display_name')
+
+@admin.register(SuppressedAddress)
+class SuppressedAddressAdmin(admin.ModelAdmin):
+    list_display = ('email', 'reason', 'campaign', 'created_at')
+    list_filter = ('reason',)
+    search_fields = ('email',)
+    readonly_fields = ('created_at',)
+
+@admin.register(Audience)
+class AudienceAdmin(admin.ModelAdmin):
+    list_display = ('name', 'created_at')
+    search_fields = ('name',)
+    readonly_fields = ('created_at',)
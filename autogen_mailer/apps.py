@@ -4,3 +4,12 @@ from django.apps import AppConfig
 class AutogenMailerConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'autogen_mailer'
+
+    def ready(self):
+        from django.conf import settings
+        from django.db.backends.signals import connection_created
+
+        from . import profiling
+
+        if getattr(settings, 'PROFILING_ALLOW_HEADER', False) or getattr(settings, 'PROFILING_SAMPLE_RATE', 0.0):
+            connection_created.connect(profiling.install_query_timer)
@@ -0,0 +1,150 @@
+"""Async versions of the I/O-bound campaign actions, for ASGI deployments.
+
+Under uvicorn workers these wait on OpenAI without holding a thread, so one
+process can keep hundreds of slow requests in flight. They return the same
+payloads as the matching EmailCampaignViewSet actions. Gmail's client
+library is synchronous, so Gmail work runs in a thread via ``sync_to_async``.
+"""
+import itertools
+import logging
+
+from asgiref.sync import sync_to_async
+from django.db.models import Count, Q
+from django.http import JsonResponse
+from django.shortcuts import aget_object_or_404
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+
+from . import events, services
+from .accounts import discover_replies
+from .instrumentation import tag_llm_calls
+from .models import EmailCampaign, EmailReply, GeneratedEmail
+from .serializers import GeneratedEmailSerializer
+
+logger = logging.getLogger(__name__)
+
+
+def _campaign_context(campaign):
+    details = campaign.details or ""
+    return {
+        "purpose": str(campaign.topic),
+        "key_points": [point.strip() for point in details.split('\n') if point.strip()],
+        "tone": str(campaign.tone)
+    }
+
+
+async def _reply_stats(campaign_id):
+    return await EmailReply.objects.filter(campaign_id=campaign_id).aaggregate(
+        total_replies=Count('id'),
+        pending_replies=Count('id', filter=Q(processed=False)),
+        sent_replies=Count('id', filter=Q(reply_sent=True)),
+        # Settled without an LLM call (see reply_classifier)
+        auto_replies=Count('id', filter=Q(classification__in=['auto_reply', 'bounce'])),
+        unsubscribes=Count('id', filter=Q(classification='unsubscribe')),
+        escalated_replies=Count('id', filter=Q(escalated=True))
+    )
+
+
+@csrf_exempt
+@require_POST
+async def generate_content(request, pk):
+    campaign = await aget_object_or_404(EmailCampaign, pk=pk)
+    # Building the autogen agents is slow enough to stall the event loop
+    generator = await sync_to_async(services.create)('email_generator')
+    if request.GET.get('stream') in ('1', 'true'):
+        with tag_llm_calls(campaign_id=campaign.id, call_type='generate'):
+            stream = generator.astream_email(_campaign_context(campaign))
+        return events.event_stream_response(ageneration_events(campaign, stream))
+    try:
+        with tag_llm_calls(campaign_id=campaign.id, call_type='generate'):
+            email_content = await generator.agenerate_email(_campaign_context(campaign))
+
+        generated_email, created = await GeneratedEmail.objects.aupdate_or_create(
+            campaign=campaign,
+            defaults={
+                'subject': email_content['subject'],
+                'body_text': email_content['body_text'],
+                'body_html': email_content['body_html']
+            }
+        )
+        return JsonResponse(GeneratedEmailSerializer(instance=generated_email).data)
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=500)
+
+
+async def ageneration_events(campaign, stream):
+    """Async counterpart of views.generation_events"""
+    ids = itertools.count(1)
+    try:
+        async for event_type, data in stream:
+            yield events.Event(next(ids), event_type, data).encode()
+        generated_email, created = await GeneratedEmail.objects.aupdate_or_create(
+            campaign=campaign,
+            defaults={
+                'subject': stream.email['subject'],
+                'body_text': stream.email['body_text'],
+                'body_html': stream.email['body_html']
+            }
+        )
+        yield events.Event(next(ids), 'done', GeneratedEmailSerializer(instance=generated_email).data).encode()
+    except Exception as e:
+        logger.error("Streamed generation failed for campaign %s: %s", campaign.id, e)
+        yield events.Event(next(ids), 'error', {'error': str(e)}).encode()
+
+
+@require_GET
+async def preview(request, pk):
+    campaign = await aget_object_or_404(EmailCampaign, pk=pk)
+    generated_email = await GeneratedEmail.objects.filter(campaign=campaign).afirst()
+    if generated_email is None:
+        return JsonResponse({'error': 'No generated content'}, status=404)
+    return JsonResponse(GeneratedEmailSerializer(instance=generated_email).data)
+
+
+@require_GET
+async def reply_stats(request, pk):
+    """Get statistics about replies for a campaign"""
+    campaign = await aget_object_or_404(EmailCampaign, pk=pk)
+    return JsonResponse(await _reply_stats(campaign.id))
+
+
+@csrf_exempt
+@require_POST
+async def process_replies(request, pk):
+    """Find new replies, then answer them with concurrently generated responses"""
+    campaign = await aget_object_or_404(EmailCampaign, pk=pk)
+    try:
+        found_count = await sync_to_async(discover_replies)(campaign)
+
+        reply_handler = await sync_to_async(services.create)('reply_handler')
+        sent_count = await reply_handler.aprocess_pending_replies_for_campaign(campaign)
+
+        stats = await _reply_stats(campaign.id)
+        logger.info(
+            "Processed replies for campaign %s: %s found", campaign.id, found_count,
+            extra={'campaign_id': campaign.id, 'new_replies': found_count, 'stats': stats}
+        )
+        return JsonResponse({
+            'status': 'success',
+            'message': f'Processed {found_count} replies and sent {sent_count} responses',
+            'stats': stats,
+            'details': {
+                'new_replies_found': found_count,
+                'responses_sent': sent_count,
+                'campaign_id': campaign.id,
+                'campaign_name': campaign.name
+            }
+        })
+    except Exception as e:
+        logger.error("Error processing replies: %s", e, exc_info=True)
+        return JsonResponse(
+            {
+                'status': 'error',
+                'message': str(e),
+                'details': {
+                    'campaign_id': pk,
+                    'error_type': type(e).__name__
+                }
+            },
+            status=500
+        )
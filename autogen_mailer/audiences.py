@@ -0,0 +1,187 @@
+"""Reusable recipient lists.
+
+An Audience stores each address once. A campaign points at an audience,
+so launching or cloning one costs a single row however long the list is.
+Sending records a slim AudienceDelivery row (state, account, message ids)
+per member actually sent to; the address stays on the member. A full
+Recipient row is only created for a member who replies, since replies
+are tracked per Recipient.
+"""
+import itertools
+import logging
+from collections import namedtuple
+
+from django.conf import settings
+from django.db import transaction
+
+from .models import Audience, AudienceDelivery, AudienceMember, EmailCampaign, EmailVariant, GeneratedEmail, Recipient
+from .suppression import normalize
+
+# An audience member in the send loop, next to the ``(id, email)`` rows of Recipients
+MemberRow = namedtuple('MemberRow', ['member_id', 'email'])
+
+logger = logging.getLogger(__name__)
+
+
+def _chunk_size(chunk_size=None):
+    return chunk_size or getattr(settings, 'MAILER_RECIPIENT_CHUNK_SIZE', 1000)
+
+
+def add_members(audience, rows, chunk_size=None):
+    """Add ``(email, name)`` rows to an audience; returns how many were new.
+
+    Rows are written a chunk at a time. Addresses are lowercased, and
+    addresses already in the audience are left as they are.
+    """
+    chunk_size = _chunk_size(chunk_size)
+    before = audience.members.count()
+    rows = iter(rows)
+    while True:
+        chunk = list(itertools.islice(rows, chunk_size))
+        if not chunk:
+            break
+        AudienceMember.objects.bulk_create(
+            [AudienceMember(audience=audience, email=normalize(email), name=name) for email, name in chunk],
+            ignore_conflicts=True
+        )
+    return audience.members.count() - before
+
+
+def audience_from_campaign(campaign, name=None, chunk_size=None):
+    """An audience holding the campaign's own recipients (a one-off copy)"""
+    chunk_size = _chunk_size(chunk_size)
+    audience = Audience.objects.create(name=name or campaign.name)
+    own = Recipient.objects.filter(campaign=campaign, member__isnull=True).order_by('id')
+    last_id = 0
+    while True:
+        rows = list(own.filter(id__gt=last_id).values_list('id', 'email', 'name')[:chunk_size])
+        add_members(audience, ((email, recipient_name) for _, email, recipient_name in rows), chunk_size)
+        if len(rows) < chunk_size:
+            return audience
+        last_id = rows[-1][0]
+
+
+def copy_own_recipients(campaign, clone, chunk_size=None):
+    """Give ``clone`` unsent copies of the campaign's own (non-member) recipients"""
+    chunk_size = _chunk_size(chunk_size)
+    own = Recipient.objects.filter(campaign=campaign, member__isnull=True).order_by('id')
+    last_id = 0
+    while True:
+        rows = list(own.filter(id__gt=last_id).values_list('id', 'email', 'name')[:chunk_size])
+        Recipient.objects.bulk_create(
+            [Recipient(campaign=clone, email=email, name=recipient_name) for _, email, recipient_name in rows]
+        )
+        if len(rows) < chunk_size:
+            return
+        last_id = rows[-1][0]
+
+
+@transaction.atomic
+def clone_campaign(campaign, name=None):
+    """A new campaign with the same content, sent to the same audience.
+
+    A campaign that only has its own recipients has them turned into an
+    audience first. One with an audience and its own recipients keeps the
+    audience and has the own recipients copied. The source campaign itself
+    is left unchanged.
+    """
+    audience = campaign.audience
+    has_own = campaign.recipients.filter(member__isnull=True).exists()
+    if audience is None and has_own:
+        audience = audience_from_campaign(campaign)
+    clone = EmailCampaign.objects.create(
+        name=name or f"{campaign.name} (copy)",
+        topic=campaign.topic,
+        details=campaign.details,
+        tone=campaign.tone,
+        audience=audience
+    )
+    if campaign.audience_id is not None and has_own:
+        copy_own_recipients(campaign, clone)
+    generated_email = GeneratedEmail.objects.filter(campaign=campaign).first()
+    if generated_email is not None:
+        GeneratedEmail.objects.create(
+            campaign=clone,
+            subject=generated_email.subject,
+            body_text=generated_email.body_text,
+            body_html=generated_email.body_html
+        )
+    EmailVariant.objects.bulk_create([
+        EmailVariant(campaign=clone, index=variant.index, subject=variant.subject,
+                     body_text=variant.body_text, body_html=variant.body_html)
+        for variant in campaign.variants.all()
+    ])
+    return clone
+
+
+def audience_delivery_chunks(campaign, chunk_size=None):
+    """Audience members the campaign has not been sent to, as lists of MemberRow.
+
+    Pages through the audience by member id. The sent deliveries of each
+    chunk's id range are read in one query on the (campaign, member)
+    index; nothing is written until a send succeeds.
+    """
+    chunk_size = _chunk_size(chunk_size)
+    members = AudienceMember.objects.filter(audience_id=campaign.audience_id).order_by('id')
+    last_id = 0
+    while True:
+        batch = list(members.filter(id__gt=last_id).values_list('id', 'email')[:chunk_size])
+        if not batch:
+            return
+        sent = set(
+            AudienceDelivery.objects.filter(
+                campaign=campaign, state='sent', member_id__gte=batch[0][0], member_id__lte=batch[-1][0]
+            ).values_list('member_id', flat=True)
+        )
+        rows = [MemberRow(member_id, email) for member_id, email in batch if member_id not in sent]
+        if rows:
+            yield rows
+        if len(batch) < chunk_size:
+            return
+        last_id = batch[-1][0]
+
+
+def record_delivery(campaign, row, state, **fields):
+    """Save the outcome of sending to an audience member"""
+    AudienceDelivery.objects.update_or_create(
+        campaign=campaign, member_id=row.member_id, defaults={'state': state, **fields}
+    )
+
+
+def pending_audience_members(campaign):
+    """Audience members the campaign has not been sent to yet"""
+    if campaign.audience_id is None:
+        return 0
+    members = AudienceMember.objects.filter(audience_id=campaign.audience_id).count()
+    return members - AudienceDelivery.objects.filter(campaign=campaign, state='sent').count()
+
+
+def recipient_for_reply(campaign, email):
+    """The Recipient row a reply from an audience member is filed under.
+
+    Created from the member's delivery on their first reply, or None when
+    the campaign was not sent to that address through its audience.
+    """
+    if campaign.audience_id is None:
+        return None
+    delivery = (
+        AudienceDelivery.objects.filter(campaign=campaign, state='sent', member__email=normalize(email))
+        .select_related('member').first()
+    )
+    if delivery is None:
+        return None
+    recipient, _ = Recipient.objects.get_or_create(
+        campaign=campaign,
+        email=delivery.member.email,
+        defaults={
+            'name': delivery.member.name,
+            'member': delivery.member,
+            'is_sent': True,
+            'sent_at': delivery.sent_at,
+            'account': delivery.account,
+            'variant': delivery.variant,
+            'message_id': delivery.message_id,
+            'thread_id': delivery.thread_id,
+        }
+    )
+    return recipient
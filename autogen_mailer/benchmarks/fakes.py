@@ -0,0 +1,246 @@
+import base64
+import itertools
+import random
+import re
+import threading
+import time
+
+import httplib2
+from googleapiclient.errors import HttpError
+
+from ..gmail_service import GmailService
+
+
+def _encode(text):
+    return base64.urlsafe_b64encode(text.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+# subject:"..." or a bare "..." phrase of a Gmail search; operators like in:inbox match everything
+_QUERY_TERM_RE = re.compile(r'(subject:)?"([^"]*)"')
+
+
+def _matches(query, message):
+    """Whether a message matches the quoted phrases of a Gmail search, case-insensitively"""
+    headers = {header['name']: header['value'] for header in message['payload']['headers']}
+    subject = headers.get('Subject', '').lower()
+    text = ' '.join(
+        base64.urlsafe_b64decode(part['body']['data'] + '==').decode('utf-8')
+        for part in message['payload'].get('parts', ())
+    ).lower()
+    for field, phrase in _QUERY_TERM_RE.findall(query or ''):
+        phrase = phrase.lower()
+        if phrase not in subject and (field or phrase not in text):
+            return False
+    return True
+
+
+class FakeGmailAPI:
+    """In-memory stand-in for the ``gmail`` v1 discovery client.
+
+    Supports the calls the app makes (messages list/get/send, attachments
+    get, threads get) plus batch requests. Every ``execute()`` sleeps for
+    ``latency`` seconds (+/- ``jitter``) and fails with HTTP 429 with
+    probability ``quota_error_rate``; the wall time of each call is kept in
+    ``timings`` per method. Searches match quoted phrases of ``q`` like
+    Gmail and are paged with ``pageToken``; ``fetched_threads`` holds the
+    threads that were read.
+    """
+
+    def __init__(self, latency=0.0, jitter=0.0, quota_error_rate=0.0, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.quota_error_rate = quota_error_rate
+        self.random = random.Random(seed)
+        self.threads = {}
+        self.messages = {}
+        self.sent = []
+        self.fetched_threads = set()
+        self.timings = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    # Mailbox setup
+
+    def add_reply_thread(self, subject, from_email, reply_text, sender='me@example.com'):
+        """Add a thread holding an original message and one reply to it"""
+        thread_id = f"t{next(self._ids)}"
+        original = self._message(thread_id, subject, sender, "Original campaign email")
+        reply = self._message(thread_id, f"Re: {subject}", from_email, reply_text)
+        self.threads[thread_id] = [original, reply]
+        return thread_id
+
+    def _message(self, thread_id, subject, from_email, text):
+        message_id = f"m{next(self._ids)}"
+        message = {
+            'id': message_id,
+            'threadId': thread_id,
+            'payload': {
+                'mimeType': 'multipart/alternative',
+                'headers': [
+                    {'name': 'From', 'value': from_email},
+                    {'name': 'Subject', 'value': subject},
+                ],
+                'parts': [
+                    {'mimeType': 'text/plain', 'body': {'data': _encode(text)}},
+                    {'mimeType': 'text/html', 'body': {'data': _encode(f"<p>{text}</p>")}},
+                ],
+            },
+        }
+        self.messages[message_id] = message
+        return message
+
+    # Request plumbing
+
+    def _request(self, method, handler):
+        return FakeRequest(self, method, handler)
+
+    def _call(self, method, handler):
+        started = time.monotonic()
+        delay = self.latency
+        if self.jitter:
+            delay = max(0.0, delay + self.random.uniform(-self.jitter, self.jitter))
+        if delay:
+            time.sleep(delay)
+        try:
+            if self.quota_error_rate and self.random.random() < self.quota_error_rate:
+                raise HttpError(
+                    httplib2.Response({'status': 429, 'reason': 'Too Many Requests'}),
+                    b'{"error": {"code": 429, "message": "Rate Limit Exceeded"}}'
+                )
+            return handler()
+        finally:
+            with self._lock:
+                self.timings.setdefault(method, []).append(time.monotonic() - started)
+
+    def new_batch_http_request(self, callback=None):
+        return FakeBatch(self, callback)
+
+    # Resource tree: service.users().messages()...
+
+    def users(self):
+        return _Users(self)
+
+
+class _Users:
+    def __init__(self, api):
+        self.api = api
+
+    def messages(self):
+        return _Messages(self.api)
+
+    def threads(self):
+        return _Threads(self.api)
+
+
+class _Messages:
+    def __init__(self, api):
+        self.api = api
+
+    def list(self, userId, q=None, maxResults=100, pageToken=None, **kwargs):
+        def handler():
+            # Newest message of every thread matching the search, a page at a time
+            hits = [
+                {'id': messages[-1]['id'], 'threadId': thread_id}
+                for thread_id, messages in self.api.threads.items()
+                if _matches(q, messages[-1])
+            ]
+            start = int(pageToken or 0)
+            response = {'resultSizeEstimate': len(hits)}
+            if hits[start:start + maxResults]:
+                response['messages'] = hits[start:start + maxResults]
+            if start + maxResults < len(hits):
+                response['nextPageToken'] = str(start + maxResults)
+            return response
+        return self.api._request('messages.list', handler)
+
+    def get(self, userId, id, format='full', metadataHeaders=None, **kwargs):
+        return self.api._request('messages.get', lambda: _shape(self.api.messages[id], format))
+
+    def send(self, userId, body, **kwargs):
+        def handler():
+            message_id = f"s{next(self.api._ids)}"
+            with self.api._lock:
+                self.api.sent.append(len(body.get('raw', '')))
+            return {'id': message_id, 'threadId': f"t{message_id}", 'labelIds': ['SENT']}
+        return self.api._request('messages.send', handler)
+
+    def attachments(self):
+        return _Attachments(self.api)
+
+
+class _Attachments:
+    def __init__(self, api):
+        self.api = api
+
+    def get(self, userId, messageId, id, **kwargs):
+        return self.api._request('attachments.get', lambda: {'data': '', 'size': 0})
+
+
+class _Threads:
+    def __init__(self, api):
+        self.api = api
+
+    def get(self, userId, id, format='full', metadataHeaders=None, **kwargs):
+        def handler():
+            with self.api._lock:
+                self.api.fetched_threads.add(id)
+            return {'id': id, 'messages': [_shape(m, format) for m in self.api.threads[id]]}
+        return self.api._request('threads.get', handler)
+
+
+def _shape(message, format):
+    """Drop the body parts when only metadata was asked for"""
+    if format != 'metadata':
+        return message
+    payload = message['payload']
+    return {
+        **message,
+        'payload': {'mimeType': payload['mimeType'], 'headers': payload['headers']},
+    }
+
+
+class FakeRequest:
+    def __init__(self, api, method, handler):
+        self.api = api
+        self.method = method
+        self.handler = handler
+
+    def execute(self):
+        return self.api._call(self.method, self.handler)
+
+
+class FakeBatch:
+    """Batch of requests paying a single round trip, like the batch endpoint"""
+
+    def __init__(self, api, callback=None):
+        self.api = api
+        self.callback = callback
+        self.requests = []
+
+    def add(self, request, callback=None, request_id=None):
+        self.requests.append((request_id or str(len(self.requests)), request, callback))
+
+    def execute(self):
+        def run():
+            outcomes = []
+            for request_id, request, callback in self.requests:
+                try:
+                    outcomes.append((request_id, callback, request.handler(), None))
+                except HttpError as error:
+                    outcomes.append((request_id, callback, None, error))
+            return outcomes
+
+        for request_id, callback, response, error in self.api._call('batch', run):
+            callback = callback or self.callback
+            if callback:
+                callback(request_id, response, error)
+
+
+class FakeGmailService(GmailService):
+    """GmailService running against a FakeGmailAPI instead of Google"""
+
+    def __init__(self, api=None, user_id="me", account=None):
+        self.user_id = user_id
+        self.account = account
+        self.api = api or FakeGmailAPI()
+        self.service = self.api
@@ -0,0 +1,223 @@
+import io
+import os
+import platform
+import subprocess
+import tempfile
+import time
+from datetime import datetime, timezone
+from unittest import mock
+
+import django
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import override_settings
+from rest_framework.test import APIRequestFactory
+
+from .. import services
+from ..llm_gateway import LLMGateway, StubBackend, get_gateway, set_gateway
+from ..models import EmailCampaign, GeneratedEmail, Recipient
+from ..transports import Transport, close_transports
+from ..views import EmailCampaignViewSet
+from .fakes import FakeGmailAPI, FakeGmailService
+
+
+def percentile(values, q):
+    """Nearest-rank percentile of ``values`` (0 < q <= 1)"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+
+def summarize(suite, size, seconds, units, latencies, **extra):
+    return {
+        'suite': suite,
+        'size': size,
+        'seconds': round(seconds, 4),
+        'throughput_per_s': round(units / seconds, 2) if seconds else None,
+        'p50_ms': _ms(percentile(latencies, 0.5)),
+        'p99_ms': _ms(percentile(latencies, 0.99)),
+        **extra,
+    }
+
+
+def _ms(seconds):
+    return round(seconds * 1000, 3) if seconds is not None else None
+
+
+# Recipient domains, heavily skewed towards a few providers like real lists
+DOMAINS = ['gmail.com'] * 8 + ['yahoo.com'] * 3 + ['outlook.com'] * 2 + [f'company{n}.com' for n in range(7)]
+# Keep the per-domain queues but drop their pacing, to measure the engine itself
+BENCH_DOMAIN_LIMITS = {'default': {'concurrency': 4, 'rate_per_second': 0}}
+
+
+def _campaign(name, subject=None, recipients=0):
+    campaign = EmailCampaign.objects.create(name=name, topic='Benchmark', details='Point one\nPoint two')
+    if subject:
+        GeneratedEmail.objects.create(
+            campaign=campaign, subject=subject,
+            body_text='Benchmark body', body_html='<p>Benchmark body</p>'
+        )
+    if recipients:
+        Recipient.objects.bulk_create(
+            (Recipient(campaign=campaign, email=f'user{i}@{DOMAINS[i % len(DOMAINS)]}', name=f'User {i}')
+             for i in range(recipients)),
+            batch_size=5000
+        )
+    return campaign
+
+
+def _csv(rows):
+    buffer = io.StringIO()
+    buffer.write('email,name\n')
+    for i in range(rows):
+        buffer.write(f'user{i}@example.com,User {i}\n')
+    return buffer.getvalue().encode('utf-8')
+
+
+def bench_import(sizes, repeat=1):
+    """Time the import_recipients endpoint on CSV files of each size"""
+    factory = APIRequestFactory()
+    view = EmailCampaignViewSet.as_view({'post': 'import_recipients'})
+    results = []
+    for size in sizes:
+        payload = _csv(size)
+        durations = []
+        for run in range(repeat):
+            campaign = _campaign(f'import-{size}-{run}')
+            request = factory.post(
+                f'/api/campaigns/{campaign.pk}/import_recipients/',
+                {'file': SimpleUploadedFile('recipients.csv', payload, content_type='text/csv')},
+                format='multipart'
+            )
+            started = time.monotonic()
+            response = view(request, pk=campaign.pk)
+            durations.append(time.monotonic() - started)
+            if response.status_code != 200:
+                raise RuntimeError(f"import_recipients failed: {response.data}")
+            campaign.delete()
+        total = sum(durations)
+        results.append(summarize('import_recipients', size, total, size * repeat, durations, runs=repeat))
+    return results
+
+
+def bench_send(sizes, gmail_latency=0.0, llm_latency=0.0, quota_error_rate=0.0, transport='gmail'):
+    """Time generate_and_send for campaigns of each size.
+
+    ``transport`` is 'gmail' for the fake Gmail API or 'file' for the real
+    Maildir sink transport writing to a temporary directory.
+    """
+    factory = APIRequestFactory()
+    view = EmailCampaignViewSet.as_view({'post': 'generate_and_send'})
+    results = []
+    for size in sizes:
+        campaign = _campaign(f'send-{size}', recipients=size)
+        api = FakeGmailAPI(latency=gmail_latency, quota_error_rate=quota_error_rate)
+        send_latencies = []
+        real_send = Transport.send_email
+
+        def timed_send(self, *args, **kwargs):
+            started = time.monotonic()
+            try:
+                return real_send(self, *args, **kwargs)
+            finally:
+                send_latencies.append(time.monotonic() - started)
+
+        request = factory.post(f'/api/campaigns/{campaign.pk}/generate_and_send/', {}, format='json')
+        with tempfile.TemporaryDirectory(prefix='mailer-sink-') as sink, \
+                override_settings(MAILER_TRANSPORT=transport, MAILER_FILE_SINK_DIR=sink,
+                                  MAILER_DOMAIN_LIMITS=BENCH_DOMAIN_LIMITS, MAILER_DOMAIN_BACKOFF_SECONDS=0.05,
+                                  MAILER_ACCOUNT_BACKOFF_SECONDS=0.05), \
+                services.override('gmail', lambda *a, **k: FakeGmailService(api)), \
+                mock.patch.object(Transport, 'send_email', timed_send):
+            close_transports()
+            try:
+                started = time.monotonic()
+                response = view(request, pk=campaign.pk)
+                elapsed = time.monotonic() - started
+            finally:
+                close_transports()
+        if response.status_code != 200:
+            raise RuntimeError(f"generate_and_send failed: {response.data}")
+        results.append(summarize(
+            'generate_and_send', size, elapsed, size, send_latencies,
+            transport=transport,
+            failures=len(response.data['failures']),
+            gmail_latency_ms=gmail_latency * 1000 if transport == 'gmail' else None,
+            llm_latency_ms=llm_latency * 1000
+        ))
+        campaign.delete()
+    return results
+
+
+def bench_replies(mailbox_sizes, gmail_latency=0.0, quota_error_rate=0.0):
+    """Time reply discovery over fake mailboxes of each size"""
+    results = []
+    subject = 'Benchmark launch update'
+    for size in mailbox_sizes:
+        campaign = _campaign(f'replies-{size}', subject=subject, recipients=size)
+        api = FakeGmailAPI(latency=gmail_latency, quota_error_rate=quota_error_rate)
+        # One reply from every recipient, sent from their own address
+        for email, name in campaign.recipients.values_list('email', 'name'):
+            api.add_reply_thread(
+                subject, f'{name} <{email}>',
+                f'Thanks, tell me more.\n\nOn Mon, someone <me@example.com> wrote:\n> {subject}'
+            )
+        service = FakeGmailService(api)
+        started = time.monotonic()
+        found = service.process_replies_for_campaign(campaign)
+        elapsed = time.monotonic() - started
+        call_latencies = [value for values in api.timings.values() for value in values]
+        # Throughput is over the threads discovery actually read, not the mailbox size
+        processed = len(api.fetched_threads)
+        results.append(summarize(
+            'process_replies_for_campaign', size, elapsed, max(processed, 1), call_latencies,
+            threads_processed=processed,
+            replies_found=found,
+            gmail_calls={method: len(values) for method, values in api.timings.items()},
+            gmail_latency_ms=gmail_latency * 1000
+        ))
+        campaign.delete()
+    return results
+
+
+def run(suites, import_sizes=(), send_sizes=(), mailbox_sizes=(), repeat=1,
+        gmail_latency=0.0, llm_latency=0.0, quota_error_rate=0.0, transport='gmail'):
+    """Run the selected suites and return a JSON-serializable report"""
+    previous = get_gateway() if 'send' in suites else None
+    if 'send' in suites:
+        set_gateway(LLMGateway(StubBackend(latency=llm_latency), model='benchmark-stub'))
+    revision = _revision()
+    results = []
+    # autogen keeps a disk cache in the working directory; start each run cold
+    workdir = tempfile.TemporaryDirectory(prefix='mailer-bench-')
+    cwd = os.getcwd()
+    os.chdir(workdir.name)
+    try:
+        if 'import' in suites:
+            results.extend(bench_import(import_sizes, repeat))
+        if 'send' in suites:
+            results.extend(bench_send(send_sizes, gmail_latency, llm_latency, quota_error_rate, transport))
+        if 'replies' in suites:
+            results.extend(bench_replies(mailbox_sizes, gmail_latency, quota_error_rate))
+    finally:
+        os.chdir(cwd)
+        workdir.cleanup()
+        if previous is not None:
+            set_gateway(previous)
+    return {
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'revision': revision,
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'results': results,
+    }
+
+
+def _revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
@@ -0,0 +1,95 @@
+"""Recognise bounce messages and read the failed recipients out of them.
+
+Bounces are delivery status notifications (RFC 3464): a
+``multipart/report; report-type=delivery-status`` message whose
+``message/delivery-status`` part holds one field block per recipient.
+Exim-style bounces without that part still name the failed addresses in
+``X-Failed-Recipients``.
+"""
+import re
+from dataclasses import dataclass
+
+from .mime_utils import decode_body_data, get_header, iter_leaf_parts
+
+# Headers reply discovery fetches so bounces are recognised without a download
+BOUNCE_HEADERS = ['From', 'Content-Type', 'X-Failed-Recipients']
+
+_DAEMON_RE = re.compile(r'\b(mailer-daemon|postmaster)@', re.IGNORECASE)
+_ADDRESS_RE = re.compile(r'[\w.+-]+@[\w-]+(\.[\w-]+)+')
+
+
+@dataclass(frozen=True)
+class Bounce:
+    email: str
+    status: str
+    diagnostic: str = ''
+
+    @property
+    def permanent(self):
+        # 5.x.x is a permanent failure, 4.x.x a delay that may still be delivered
+        return self.status.startswith('5')
+
+
+def is_bounce(message):
+    """Whether a Gmail message (metadata is enough) is a delivery failure report"""
+    content_type = (get_header(message, 'Content-Type') or '').lower()
+    if 'report-type=delivery-status' in content_type:
+        return True
+    if get_header(message, 'X-Failed-Recipients'):
+        return True
+    return bool(_DAEMON_RE.search(get_header(message, 'From') or ''))
+
+
+def _field_blocks(text):
+    """Split a delivery-status body into dicts of lowercased field names"""
+    blocks = []
+    for chunk in re.split(r'\r?\n\s*\r?\n', text):
+        fields = {}
+        name = None
+        for line in chunk.splitlines():
+            if line[:1] in (' ', '\t') and name:
+                fields[name] += ' ' + line.strip()
+            elif ':' in line:
+                name, _, value = line.partition(':')
+                name = name.strip().lower()
+                fields[name] = value.strip()
+        if fields:
+            blocks.append(fields)
+    return blocks
+
+
+def _address(field):
+    # "rfc822; jane@example.com"
+    match = _ADDRESS_RE.search(field.rpartition(';')[2])
+    return match.group(0).lower() if match else None
+
+
+def parse_bounce(message, fetch_attachment=None):
+    """List the recipients a full-format bounce message reports as failed.
+
+    ``fetch_attachment(attachment_id)`` loads a status part Gmail stored
+    separately.
+    """
+    bounces = []
+    for part in iter_leaf_parts(message.get('payload', {})):
+        if part.get('mimeType', '').lower() not in ('message/delivery-status', 'message/global-delivery-status'):
+            continue
+        body = part.get('body', {})
+        data = body.get('data')
+        if not data and body.get('attachmentId') and fetch_attachment:
+            data = fetch_attachment(body['attachmentId'])
+        for fields in _field_blocks(decode_body_data(data)):
+            email = _address(fields.get('final-recipient') or fields.get('original-recipient', ''))
+            if email is None or fields.get('action', 'failed').lower() not in ('failed', 'delayed'):
+                continue
+            status = fields.get('status', '5.0.0' if fields.get('action', 'failed').lower() == 'failed' else '4.0.0')
+            bounces.append(Bounce(email, status.split()[0], fields.get('diagnostic-code', '')))
+    if bounces:
+        return bounces
+
+    # No status part: X-Failed-Recipients is only added for permanent failures
+    failed = get_header(message, 'X-Failed-Recipients') or ''
+    return [
+        Bounce(match.group(0).lower(), '5.0.0')
+        for match in _ADDRESS_RE.finditer(failed)
+    ]
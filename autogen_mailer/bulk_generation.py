@@ -0,0 +1,70 @@
+"""Generate the emails of many campaigns at once.
+
+Every generation is one completion through the shared LLM gateway with a
+single AutoGenEmailGenerator, awaited on the event loop at most
+MAILER_GENERATE_WORKERS at a time. Results are yielded and saved in
+completion order, so preparing a batch takes about as long as its slowest
+few campaigns.
+"""
+import asyncio
+import logging
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from . import services
+from .instrumentation import tag_llm_calls
+from .models import GeneratedEmail
+
+logger = logging.getLogger(__name__)
+
+
+def campaign_context(campaign):
+    details = campaign.details or ""
+    return {
+        "purpose": str(campaign.topic),
+        "key_points": [point.strip() for point in details.split('\n') if point.strip()],
+        "tone": str(campaign.tone)
+    }
+
+
+async def agenerate_campaigns(campaigns, workers=None, generator=None):
+    """Generate and save an email for every campaign.
+
+    Yields ``(campaign, generated_email, error)`` as each one finishes;
+    ``generated_email`` is None when it failed. Closing the generator early
+    cancels the generations still running.
+    """
+    workers = workers or getattr(settings, 'MAILER_GENERATE_WORKERS', 8)
+    # Building the autogen agents is slow enough to stall the event loop
+    generator = generator or await sync_to_async(services.create)('email_generator')
+    slots = asyncio.Semaphore(workers)
+
+    async def generate(campaign):
+        async with slots:
+            try:
+                with tag_llm_calls(campaign_id=campaign.id, call_type='generate'):
+                    return campaign, await generator.acomplete_email(campaign_context(campaign)), None
+            except Exception as error:
+                return campaign, None, error
+
+    tasks = [asyncio.ensure_future(generate(campaign)) for campaign in campaigns]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            campaign, email_content, error = await next_done
+            if error is not None:
+                logger.error("Generation failed for campaign %s: %s", campaign.id, error)
+                yield campaign, None, error
+                continue
+            generated_email, created = await GeneratedEmail.objects.aupdate_or_create(
+                campaign=campaign,
+                defaults={
+                    'subject': email_content['subject'],
+                    'body_text': email_content['body_text'],
+                    'body_html': email_content['body_html']
+                }
+            )
+            yield campaign, generated_email, None
+    finally:
+        for task in tasks:
+            task.cancel()
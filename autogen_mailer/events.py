@@ -0,0 +1,247 @@
+"""In-process publish/subscribe for live progress events.
+
+The send loop publishes to a per-campaign topic and each viewer of the
+``send_events`` stream holds one subscription. Events only reach viewers
+connected to the same process as the sender; there is no cross-process
+transport, so the stream is only offered under ASGI (see send_events).
+"""
+import asyncio
+import itertools
+import json
+import queue
+import threading
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+
+from django.http import StreamingHttpResponse
+
+# Events buffered per viewer; a viewer that falls further behind loses events
+SUBSCRIBER_BUFFER = 1000
+# Comment lines sent while idle so proxies keep the connection open
+HEARTBEAT_SECONDS = 15
+# Milliseconds a disconnected EventSource waits before reconnecting
+RETRY_MS = 3000
+
+
+@dataclass(frozen=True)
+class Event:
+    id: int
+    type: str
+    data: dict
+
+    def encode(self):
+        """Render as a text/event-stream frame"""
+        return f"id: {self.id}\nevent: {self.type}\ndata: {json.dumps(self.data, default=str)}\n\n".encode('utf-8')
+
+
+class Subscription:
+    """One viewer's queue of events for a topic.
+
+    Subscriptions made from an event loop get an ``asyncio.Queue`` that
+    publishers in other threads feed through the loop; others get a
+    thread-safe ``queue.Queue``.
+    """
+
+    def __init__(self, broker, topic, loop=None):
+        self.broker = broker
+        self.topic = topic
+        self.loop = loop
+        self.queue = asyncio.Queue(SUBSCRIBER_BUFFER) if loop else queue.Queue(SUBSCRIBER_BUFFER)
+        self.dropped = 0
+
+    def put(self, event):
+        if self.loop is None:
+            self._put(event)
+            return
+        try:
+            self.loop.call_soon_threadsafe(self._put, event)
+        except RuntimeError:
+            # The viewer's loop is gone; it will unsubscribe on its way out
+            pass
+
+    def _put(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except (queue.Full, asyncio.QueueFull):
+            self.dropped += 1
+
+    def get(self, timeout):
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    async def aget(self, timeout):
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class EventBroker:
+    """Fan events out to every subscription of a topic.
+
+    The latest event of each topic is kept and replayed to new
+    subscribers, so a viewer joining mid-send sees the counters at once.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscriptions = defaultdict(set)
+        self._latest = {}
+        self._ids = itertools.count(1)
+
+    def subscribe(self, topic, loop=None):
+        subscription = Subscription(self, topic, loop)
+        with self._lock:
+            self._subscriptions[topic].add(subscription)
+            latest = self._latest.get(topic)
+        if latest is not None:
+            subscription.put(latest)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.topic)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscriptions[subscription.topic]
+
+    def latest(self, topic):
+        with self._lock:
+            return self._latest.get(topic)
+
+    def publish(self, topic, event_type, data):
+        event = Event(next(self._ids), event_type, data)
+        with self._lock:
+            self._latest[topic] = event
+            subscriptions = list(self._subscriptions.get(topic, ()))
+        for subscription in subscriptions:
+            subscription.put(event)
+        return event
+
+    def subscriber_count(self, topic):
+        with self._lock:
+            return len(self._subscriptions.get(topic, ()))
+
+
+broker = EventBroker()
+
+
+def send_topic(campaign_id):
+    return f"campaign:{campaign_id}:send"
+
+
+class SendProgress:
+    """Rolling counters of one campaign send, published as it goes"""
+
+    def __init__(self, campaign_id, total, event_broker=None):
+        self.broker = event_broker or broker
+        self.topic = send_topic(campaign_id)
+        self.campaign_id = campaign_id
+        self.total = total
+        self.sent = 0
+        self.failed = 0
+        self.started = time.monotonic()
+        self.broker.publish(self.topic, 'started', self.snapshot('running'))
+
+    def snapshot(self, state):
+        elapsed = time.monotonic() - self.started
+        done = self.sent + self.failed
+        return {
+            'campaign_id': self.campaign_id,
+            'state': state,
+            'total': self.total,
+            'sent': self.sent,
+            'failed': self.failed,
+            'remaining': self.total - done,
+            'rate_per_s': round(done / elapsed, 2) if elapsed > 0 else 0.0,
+            'elapsed_s': round(elapsed, 2),
+        }
+
+    def record(self, email, error=None):
+        if error is None:
+            self.sent += 1
+        else:
+            self.failed += 1
+        data = self.snapshot('running')
+        data['recipient'] = email
+        data['status'] = 'failed' if error else 'sent'
+        if error:
+            data['error'] = str(error)
+        self.broker.publish(self.topic, 'progress', data)
+
+    def finish(self):
+        self.broker.publish(self.topic, 'finished', self.snapshot('finished'))
+
+
+# Event types after which a stream ends
+FINAL_EVENTS = ('finished',)
+
+
+async def astream(topic, heartbeat=HEARTBEAT_SECONDS):
+    """text/event-stream body for ASGI; waits on the event loop and ends after ``finished``"""
+    subscription = broker.subscribe(topic, loop=asyncio.get_running_loop())
+    try:
+        yield f"retry: {RETRY_MS}\n\n".encode('utf-8')
+        while True:
+            event = await subscription.aget(heartbeat)
+            if event is None:
+                yield b": keepalive\n\n"
+                continue
+            yield event.encode()
+            if event.type in FINAL_EVENTS:
+                return
+    finally:
+        subscription.close()
+
+
+async def keepalive(body, heartbeat=HEARTBEAT_SECONDS):
+    """Pass an async text/event-stream body through, adding a comment whenever it is silent for ``heartbeat`` seconds"""
+    body = aiter(body)
+    pending = None
+    try:
+        while True:
+            if pending is None:
+                pending = asyncio.ensure_future(anext(body))
+            done, _ = await asyncio.wait({pending}, timeout=heartbeat)
+            if not done:
+                yield b": keepalive\n\n"
+                continue
+            try:
+                chunk = pending.result()
+            except StopAsyncIteration:
+                pending = None
+                return
+            pending = None
+            yield chunk
+    finally:
+        if pending is not None:
+            pending.cancel()
+            # The body can only be closed once the cancelled step has unwound
+            await asyncio.wait({pending})
+        await body.aclose()
+
+
+def is_finished(topic, last_event_id):
+    """Whether a reconnecting viewer (``Last-Event-ID``) has already seen the topic finish"""
+    latest = broker.latest(topic)
+    try:
+        seen = int(last_event_id)
+    except (TypeError, ValueError):
+        return False
+    return latest is not None and latest.type in FINAL_EVENTS and latest.id <= seen
+
+
+def event_stream_response(body):
+    """Wrap an iterator of encoded events in an unbuffered text/event-stream response"""
+    response = StreamingHttpResponse(body, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Stop nginx from holding events back until its buffer fills
+    response['X-Accel-Buffering'] = 'no'
+    return response
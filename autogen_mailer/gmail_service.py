@@ -1,26 +1,51 @@
 import os
 import base64
+import functools
+import json
 import re
+import time
 import logging
 from pathlib import Path
-from email.mime.multipart import MIMEMultipart
-from email.mime.text import MIMEText
-from email.mime.base import MIMEBase
-from email import encoders
 from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
+from googleapiclient import discovery_cache
+from googleapiclient.discovery import build, build_from_document
 from googleapiclient.errors import HttpError
 from django.conf import settings
 from django.db.models import Q
-from .models import Recipient, EmailReply
+from .models import Recipient, EmailReply, ProcessedBounce
+from . import profiling
+from .audiences import recipient_for_reply
+from .bounces import BOUNCE_HEADERS, is_bounce, parse_bounce
+from .metrics import GMAIL_API_CALLS, GMAIL_API_DURATION, REPLY_DISCOVERY_DURATION
+from .mime_utils import DEFAULT_MAX_BODY_BYTES, build_message, extract_body, get_header, strip_quoted_history
+from .reply_classifier import CLASSIFIER_HEADERS, classify_message
+from .suppression import suppress
 
 logger = logging.getLogger(__name__)
-logger.setLevel(logging.INFO)
+
+# Messages per search page; the Gmail API allows up to 500
+SEARCH_PAGE_SIZE = 100
+
+
+@functools.lru_cache(maxsize=None)
+def discovery_document():
+    """The Gmail API discovery document bundled with googleapiclient, read once.
+
+    Kept as the JSON text: building a client mutates a parsed document.
+    """
+    return discovery_cache.get_static_doc('gmail', 'v1')
+
+
+def default_token_path():
+    """Token file of the default mailbox (used when there is no EmailAccount)"""
+    return getattr(settings, 'GOOGLE_OAUTH_TOKEN_PATH',
+                   os.path.join(Path.home(), '.gmail_autogen', 'token.json'))
+
 
 class GmailService:
-    def __init__(self, user_id="me"):
+    def __init__(self, user_id="me", account=None, interactive=True):
         self.SCOPES = [
             'https://mail.google.com/',
             'https://www.googleapis.com/auth/gmail.modify',
@@ -28,9 +53,12 @@ class GmailService:
         ]
         self.CREDENTIALS_PATH = getattr(settings, 'GOOGLE_OAUTH_CREDENTIALS_PATH', 
                                       os.path.join(Path.home(), '.gmail_autogen', 'credentials.json'))
-        self.TOKEN_PATH = getattr(settings, 'GOOGLE_OAUTH_TOKEN_PATH', 
-                                 os.path.join(Path.home(), '.gmail_autogen', 'token.json'))
+        self.TOKEN_PATH = default_token_path()
         self.user_id = user_id
+        # EmailAccount whose stored token is used; None means the token file
+        self.account = account
+        # False: fail instead of opening the browser OAuth flow (e.g. during warmup)
+        self.interactive = interactive
         self.service = self._authenticate()
 
     def _authenticate(self):
@@ -41,21 +69,23 @@ class GmailService:
         Path(self.CREDENTIALS_PATH).parent.mkdir(parents=True, exist_ok=True)
         
         # Load existing credentials if available
-        if os.path.exists(self.TOKEN_PATH):
-            try:
-                creds = Credentials.from_authorized_user_file(self.TOKEN_PATH, self.SCOPES)
-                # Validate credentials
-                if not creds.valid:
-                    if creds.expired and creds.refresh_token:
-                        creds.refresh(Request())
-                    else:
-                        creds = None
-            except Exception as e:
-                logger.error(f"Error loading credentials: {e}")
-                creds = None
+        try:
+            creds = self._load_credentials()
+            # Validate credentials
+            if creds and not creds.valid:
+                if creds.expired and creds.refresh_token:
+                    creds.refresh(Request())
+                    self._save_credentials(creds)
+                else:
+                    creds = None
+        except Exception as e:
+            logger.error("Error loading credentials: %s", e)
+            creds = None
         
         # If no valid credentials, authenticate
         if not creds or not creds.valid:
+            if not self.interactive:
+                raise PermissionError("No valid stored Gmail credentials; sign in interactively first")
             if not os.path.exists(self.CREDENTIALS_PATH):
                 raise FileNotFoundError(
                     f"Google OAuth credentials not found at {self.CREDENTIALS_PATH}. "
@@ -67,48 +97,105 @@ class GmailService:
                     self.CREDENTIALS_PATH, self.SCOPES)
                 creds = flow.run_local_server(port=0)
             except Exception as e:
-                logger.error(f"Authentication failed: {e}")
+                logger.error("Authentication failed: %s", e)
                 raise
             
             # Save the credentials
-            with open(self.TOKEN_PATH, 'w') as token:
-                token.write(creds.to_json())
+            self._save_credentials(creds)
         
-        return build('gmail', 'v1', credentials=creds)
+        document = discovery_document()
+        if document is None:
+            return build('gmail', 'v1', credentials=creds)
+        return build_from_document(document, credentials=creds)
+
+    def _load_credentials(self):
+        if self.account is not None:
+            if not self.account.oauth_token:
+                return None
+            return Credentials.from_authorized_user_info(json.loads(self.account.oauth_token), self.SCOPES)
+        if os.path.exists(self.TOKEN_PATH):
+            return Credentials.from_authorized_user_file(self.TOKEN_PATH, self.SCOPES)
+        return None
 
-    def get_message(self, message_id):
+    def _save_credentials(self, creds):
+        if self.account is not None:
+            self.account.oauth_token = creds.to_json()
+            self.account.save(update_fields=['oauth_token'])
+            return
+        with open(self.TOKEN_PATH, 'w') as token:
+            token.write(creds.to_json())
+
+    def _execute(self, method, request):
+        """Execute a Gmail API request, recording its latency and status"""
+        started = time.monotonic()
+        status = 'ok'
+        try:
+            return request.execute()
+        except HttpError as error:
+            status = str(error.resp.status)
+            raise
+        except Exception:
+            status = 'error'
+            raise
+        finally:
+            elapsed = time.monotonic() - started
+            GMAIL_API_CALLS.labels(method=method, status=status).inc()
+            GMAIL_API_DURATION.labels(method=method).observe(elapsed)
+            profiling.record('http', elapsed)
+
+    def get_message(self, message_id, format='full', metadata_headers=None):
         """Get a message by its ID"""
         try:
-            return self.service.users().messages().get(
+            return self._execute('messages.get', self.service.users().messages().get(
                 userId=self.user_id,
                 id=message_id,
-                format='full'
-            ).execute()
+                format=format,
+                metadataHeaders=metadata_headers
+            ))
         except HttpError as error:
-            logger.error(f'Error getting message: {error}')
+            logger.error('Error getting message: %s', error)
             raise
 
-    def get_thread_messages(self, thread_id):
+    def get_thread_messages(self, thread_id, format='full', metadata_headers=None):
         """Get all messages in a thread"""
         try:
-            thread = self.service.users().threads().get(
+            thread = self._execute('threads.get', self.service.users().threads().get(
                 userId=self.user_id,
                 id=thread_id,
-                format='full'
-            ).execute()
+                format=format,
+                metadataHeaders=metadata_headers
+            ))
             return thread.get('messages', [])
         except HttpError as error:
-            logger.error(f'Error getting thread: {error}')
+            logger.error('Error getting thread: %s', error)
+            raise
+
+    def get_attachment_data(self, message_id, attachment_id):
+        """Get the raw base64url data of a body part stored as an attachment"""
+        try:
+            attachment = self._execute('attachments.get', self.service.users().messages().attachments().get(
+                userId=self.user_id,
+                messageId=message_id,
+                id=attachment_id
+            ))
+            return attachment.get('data', '')
+        except HttpError as error:
+            logger.error('Error getting attachment: %s', error)
             raise
 
     def _extract_message_content(self, message):
-        """Extract text content from a message"""
-        parts = message['payload'].get('parts', [])
-        for part in parts:
-            if part['mimeType'] == 'text/plain':
-                data = part['body']['data']
-                return base64.urlsafe_b64decode(data).decode('utf-8')
-        return ""
+        """Extract the reply text from a message, without quoted history"""
+        max_bytes = getattr(settings, 'REPLY_MAX_BODY_BYTES', DEFAULT_MAX_BODY_BYTES)
+        text = extract_body(
+            message['payload'],
+            fetch_attachment=lambda attachment_id: self.get_attachment_data(message['id'], attachment_id),
+            max_bytes=max_bytes
+        )
+        return strip_quoted_history(text)
+
+    def fetch_message_content(self, message_id):
+        """Download a message body and extract its reply text"""
+        return self._extract_message_content(self.get_message(message_id))
 
     def _extract_email(self, email_header):
         """Extract clean email address from header"""
@@ -125,89 +212,108 @@ class GmailService:
                 email__iexact=sender_email
             )
         except Recipient.DoesNotExist:
-            try:
-                # Try matching just the local part before @
-                local_part = sender_email.split('@')[0]
-                return Recipient.objects.get(
-                    campaign=campaign,
-                    email__icontains=local_part
-                )
-            except Recipient.DoesNotExist:
-                return None
+            # An audience member gets a Recipient row on their first reply
+            recipient = recipient_for_reply(campaign, sender_email)
+            if recipient is not None:
+                return recipient
+            # Same mailbox at another domain (e.g. googlemail.com); only when that is unambiguous
+            local_part = sender_email.split('@')[0]
+            matches = list(Recipient.objects.filter(campaign=campaign, email__istartswith=f"{local_part}@")[:2])
+            return matches[0] if len(matches) == 1 else None
+
+    def _record_bounces(self, campaign, message_id):
+        """Suppress the addresses a bounce reports as permanently failed.
+
+        Every bounce read is remembered as a ProcessedBounce, including
+        transient ones that suppress nobody, so none is downloaded twice.
+        """
+        if ProcessedBounce.objects.filter(message_id=message_id).exists():
+            return 0
+        message = self.get_message(message_id)
+        bounces = [
+            bounce for bounce in parse_bounce(message, lambda attachment_id: self.get_attachment_data(message_id, attachment_id))
+            if bounce.permanent
+        ]
+        for bounce in bounces:
+            suppress(
+                bounce.email, 'bounce', campaign=campaign,
+                detail=f"{bounce.status} {bounce.diagnostic}".strip(),
+                source_message_id=message_id
+            )
+        ProcessedBounce.objects.get_or_create(
+            message_id=message_id, defaults={'campaign': campaign, 'suppressed': len(bounces)}
+        )
+        return len(bounces)
+
+    def _subject_queries(self, original_subject):
+        """Gmail searches for replies to an email sent with this subject"""
+        # Keep apostrophes and common punctuation
+        clean_subject = re.sub(r'[^\w\s\'\-\.!]', '', original_subject).strip()
+        
+        # Extract base subject without reply prefixes
+        base_subject = re.sub(r'^(Re:|RE:|Fwd:|FW:)\s*', '', clean_subject, flags=re.IGNORECASE)
+        base_subject = base_subject.strip()
+        # More flexible search query
+        return [
+            f'subject:"{clean_subject}"',  # Exact match with original punctuation
+            f'subject:"{base_subject}"',   # Base subject without reply markers
+            f'subject:"Re: {base_subject}"',  # Standard reply format
+            f'subject:"RE: {base_subject}"',  # All caps reply
+            f'subject:"Re:{base_subject}"',   # No space after colon
+            f'"Re: {base_subject}" in:inbox',  # Specific inbox search
+            f'"{base_subject}" in:inbox'      # Fallback broad search
+        ]
 
     def process_replies_for_campaign(self, campaign):
         """Check for replies to a specific campaign with improved matching"""
+        started = time.monotonic()
         try:
-            print("entered to reply")
-            subject = campaign.generated_email.subject
-            print("subject")
-            print(subject)
-            clean_subject = re.sub(r'[^a-zA-Z0-9 ]', '', subject)  # Clean special chars
-
-            original_subject = campaign.generated_email.subject
-            print(f"Original subject: '{original_subject}'")
-            
-            # Keep apostrophes and common punctuation
-            clean_subject = re.sub(r'[^\w\s\'\-\.!]', '', original_subject).strip()
-            print(f"Cleaned subject: '{clean_subject}'")
-            
-            # Extract base subject without reply prefixes
-            base_subject = re.sub(r'^(Re:|RE:|Fwd:|FW:)\s*', '', clean_subject, flags=re.IGNORECASE)
-            base_subject = base_subject.strip()
-            print("clean_subject")
-            print(clean_subject)
-            # More flexible search query
-            query = f'(subject:{clean_subject} OR "Re:{clean_subject}") in:inbox from:-me'
-            queries = [
-                f'subject:"{clean_subject}"',  # Exact match with original punctuation
-                f'subject:"{base_subject}"',   # Base subject without reply markers
-                f'subject:"Re: {base_subject}"',  # Standard reply format
-                f'subject:"RE: {base_subject}"',  # All caps reply
-                f'subject:"Re:{base_subject}"',   # No space after colon
-                f'"Re: {base_subject}" in:inbox',  # Specific inbox search
-                f'"{base_subject}" in:inbox'      # Fallback broad search
-            ]
-            print("query")
-            print(query)
+            # Every A/B variant went out under its own subject
+            subjects = [campaign.generated_email.subject]
+            subjects += [subject for subject in campaign.variants.values_list('subject', flat=True) if subject not in subjects]
+            queries = [query for subject in subjects for query in self._subject_queries(subject)]
+            debug_payloads = getattr(settings, 'MAILER_DEBUG_PAYLOADS', False)
             all_messages = []
             for query in queries:
-                print(f"\nTrying query: '{query}'")
                 try:
-                    results = self.service.users().messages().list(
-                        userId='me',  # Using 'me' for authenticated user
-                        q=query,
-                        maxResults=50
-                    ).execute()
-                    
-                    print(f"Found {results.get('resultSizeEstimate', 0)} results")
-                    if results.get('messages'):
-                        all_messages.extend(results['messages'])
-                
+                    # Every page: a campaign can have more replies than one page holds
+                    page_token = None
+                    while True:
+                        results = self._execute('messages.list', self.service.users().messages().list(
+                            userId='me',  # Using 'me' for authenticated user
+                            q=query,
+                            maxResults=SEARCH_PAGE_SIZE,
+                            pageToken=page_token
+                        ))
+
+                        logger.debug("Query %r found %s results", query, results.get('resultSizeEstimate', 0))
+                        if debug_payloads:
+                            logger.debug("Search results for %r: %s", query, results)
+                        if results.get('messages'):
+                            all_messages.extend(results['messages'])
+                        page_token = results.get('nextPageToken')
+                        if not page_token:
+                            break
+
                 except Exception as e:
-                    print(f"Error with query '{query}': {str(e)}")
+                    logger.warning("Error with query %r: %s", query, e)
                     continue
-            print("results")
-            print(results)
             
-            # Deduplicate messages
-            unique_messages = {msg['id']: msg for msg in all_messages}.values()
-            print(f"\nTotal unique replies found: {len(unique_messages)}")
+            # Deduplicate by thread: every hit in a thread leads to the same reply
+            unique_threads = {msg['threadId']: msg for msg in all_messages}.values()
+            logger.debug("Found %s unique reply threads for campaign %s", len(unique_threads), campaign.id)
             
-            # Process the found replies
-            reply_stats = {'total': 0, 'success': 0, 'failed': 0, 'details': []}
-            #messages = results.get('messages', [])
-            #print(messages)
             processed_count = 0
+            bounced_count = 0
             
-            for msg in unique_messages:
-                reply_stats['total'] += 1
+            for msg in unique_threads:
                 try:
-                    print("messages")
-                    message = self.get_message(msg['id'])
-                    print(message)
-                    thread_messages = self.get_thread_messages(message['threadId'])
-                    print(len(thread_messages))
-                    print("len(thread_messages)")
+                    # Headers only; bodies are downloaded for new replies alone
+                    thread_messages = self.get_thread_messages(
+                        msg['threadId'],
+                        format='metadata',
+                        metadata_headers=BOUNCE_HEADERS + CLASSIFIER_HEADERS
+                    )
                     
                     if len(thread_messages) < 2:
                         continue
@@ -215,116 +321,84 @@ class GmailService:
                     original_msg = thread_messages[0]
                     reply_msg = thread_messages[-1]
                     
-                    # Extract sender email more robustly
-                    sender_headers = [h for h in reply_msg['payload']['headers'] if h['name'].lower() == 'from']
-                    print("sender_headers")
-                    print(sender_headers)
-                    if not sender_headers:
+                    sender_header = get_header(reply_msg, 'From')
+                    if not sender_header:
+                        continue
+                    
+                    # Bounces feed the suppression list instead of becoming replies
+                    if is_bounce(reply_msg):
+                        bounced_count += self._record_bounces(campaign, reply_msg['id'])
                         continue
                         
-                    sender_email = self._extract_email(sender_headers[0]['value'])
-                    print("sender_email")
-                    print(sender_email)
+                    sender_email = self._extract_email(sender_header)
                     
                     # Find recipient with flexible matching
                     recipient = self._find_recipient(campaign, sender_email)
-                    print(recipient)
                     if not recipient:
                         continue
                     
                     # Check if already processed
                     if EmailReply.objects.filter(reply_message_id=reply_msg['id']).exists():
-                        print("already")
                         continue
                         
                     # Save the reply
-                    reply_content = self._extract_message_content(reply_msg)
-                    print("reply_content")
-                    print(reply_content)
+                    reply_content = self.fetch_message_content(reply_msg['id'])
+                    if debug_payloads:
+                        logger.debug("Reply %s payload: %s", reply_msg['id'], reply_msg)
+                    logger.debug("Reply %s from %s: %s chars", reply_msg['id'], sender_email, len(reply_content))
+                    classification = classify_message(reply_msg, reply_content, sender_header)
                     EmailReply.objects.create(
                         campaign=campaign,
                         recipient=recipient,
                         original_message_id=original_msg['id'],
                         reply_message_id=reply_msg['id'],
-                        reply_content=reply_content
+                        reply_content=reply_content,
+                        classification=classification.label,
+                        classification_reason=classification.reason
                     )
                     processed_count += 1
                     
                 except Exception as e:
-                    logger.error(f"Error processing message {msg.get('id')}: {str(e)}")
+                    logger.error("Error processing thread %s: %s", msg.get('threadId'), e)
                     continue
             
-            logger.info(f"Processed {processed_count} new replies for campaign {campaign.id}")
+            logger.info(
+                "Processed %s new replies and %s bounces for campaign %s", processed_count, bounced_count, campaign.id,
+                extra={'campaign_id': campaign.id, 'new_replies': processed_count, 'bounces': bounced_count}
+            )
             return processed_count
             
         except Exception as error:
-            logger.error(f'Error processing replies: {error}')
+            logger.error('Error processing replies: %s', error)
             raise
+        finally:
+            REPLY_DISCOVERY_DURATION.labels(campaign=campaign.id).observe(time.monotonic() - started)
 
-    def send_email(self, sender, to, subject, body_text, body_html=None, attachments=None):
+    def send_email(self, sender, to, subject, body_text, body_html=None, attachments=None, headers=None):
         """Send an email with optional attachments"""
-        try:
-            message = MIMEMultipart('mixed')
-            message['to'] = to
-            message['from'] = sender
-            message['subject'] = subject
-            
-            msg_body = MIMEMultipart('alternative')
-            msg_body.attach(MIMEText(body_text, 'plain'))
-            msg_body.attach(MIMEText(body_html or body_text, 'html'))
-            message.attach(msg_body)
-            
-            if attachments:
-                for attachment in attachments:
-                    try:
-                        if hasattr(attachment, 'seek'):
-                            attachment.seek(0)
-                        
-                        file_content = attachment.read()
-                        maintype, subtype = self._get_mime_types(attachment.name)
+        return self.send_message(build_message(sender, to, subject, body_text, body_html, attachments, headers))
 
-                        part = MIMEBase(maintype, subtype)
-                        part.set_payload(file_content)
-                        encoders.encode_base64(part)
-                        part.add_header('Content-Disposition', 'attachment', filename=attachment.name)
-                        message.attach(part)
-                    except Exception as e:
-                        logger.error(f"Failed to process attachment {attachment.name}: {str(e)}")
-                        continue
-            
+    def send_message(self, message):
+        """Send an already built MIME message"""
+        try:
             raw_message = base64.urlsafe_b64encode(message.as_bytes()).decode()
-            result = self.service.users().messages().send(
+            result = self._execute('messages.send', self.service.users().messages().send(
                 userId=self.user_id,
                 body={'raw': raw_message}
-            ).execute()
+            ))
             
-            logger.info(f"Email sent to {to} with message ID: {result['id']}")
+            logger.info("Email sent to %s with message ID: %s", message['to'], result['id'])
             return result
             
         except HttpError as error:
-            logger.error(f'Gmail API error occurred: {error}')
+            logger.error('Gmail API error occurred: %s', error)
             raise
         except Exception as error:
-            logger.error(f'Unexpected error occurred: {error}')
+            logger.error('Unexpected error occurred: %s', error)
             raise
 
-    def _get_mime_types(self, filename):
-        """Determine MIME types for attachments"""
-        filename = filename.lower()
-        if filename.endswith(('.png', '.jpg', '.jpeg')):
-            return 'image', filename.split('.')[-1]
-        elif filename.endswith('.pdf'):
-            return 'application', 'pdf'
-        elif filename.endswith('.docx'):
-            return 'application', 'vnd.openxmlformats-officedocument.wordprocessingml.document'
-        elif filename.endswith('.doc'):
-            return 'application', 'msword'
-        elif filename.endswith(('.xls', '.xlsx')):
-            return 'application', 'vnd.ms-excel'
-        elif filename.endswith('.txt'):
-            return 'text', 'plain'
-        return 'application', 'octet-stream'
-
     def get_hardcoded_user_email(self):
-        """Hardcoded sender email - should be configured in settings"""
+        """Sender address: the account's, or DEFAULT_FROM_EMAIL for the token file mailbox"""
+        if self.account is not None:
+            return self.account.email
         return getattr(settings, 'DEFAULT_FROM_EMAIL', 'your-email@example.com')
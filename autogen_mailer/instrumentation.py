@@ -0,0 +1,82 @@
+import contextvars
+import logging
+from contextlib import contextmanager
+
+from django.conf import settings
+
+from .metrics import LLM_CALL_DURATION, LLM_CALLS, LLM_TOKENS
+
+logger = logging.getLogger(__name__)
+
+_llm_call_tags = contextvars.ContextVar('llm_call_tags', default={})
+
+
+@contextmanager
+def tag_llm_calls(campaign_id=None, call_type='other'):
+    """Attribute every LLM call made inside the block to a campaign and call type"""
+    token = _llm_call_tags.set({'campaign_id': campaign_id, 'call_type': call_type})
+    try:
+        yield
+    finally:
+        _llm_call_tags.reset(token)
+
+
+def current_llm_call_tags():
+    """Tags set by the innermost ``tag_llm_calls`` block"""
+    return _llm_call_tags.get()
+
+
+def record_llm_call(backend, model, elapsed, response=None, error=None, tags=None):
+    """Record timing and token usage of one LLM call.
+
+    ``tags`` default to the current ``tag_llm_calls`` block; streams pass
+    the tags captured when they were opened. Never raises: losing a data
+    point is better than failing the call.
+    """
+    if tags is None:
+        tags = _llm_call_tags.get()
+    call_type = tags.get('call_type', 'other')
+    usage = getattr(response, 'usage', None)
+    prompt_tokens = getattr(usage, 'prompt_tokens', 0) or 0
+    completion_tokens = getattr(usage, 'completion_tokens', 0) or 0
+
+    LLM_CALL_DURATION.labels(call_type=call_type).observe(elapsed)
+    LLM_CALLS.labels(call_type=call_type, outcome='error' if error else 'ok').inc()
+    LLM_TOKENS.labels(call_type=call_type, kind='prompt').inc(prompt_tokens)
+    LLM_TOKENS.labels(call_type=call_type, kind='completion').inc(completion_tokens)
+
+    if not getattr(settings, 'LLM_METRICS_PERSIST', True):
+        return
+    from .models import LLMCallMetric
+    try:
+        LLMCallMetric.objects.create(
+            campaign_id=tags.get('campaign_id'),
+            call_type=call_type,
+            backend=backend,
+            model=model,
+            latency_ms=elapsed * 1000,
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            success=error is None,
+            error=str(error)[:1000] if error else ''
+        )
+    except Exception as e:
+        logger.warning("Could not store LLM call metric: %s", e)
+
+
+def llm_latency_snapshot():
+    """Percentiles (in ms) of LLM latency seen by this process, per call type"""
+    snapshot = {}
+    for (call_type,), histogram in LLM_CALL_DURATION.children():
+        data = histogram.snapshot()
+        snapshot[call_type] = {
+            'count': data['count'],
+            'p50_ms': _to_ms(data['p50']),
+            'p90_ms': _to_ms(data['p90']),
+            'p99_ms': _to_ms(data['p99']),
+        }
+    return snapshot
+
+
+def _to_ms(seconds):
+    return round(seconds * 1000, 1) if seconds is not None else None
@@ -0,0 +1,526 @@
+import asyncio
+import hashlib
+import logging
+import re
+import threading
+import time
+from types import SimpleNamespace
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+from . import profiling
+from .instrumentation import current_llm_call_tags, record_llm_call
+
+logger = logging.getLogger(__name__)
+
+# Chat parameters forwarded from autogen agents to the backend
+AGENT_PARAMS = ('temperature', 'max_tokens', 'n', 'seed', 'stop')
+
+
+class LLMError(Exception):
+    """Raised when the language model cannot produce a completion"""
+
+
+class LLMTimeoutError(LLMError):
+    """Raised when a call does not finish within its deadline"""
+
+
+class OpenAIBackend:
+    """OpenAI chat completions over one pooled, keep-alive HTTP client"""
+    name = 'openai'
+
+    def __init__(self, api_key, base_url=None, max_connections=20, timeout=60, max_retries=0):
+        import httpx
+        from openai import OpenAI
+
+        self.api_key = api_key
+        self.base_url = base_url
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.http_client = httpx.Client(
+            limits=self._limits(),
+            timeout=timeout
+        )
+        # Retries happen inside the client and would run past the call deadline
+        self.client = OpenAI(
+            api_key=api_key,
+            base_url=base_url,
+            http_client=self.http_client,
+            max_retries=max_retries
+        )
+        # Created on first async call, in the event loop that makes it
+        self._async_client = None
+        self._async_loop = None
+
+    def _limits(self):
+        import httpx
+        return httpx.Limits(
+            max_connections=self.max_connections,
+            max_keepalive_connections=self.max_connections
+        )
+
+    def chat(self, messages, model, timeout, **params):
+        return self.client.chat.completions.create(
+            model=model,
+            messages=messages,
+            timeout=timeout,
+            **params
+        )
+
+    async def achat(self, messages, model, timeout, **params):
+        return await self._get_async_client().chat.completions.create(
+            model=model,
+            messages=messages,
+            timeout=timeout,
+            **params
+        )
+
+    def stream_chat(self, messages, model, timeout, **params):
+        return self.client.chat.completions.create(
+            model=model,
+            messages=messages,
+            timeout=timeout,
+            stream=True,
+            # Usage arrives in a last chunk without choices
+            stream_options={'include_usage': True},
+            **params
+        )
+
+    async def astream_chat(self, messages, model, timeout, **params):
+        return await self._get_async_client().chat.completions.create(
+            model=model,
+            messages=messages,
+            timeout=timeout,
+            stream=True,
+            stream_options={'include_usage': True},
+            **params
+        )
+
+    def _get_async_client(self):
+        # Async connection pools are bound to the event loop that created them
+        loop = asyncio.get_running_loop()
+        if self._async_loop is not loop:
+            import httpx
+            from openai import AsyncOpenAI
+
+            self._async_client = AsyncOpenAI(
+                api_key=self.api_key,
+                base_url=self.base_url,
+                http_client=httpx.AsyncClient(limits=self._limits(), timeout=self.timeout),
+                max_retries=self.max_retries
+            )
+            self._async_loop = loop
+        return self._async_client
+
+    def close(self):
+        self.http_client.close()
+
+
+class StubBackend:
+    """Deterministic offline backend for local runs and load tests.
+
+    The same prompt always yields the same completion. ``latency`` seconds
+    are slept per call to stand in for the network round trip.
+    """
+    name = 'stub'
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+
+    def chat(self, messages, model, timeout, n=1, **params):
+        if self.latency > timeout:
+            time.sleep(timeout)
+            raise LLMTimeoutError(f"Stub call exceeded its {timeout:.2f}s deadline")
+        if self.latency:
+            time.sleep(self.latency)
+        return self._response(messages, model, n)
+
+    async def achat(self, messages, model, timeout, n=1, **params):
+        if self.latency > timeout:
+            await asyncio.sleep(timeout)
+            raise LLMTimeoutError(f"Stub call exceeded its {timeout:.2f}s deadline")
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self._response(messages, model, n)
+
+    def stream_chat(self, messages, model, timeout, **params):
+        pieces, usage = self._stream_pieces(messages, model)
+        if self.latency > timeout:
+            time.sleep(timeout)
+            raise LLMTimeoutError(f"Stub call exceeded its {timeout:.2f}s deadline")
+        for piece in pieces:
+            # ``latency`` is spread over the stream like token generation
+            if self.latency:
+                time.sleep(self.latency / len(pieces))
+            yield self._chunk(piece)
+        yield SimpleNamespace(choices=[], usage=usage)
+
+    async def astream_chat(self, messages, model, timeout, **params):
+        pieces, usage = self._stream_pieces(messages, model)
+        if self.latency > timeout:
+            await asyncio.sleep(timeout)
+            raise LLMTimeoutError(f"Stub call exceeded its {timeout:.2f}s deadline")
+        for piece in pieces:
+            if self.latency:
+                await asyncio.sleep(self.latency / len(pieces))
+            yield self._chunk(piece)
+        yield SimpleNamespace(choices=[], usage=usage)
+
+    def _stream_pieces(self, messages, model):
+        response = self._response(messages, model, 1)
+        # Roughly one token per word, like the real stream
+        return re.findall(r'\S+\s*|\s+', response.choices[0].message.content), response.usage
+
+    def _chunk(self, text):
+        return SimpleNamespace(
+            choices=[SimpleNamespace(index=0, delta=SimpleNamespace(content=text), finish_reason=None)],
+            usage=None
+        )
+
+    def _response(self, messages, model, n):
+        prompt = "\n".join(message.get('content') or "" for message in messages)
+        digest = hashlib.sha256(prompt.encode('utf-8')).hexdigest()
+        choices = [
+            SimpleNamespace(
+                index=i,
+                finish_reason='stop',
+                message=SimpleNamespace(
+                    role='assistant',
+                    content=self._content(digest, i),
+                    function_call=None,
+                    tool_calls=None
+                )
+            )
+            for i in range(n)
+        ]
+        prompt_tokens = len(prompt) // 4
+        completion_tokens = sum(len(choice.message.content) // 4 for choice in choices)
+        return SimpleNamespace(
+            id=f"stub-{digest[:12]}",
+            model=model,
+            choices=choices,
+            usage=SimpleNamespace(
+                prompt_tokens=prompt_tokens,
+                completion_tokens=completion_tokens,
+                total_tokens=prompt_tokens + completion_tokens
+            )
+        )
+
+    def _content(self, digest, index):
+        tag = f"{digest[:8]}-{index}"
+        return (
+            f"Subject: Update {tag}\n"
+            "---\n"
+            "Hello,\n\n"
+            f"This is a placeholder message generated offline ({tag}).\n\n"
+            "Reply to this email to learn more.\n\n"
+            "Sowjanya"
+        )
+
+    def close(self):
+        pass
+
+
+class LLMGateway:
+    """Single entry point for chat completions.
+
+    Bounds the number of calls in flight with ``max_concurrency`` and gives
+    every call a deadline: time spent waiting for a free slot counts against
+    the same ``timeout`` as the request itself. Async callers (ASGI views)
+    use ``achat``/``acomplete`` and get their own ``max_concurrency`` slots.
+    """
+
+    def __init__(self, backend, model, timeout=60, max_concurrency=8):
+        self.backend = backend
+        self.model = model
+        self.timeout = timeout
+        self.max_concurrency = max_concurrency
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._async_slots = None
+        self._async_loop = None
+
+    def chat(self, messages, model=None, timeout=None, **params):
+        """Run a chat completion and return the backend response"""
+        timeout = timeout or self.timeout
+        deadline = time.monotonic() + timeout
+        if not self._slots.acquire(timeout=timeout):
+            raise LLMTimeoutError(f"No LLM slot became free within {timeout}s")
+        model = model or self.model
+        started = time.monotonic()
+        response = error = None
+        try:
+            remaining = deadline - started
+            if remaining <= 0:
+                raise LLMTimeoutError(f"Deadline of {timeout}s passed before the call started")
+            response = self.backend.chat(messages, model, remaining, **params)
+            return response
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            self._slots.release()
+            elapsed = time.monotonic() - started
+            record_llm_call(self.backend.name, model, elapsed, response, error)
+            profiling.record('llm', elapsed)
+
+    async def achat(self, messages, model=None, timeout=None, **params):
+        """Async counterpart of ``chat`` that waits without holding a thread"""
+        timeout = timeout or self.timeout
+        deadline = time.monotonic() + timeout
+        slots = self._get_async_slots()
+        try:
+            await asyncio.wait_for(slots.acquire(), timeout)
+        except asyncio.TimeoutError:
+            raise LLMTimeoutError(f"No LLM slot became free within {timeout}s") from None
+        model = model or self.model
+        started = time.monotonic()
+        response = error = None
+        try:
+            remaining = deadline - started
+            if remaining <= 0:
+                raise LLMTimeoutError(f"Deadline of {timeout}s passed before the call started")
+            try:
+                response = await asyncio.wait_for(
+                    self.backend.achat(messages, model, remaining, **params), remaining
+                )
+            except asyncio.TimeoutError:
+                raise LLMTimeoutError(f"LLM call exceeded its {timeout}s deadline") from None
+            return response
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            slots.release()
+            elapsed = time.monotonic() - started
+            await sync_to_async(record_llm_call)(self.backend.name, model, elapsed, response, error)
+            profiling.record('llm', elapsed)
+
+    def stream_chat(self, messages, model=None, timeout=None, **params):
+        """Stream a chat completion, yielding text of the first choice as it arrives.
+
+        The slot is held until the stream is exhausted or closed, and
+        ``timeout`` bounds the whole stream. The call is recorded under the
+        ``tag_llm_calls`` tags current when this is called.
+        """
+        return self._stream(messages, model or self.model, timeout or self.timeout, current_llm_call_tags(), params)
+
+    def _stream(self, messages, model, timeout, tags, params):
+        deadline = time.monotonic() + timeout
+        if not self._slots.acquire(timeout=timeout):
+            raise LLMTimeoutError(f"No LLM slot became free within {timeout}s")
+        started = time.monotonic()
+        stream = usage = error = None
+        try:
+            remaining = deadline - started
+            if remaining <= 0:
+                raise LLMTimeoutError(f"Deadline of {timeout}s passed before the call started")
+            stream = self.backend.stream_chat(messages, model, remaining, **params)
+            for chunk in stream:
+                usage = getattr(chunk, 'usage', None) or usage
+                text = _first_choice_text(chunk)
+                if text:
+                    yield text
+                if time.monotonic() > deadline:
+                    raise LLMTimeoutError(f"LLM stream exceeded its {timeout}s deadline")
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            if stream is not None and hasattr(stream, 'close'):
+                stream.close()
+            self._slots.release()
+            elapsed = time.monotonic() - started
+            record_llm_call(self.backend.name, model, elapsed, SimpleNamespace(usage=usage), error, tags=tags)
+            profiling.record('llm', elapsed)
+
+    def astream_chat(self, messages, model=None, timeout=None, **params):
+        """Async counterpart of ``stream_chat``"""
+        return self._astream(messages, model or self.model, timeout or self.timeout, current_llm_call_tags(), params)
+
+    async def _astream(self, messages, model, timeout, tags, params):
+        deadline = time.monotonic() + timeout
+        slots = self._get_async_slots()
+        try:
+            await asyncio.wait_for(slots.acquire(), timeout)
+        except asyncio.TimeoutError:
+            raise LLMTimeoutError(f"No LLM slot became free within {timeout}s") from None
+        started = time.monotonic()
+        stream = usage = error = None
+        try:
+            remaining = deadline - started
+            if remaining <= 0:
+                raise LLMTimeoutError(f"Deadline of {timeout}s passed before the call started")
+            stream = self.backend.astream_chat(messages, model, remaining, **params)
+            if asyncio.iscoroutine(stream):
+                stream = await stream
+            async for chunk in stream:
+                usage = getattr(chunk, 'usage', None) or usage
+                text = _first_choice_text(chunk)
+                if text:
+                    yield text
+                if time.monotonic() > deadline:
+                    raise LLMTimeoutError(f"LLM stream exceeded its {timeout}s deadline")
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            if stream is not None:
+                close = getattr(stream, 'close', None) or getattr(stream, 'aclose', None)
+                if close is not None:
+                    await close()
+            slots.release()
+            elapsed = time.monotonic() - started
+            await sync_to_async(record_llm_call)(
+                self.backend.name, model, elapsed, SimpleNamespace(usage=usage), error, tags=tags
+            )
+            profiling.record('llm', elapsed)
+
+    def _get_async_slots(self):
+        # asyncio primitives are bound to the loop they are first used on
+        loop = asyncio.get_running_loop()
+        if self._async_loop is not loop:
+            self._async_slots = asyncio.BoundedSemaphore(self.max_concurrency)
+            self._async_loop = loop
+        return self._async_slots
+
+    def complete(self, prompt, system=None, **params):
+        """Send a single user prompt and return the text of the first choice"""
+        response = self.chat(self._messages(prompt, system), **params)
+        return (response.choices[0].message.content or "").strip()
+
+    def complete_choices(self, prompt, system=None, n=1, **params):
+        """Ask for ``n`` independent answers in one request; returns their texts.
+
+        The prompt is sent and billed once. Backends that ignore ``n`` may
+        return fewer choices than asked for.
+        """
+        response = self.chat(self._messages(prompt, system), n=n, **params)
+        choices = sorted(response.choices, key=lambda choice: choice.index)
+        return [(choice.message.content or "").strip() for choice in choices]
+
+    async def acomplete(self, prompt, system=None, **params):
+        """Async counterpart of ``complete``"""
+        response = await self.achat(self._messages(prompt, system), **params)
+        return (response.choices[0].message.content or "").strip()
+
+    def stream_complete(self, prompt, system=None, **params):
+        """Stream the answer to a single user prompt as text deltas"""
+        return self.stream_chat(self._messages(prompt, system), **params)
+
+    def astream_complete(self, prompt, system=None, **params):
+        """Async counterpart of ``stream_complete``"""
+        return self.astream_chat(self._messages(prompt, system), **params)
+
+    def _messages(self, prompt, system=None):
+        messages = [{"role": "user", "content": prompt}]
+        if system:
+            messages.insert(0, {"role": "system", "content": system})
+        return messages
+
+    def autogen_llm_config(self, **options):
+        """``llm_config`` for autogen agents that routes them through this gateway.
+
+        Agents built with it must call
+        ``register_model_client(model_client_cls=GatewayModelClient)``.
+        """
+        return {
+            "config_list": [
+                {"model": self.model, "model_client_cls": GatewayModelClient.__name__}
+            ],
+            **options
+        }
+
+    def close(self):
+        self.backend.close()
+
+
+def _first_choice_text(chunk):
+    for choice in chunk.choices or ():
+        if choice.index == 0 and choice.delta is not None:
+            return choice.delta.content
+    return None
+
+
+class GatewayModelClient:
+    """autogen ``ModelClient`` that sends agent requests through the gateway"""
+
+    def __init__(self, config, **kwargs):
+        self.gateway = get_gateway()
+
+    def create(self, params):
+        options = {key: params[key] for key in AGENT_PARAMS if params.get(key) is not None}
+        return self.gateway.chat(params['messages'], model=params.get('model'), **options)
+
+    def message_retrieval(self, response):
+        return [choice.message.content for choice in response.choices]
+
+    def cost(self, response):
+        return 0.0
+
+    @staticmethod
+    def get_usage(response):
+        usage = getattr(response, 'usage', None)
+        return {
+            "prompt_tokens": getattr(usage, 'prompt_tokens', 0),
+            "completion_tokens": getattr(usage, 'completion_tokens', 0),
+            "total_tokens": getattr(usage, 'total_tokens', 0),
+            "cost": 0.0,
+            "model": response.model,
+        }
+
+
+_gateway = None
+_gateway_lock = threading.Lock()
+
+
+def build_gateway():
+    """Create a gateway from the LLM_* settings"""
+    timeout = getattr(settings, 'LLM_TIMEOUT', 60)
+    backend_name = getattr(settings, 'LLM_BACKEND', 'openai')
+    if backend_name == 'stub':
+        backend = StubBackend(latency=getattr(settings, 'LLM_STUB_LATENCY', 0.0))
+    elif backend_name == 'openai':
+        api_key = getattr(settings, 'OPENAI_API_KEY', None)
+        if not api_key:
+            raise ImproperlyConfigured(
+                "OPENAI_API_KEY is not set. Export it in the environment, or set LLM_BACKEND=stub to run offline."
+            )
+        backend = OpenAIBackend(
+            api_key=api_key,
+            base_url=getattr(settings, 'LLM_BASE_URL', None),
+            max_connections=getattr(settings, 'LLM_MAX_CONNECTIONS', 20),
+            timeout=timeout,
+            max_retries=getattr(settings, 'LLM_MAX_RETRIES', 0)
+        )
+    else:
+        raise ValueError(f"Unknown LLM_BACKEND: {backend_name}")
+
+    logger.info("Using %s LLM backend", backend.name)
+    return LLMGateway(
+        backend,
+        model=getattr(settings, 'LLM_MODEL', 'gpt-3.5-turbo'),
+        timeout=timeout,
+        max_concurrency=getattr(settings, 'LLM_MAX_CONCURRENCY', 8)
+    )
+
+
+def get_gateway():
+    """Return the process-wide gateway, creating it on first use"""
+    global _gateway
+    if _gateway is None:
+        with _gateway_lock:
+            if _gateway is None:
+                _gateway = build_gateway()
+    return _gateway
+
+
+def set_gateway(gateway):
+    """Replace the process-wide gateway, closing the previous one"""
+    global _gateway
+    with _gateway_lock:
+        previous, _gateway = _gateway, gateway
+    if previous is not None and previous is not gateway:
+        previous.close()
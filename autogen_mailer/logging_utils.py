@@ -0,0 +1,76 @@
+import atexit
+import json
+import logging
+import os
+import queue
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+# Attributes every LogRecord has; anything else was passed through ``extra``
+_RECORD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+class JsonFormatter(logging.Formatter):
+    """Render a record as one JSON object per line.
+
+    Fields passed with ``extra={...}`` are added as top-level keys, so call
+    sites can attach campaign ids, counts and timings without building
+    strings.
+    """
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        if record.stack_info:
+            entry['stack_info'] = self.formatStack(record.stack_info)
+        return json.dumps(entry, default=str)
+
+
+class QueueListenerHandler(QueueHandler):
+    """Non-blocking handler that writes to a stream from a background thread.
+
+    The logging call only puts the record on an in-memory queue; message
+    interpolation, JSON serialization and the write to the stream happen in
+    the listener thread. Because interpolation is deferred, arguments should
+    not be mutated right after they are logged.
+    """
+
+    def __init__(self, stream=None):
+        super().__init__(queue.SimpleQueue())
+        self.target = logging.StreamHandler(stream)
+        self.listener = None
+        self.start()
+        atexit.register(self.stop)
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    def start(self):
+        """Start the listener thread; called again in forked children"""
+        self.listener = QueueListener(self.queue, self.target)
+        self.listener.start()
+
+    def _after_fork(self):
+        # Threads do not survive fork (gunicorn --preload): give the child its own queue and listener
+        if self.listener is not None:
+            self.queue = queue.SimpleQueue()
+            self.start()
+
+    def stop(self):
+        if self.listener is not None:
+            self.listener.stop()
+            self.listener = None
+
+    def setFormatter(self, fmt):
+        # Formatting happens in the listener, on the target handler
+        self.target.setFormatter(fmt)
+
+    def prepare(self, record):
+        return record
@@ -0,0 +1,67 @@
+import json
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from ...benchmarks import runner
+
+SUITES = ('import', 'send', 'replies')
+
+
+def _sizes(value):
+    return [int(size) for size in value.split(',') if size.strip()]
+
+
+class Command(BaseCommand):
+    help = "Benchmark recipient import, sending and reply discovery against fake Gmail and LLM backends"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--suite', action='append', choices=SUITES,
+                            help="Suite to run; repeat for several (default: all)")
+        parser.add_argument('--import-sizes', type=_sizes, default=[10000, 100000, 1000000],
+                            help="Comma-separated CSV row counts")
+        parser.add_argument('--send-sizes', type=_sizes, default=[1000, 10000, 50000],
+                            help="Comma-separated recipient counts")
+        parser.add_argument('--mailbox-sizes', type=_sizes, default=[10000],
+                            help="Comma-separated reply thread counts")
+        parser.add_argument('--gmail-latency', type=float, default=0.0,
+                            help="Seconds each fake Gmail API call takes")
+        parser.add_argument('--llm-latency', type=float, default=0.0,
+                            help="Seconds each fake LLM call takes")
+        parser.add_argument('--quota-error-rate', type=float, default=0.0,
+                            help="Probability a fake Gmail call fails with HTTP 429")
+        parser.add_argument('--transport', choices=('gmail', 'file'), default='gmail',
+                            help="Send through the fake Gmail API or the Maildir sink transport")
+        parser.add_argument('--repeat', type=int, default=3,
+                            help="Runs per import size")
+        parser.add_argument('--output', help="Write the JSON report to this file instead of stdout")
+
+    def handle(self, *args, **options):
+        suites = options['suite'] or SUITES
+        # Benchmarks create and delete a lot of rows; keep them out of the real database
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0)
+        try:
+            report = runner.run(
+                suites,
+                import_sizes=options['import_sizes'],
+                send_sizes=options['send_sizes'],
+                mailbox_sizes=options['mailbox_sizes'],
+                repeat=options['repeat'],
+                gmail_latency=options['gmail_latency'],
+                llm_latency=options['llm_latency'],
+                quota_error_rate=options['quota_error_rate'],
+                transport=options['transport'],
+            )
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as report_file:
+                report_file.write(output)
+            self.stdout.write(self.style.SUCCESS(f"Wrote {len(report['results'])} results to {options['output']}"))
+        else:
+            self.stdout.write(output)
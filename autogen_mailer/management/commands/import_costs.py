@@ -0,0 +1,89 @@
+import json
+import os
+import subprocess
+import sys
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from ... import services
+
+# Packages that should only load when a service needs them
+HEAVY_PACKAGES = ('autogen', 'openai', 'googleapiclient', 'google_auth_oauthlib', 'tiktoken')
+
+
+def parse_importtime(output):
+    """``(module, self_us, cumulative_us)`` rows from ``python -X importtime`` output"""
+    rows = []
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'imported package' in line:
+            continue
+        self_us, cumulative_us, module = line[len('import time:'):].split('|')
+        rows.append((module.strip(), int(self_us), int(cumulative_us)))
+    return rows
+
+
+class Command(BaseCommand):
+    help = "Report how long a fresh process spends importing each package during startup"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--module',
+                            help="Module to import after django.setup() (default: ROOT_URLCONF)")
+        parser.add_argument('--with-services', action='store_true',
+                            help="Also load every lazily imported service, to see what they cost")
+        parser.add_argument('--limit', type=int, default=15,
+                            help="Packages and modules to list")
+        parser.add_argument('--json', action='store_true', help="Print the report as JSON")
+
+    def handle(self, *args, **options):
+        module = options['module'] or settings.ROOT_URLCONF
+        script = f"import django; django.setup(); import importlib; importlib.import_module({module!r})"
+        if options['with_services']:
+            script += "; from autogen_mailer import services; services.load()"
+        # Measured in a child process: this one has already imported everything
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', script],
+            capture_output=True, text=True, env=os.environ.copy(), cwd=settings.BASE_DIR
+        )
+        if result.returncode != 0:
+            raise CommandError(f"Importing {module} failed:\n{result.stderr[-2000:]}")
+        rows = parse_importtime(result.stderr)
+
+        packages = defaultdict(lambda: [0, 0])
+        for name, self_us, _ in rows:
+            package = packages[name.split('.')[0]]
+            package[0] += self_us
+            package[1] += 1
+        total_us = sum(self_us for _, self_us, _ in rows)
+        loaded = {name.split('.')[0] for name, _, _ in rows}
+        report = {
+            'module': module,
+            'with_services': options['with_services'],
+            'total_ms': round(total_us / 1000, 1),
+            'modules': len(rows),
+            'packages': [
+                {'package': package, 'ms': round(self_us / 1000, 1), 'modules': count}
+                for package, (self_us, count) in sorted(packages.items(), key=lambda item: -item[1][0])
+            ][:options['limit']],
+            'slowest_modules': [
+                {'module': name, 'self_ms': round(self_us / 1000, 1), 'cumulative_ms': round(cumulative_us / 1000, 1)}
+                for name, self_us, cumulative_us in sorted(rows, key=lambda row: -row[1])[:options['limit']]
+            ],
+            'heavy_packages_loaded': [package for package in HEAVY_PACKAGES if package in loaded],
+            'lazy_services': sorted(services.SERVICES),
+        }
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+        self.stdout.write(f"Importing {module}{' and all services' if options['with_services'] else ''}: "
+                          f"{report['total_ms']} ms over {report['modules']} modules")
+        self.stdout.write(f"\n{'package':<32}{'ms':>10}{'modules':>10}")
+        for row in report['packages']:
+            self.stdout.write(f"{row['package']:<32}{row['ms']:>10}{row['modules']:>10}")
+        self.stdout.write(f"\n{'module':<56}{'self ms':>10}{'cum ms':>10}")
+        for row in report['slowest_modules']:
+            self.stdout.write(f"{row['module']:<56}{row['self_ms']:>10}{row['cumulative_ms']:>10}")
+        heavy = ', '.join(report['heavy_packages_loaded']) or 'none'
+        self.stdout.write(f"\nHeavy packages loaded: {heavy}")
@@ -0,0 +1,293 @@
+import bisect
+import math
+import threading
+
+# Latency buckets in seconds, from 5ms up to the 2 minute LLM timeout
+DEFAULT_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+    1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0,
+)
+
+
+class Histogram:
+    """Thread-safe fixed-bucket histogram.
+
+    Memory is constant no matter how many values are observed; percentiles
+    are estimated by linear interpolation inside the bucket they fall in.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        # One extra slot for values above the last bound
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+            self._count += 1
+
+    def percentile(self, q):
+        """Estimate the ``q`` quantile (0 < q <= 1), or None if empty"""
+        with self._lock:
+            counts = list(self._counts)
+            total = self._count
+        if not total:
+            return None
+
+        rank = q * total
+        seen = 0
+        for index, count in enumerate(counts):
+            if seen + count >= rank and count:
+                lower = self.buckets[index - 1] if index else 0.0
+                if index == len(self.buckets):
+                    # Above the last bound there is nothing to interpolate to
+                    return lower
+                upper = self.buckets[index]
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+        return self.buckets[-1]
+
+    def cumulative(self):
+        """Return (cumulative bucket counts, sum, count) in one consistent read"""
+        with self._lock:
+            counts = list(self._counts)
+            total, count = self._sum, self._count
+        running = 0
+        cumulative = []
+        for value in counts:
+            running += value
+            cumulative.append(running)
+        return cumulative, total, count
+
+    def snapshot(self):
+        with self._lock:
+            count, total = self._count, self._sum
+        return {
+            'count': count,
+            'sum': total,
+            'p50': self.percentile(0.5),
+            'p90': self.percentile(0.9),
+            'p99': self.percentile(0.99),
+        }
+
+
+# Label value that absorbs every label set past a family's max_series
+OVERFLOW_LABEL = 'other'
+
+
+class _CounterValue:
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+
+class _GaugeValue(_CounterValue):
+    def set(self, value):
+        with self._lock:
+            self.value = value
+
+    def dec(self, amount=1):
+        self.inc(-amount)
+
+
+class MetricFamily:
+    """A named metric with a fixed set of label names.
+
+    Each distinct set of label values gets its own child. Once
+    ``max_series`` children exist, further label sets are folded into a
+    single child whose labels are all OVERFLOW_LABEL, so a label fed from
+    user data (a campaign id, say) can never grow the registry unbounded.
+    """
+    type = None
+
+    def __init__(self, name, documentation, labelnames=(), max_series=100):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.max_series = max_series
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        child = self._children.get(key)
+        if child is not None:
+            return child
+        with self._lock:
+            if key not in self._children and len(self._children) >= self.max_series:
+                key = (OVERFLOW_LABEL,) * len(self.labelnames)
+            child = self._children.get(key)
+            if child is None:
+                child = self._children[key] = self._new_child()
+        return child
+
+    def children(self):
+        with self._lock:
+            return list(self._children.items())
+
+    # Shortcuts for families without labels
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+    def _label_text(self, key, extra=()):
+        pairs = list(zip(self.labelnames, key)) + list(extra)
+        if not pairs:
+            return ''
+        return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+    def render(self):
+        lines = [
+            f'# HELP {self.name} {self.documentation}',
+            f'# TYPE {self.name} {self.type}',
+        ]
+        for key, child in self.children():
+            lines.extend(self._render_child(key, child))
+        return lines
+
+    def _render_child(self, key, child):
+        return [f'{self.name}{self._label_text(key)} {_format_value(child.value)}']
+
+
+class Counter(MetricFamily):
+    type = 'counter'
+
+    def _new_child(self):
+        return _CounterValue()
+
+
+class Gauge(MetricFamily):
+    type = 'gauge'
+
+    def _new_child(self):
+        return _GaugeValue()
+
+    def set(self, value):
+        self.labels().set(value)
+
+    def dec(self, amount=1):
+        self.labels().dec(amount)
+
+
+class HistogramFamily(MetricFamily):
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), max_series=100, buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames, max_series)
+        self.buckets = buckets
+
+    def _new_child(self):
+        return Histogram(self.buckets)
+
+    def _render_child(self, key, child):
+        cumulative, total, count = child.cumulative()
+        bounds = [_format_value(bound) for bound in child.buckets] + ['+Inf']
+        lines = [
+            f'{self.name}_bucket{self._label_text(key, [("le", bound)])} {value}'
+            for bound, value in zip(bounds, cumulative)
+        ]
+        lines.append(f'{self.name}_sum{self._label_text(key)} {_format_value(total)}')
+        lines.append(f'{self.name}_count{self._label_text(key)} {count}')
+        return lines
+
+
+class Registry:
+    """Collects metric families and renders the text exposition format.
+
+    Values are per process; with several gunicorn workers each one serves
+    its own numbers, so scrape every worker or aggregate downstream.
+    """
+
+    def __init__(self):
+        self._families = {}
+        self._lock = threading.Lock()
+
+    def register(self, family):
+        with self._lock:
+            if family.name in self._families:
+                raise ValueError(f"Metric {family.name} is already registered")
+            self._families[family.name] = family
+        return family
+
+    def render(self):
+        with self._lock:
+            families = list(self._families.values())
+        lines = []
+        for family in families:
+            lines.extend(family.render())
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_value(value):
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+REGISTRY = Registry()
+
+GMAIL_API_CALLS = REGISTRY.register(Counter(
+    'gmail_api_calls_total', 'Gmail API requests by method and HTTP status.',
+    ('method', 'status')
+))
+GMAIL_API_DURATION = REGISTRY.register(HistogramFamily(
+    'gmail_api_call_duration_seconds', 'Gmail API request latency.',
+    ('method',)
+))
+EMAILS_SENT = REGISTRY.register(Counter(
+    'emails_sent_total', 'Campaign emails handed to the transport, by result.',
+    ('result',)
+))
+SEND_QUEUE_DEPTH = REGISTRY.register(Gauge(
+    'send_queue_depth', 'Recipients waiting in send loops running in this process.'
+))
+SENDS_THROTTLED = REGISTRY.register(Counter(
+    'sends_throttled_total', 'Sends refused as rate limited and requeued behind a domain or account backoff.',
+    ('scope',)
+))
+REPLY_DISCOVERY_DURATION = REGISTRY.register(HistogramFamily(
+    'reply_discovery_duration_seconds', 'Time spent finding new replies in the mailbox, per campaign.',
+    ('campaign',), max_series=50
+))
+LLM_CALLS = REGISTRY.register(Counter(
+    'llm_calls_total', 'LLM calls by call type and outcome.',
+    ('call_type', 'outcome')
+))
+LLM_CALL_DURATION = REGISTRY.register(HistogramFamily(
+    'llm_call_duration_seconds', 'LLM call latency by call type.',
+    ('call_type',)
+))
+LLM_TOKENS = REGISTRY.register(Counter(
+    'llm_tokens_total', 'Tokens used by LLM calls.',
+    ('call_type', 'kind')
+))
+REPLIES_CLASSIFIED = REGISTRY.register(Counter(
+    'replies_classified_total', 'Replies by classification; only human replies reach the LLM.',
+    ('classification',)
+))
+REPLIES_ESCALATED = REGISTRY.register(Counter(
+    'replies_escalated_total', 'Replies left for a person because a reply budget was used up.',
+    ('reason',)
+))
+HTTP_REQUEST_DURATION = REGISTRY.register(HistogramFamily(
+    'http_request_duration_seconds', 'API request latency by view, method and status.',
+    ('view', 'method', 'status'), max_series=300
+))
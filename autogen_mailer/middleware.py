@@ -0,0 +1,118 @@
+import cProfile
+import random
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+from . import profiling
+from .metrics import HTTP_REQUEST_DURATION
+
+
+class MetricsMiddleware:
+    """Record the latency of every request, labelled by the view that served it"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        started = time.monotonic()
+        response = self.get_response(request)
+        self._observe(request, response, started)
+        return response
+
+    async def __acall__(self, request):
+        started = time.monotonic()
+        response = await self.get_response(request)
+        self._observe(request, response, started)
+        return response
+
+    def _observe(self, request, response, started):
+        # Route names rather than paths keep the label set small and fixed
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match else 'unmatched'
+        HTTP_REQUEST_DURATION.labels(
+            view=view,
+            method=request.method,
+            status=response.status_code
+        ).observe(time.monotonic() - started)
+
+
+class ProfilingMiddleware:
+    """Opt-in per-request breakdown of time spent in the DB, HTTP and LLM calls.
+
+    A request is profiled when it carries an ``X-Profile`` header (allowed
+    by PROFILING_ALLOW_HEADER) or is picked by PROFILING_SAMPLE_RATE. The
+    breakdown is returned in a ``Server-Timing`` header and, when
+    PROFILING_DUMP_DIR is set, written there as JSON. ``X-Profile: cprofile``
+    (or PROFILING_CPROFILE) also captures a cProfile ``.prof`` dump.
+    Queries are timed by the wrapper ``profiling.install_query_timer`` puts
+    on every database connection.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def _mode(self, request):
+        header = request.headers.get('X-Profile')
+        if header and getattr(settings, 'PROFILING_ALLOW_HEADER', False):
+            return header.lower()
+        rate = getattr(settings, 'PROFILING_SAMPLE_RATE', 0.0)
+        if rate and random.random() < rate:
+            return 'sampled'
+        return None
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        mode = self._mode(request)
+        if mode is None:
+            return self.get_response(request)
+
+        use_cprofile = mode == 'cprofile' or getattr(settings, 'PROFILING_CPROFILE', False)
+        profiler = cProfile.Profile() if use_cprofile else None
+        profile, token = profiling.start_profile(request.path, request.method)
+        try:
+            if profiler:
+                profiler.enable()
+            try:
+                response = self.get_response(request)
+            finally:
+                if profiler:
+                    profiler.disable()
+        finally:
+            profiling.end_profile(token)
+        return self._finish(response, profile, profiler)
+
+    async def __acall__(self, request):
+        mode = self._mode(request)
+        if mode is None:
+            return await self.get_response(request)
+
+        # cProfile only sees the event loop thread, so it is not used here
+        profile, token = profiling.start_profile(request.path, request.method)
+        try:
+            response = await self.get_response(request)
+        finally:
+            profiling.end_profile(token)
+        return self._finish(response, profile)
+
+    def _finish(self, response, profile, profiler=None):
+        response['Server-Timing'] = profile.server_timing()
+        response['X-Profile-Id'] = profile.id
+        dump_dir = getattr(settings, 'PROFILING_DUMP_DIR', None)
+        if dump_dir:
+            profiling.dump_profile(dump_dir, profile, response.status_code, profiler)
+        return response
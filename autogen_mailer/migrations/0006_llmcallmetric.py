@@ -0,0 +1,33 @@
+# Generated by Django 5.2 on 2026-10-19 19:21
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('autogen_mailer', '0005_emailreply'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LLMCallMetric',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('call_type', models.CharField(choices=[('generate', 'Generate'), ('reply', 'Reply'), ('other', 'Other')], default='other', max_length=20)),
+                ('backend', models.CharField(max_length=20)),
+                ('model', models.CharField(max_length=100)),
+                ('latency_ms', models.FloatField()),
+                ('prompt_tokens', models.IntegerField(default=0)),
+                ('completion_tokens', models.IntegerField(default=0)),
+                ('success', models.BooleanField(default=True)),
+                ('error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('campaign', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='llm_calls', to='autogen_mailer.emailcampaign')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['call_type', 'created_at'], name='autogen_mai_call_ty_057309_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.2 on 2026-10-19 19:32
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('autogen_mailer', '0006_llmcallmetric'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipient',
+            name='message_id',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='recipient',
+            name='thread_id',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.CreateModel(
+            name='EmailAccount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('email', models.EmailField(max_length=254, unique=True)),
+                ('display_name', models.CharField(blank=True, max_length=255)),
+                ('smtp_server', models.CharField(default='smtp.gmail.com', max_length=255)),
+                ('smtp_port', models.IntegerField(default=587)),
+                ('imap_server', models.CharField(blank=True, max_length=255)),
+                ('imap_port', models.IntegerField(blank=True, default=993)),
+                ('protocol', models.CharField(choices=[('imap', 'IMAP'), ('pop3', 'POP3')], default='imap', max_length=4)),
+                ('use_ssl', models.BooleanField(default=True)),
+                ('use_oauth', models.BooleanField(default=True)),
+                ('oauth_token', models.TextField(blank=True, null=True)),
+                ('daily_quota', models.PositiveIntegerField(default=500)),
+                ('max_per_second', models.FloatField(default=2.0)),
+                ('is_active', models.BooleanField(default=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('last_sync', models.DateTimeField(blank=True, null=True)),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='recipient',
+            name='account',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='recipients', to='autogen_mailer.emailaccount'),
+        ),
+    ]
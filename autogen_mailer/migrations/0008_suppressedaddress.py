@@ -0,0 +1,26 @@
+# Generated by Django 5.2 on 2026-10-19 19:42
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('autogen_mailer', '0007_emailaccount_recipient_account'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SuppressedAddress',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('email', models.EmailField(max_length=254, unique=True)),
+                ('reason', models.CharField(choices=[('bounce', 'Hard bounce'), ('unsubscribe', 'Unsubscribed'), ('complaint', 'Complaint'), ('manual', 'Added manually')], default='manual', max_length=20)),
+                ('detail', models.TextField(blank=True)),
+                ('source_message_id', models.CharField(blank=True, db_index=True, max_length=255)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('campaign', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='suppressions', to='autogen_mailer.emailcampaign')),
+            ],
+        ),
+    ]
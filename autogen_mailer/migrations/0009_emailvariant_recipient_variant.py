@@ -0,0 +1,35 @@
+# Generated by Django 5.2 on 2026-10-19 19:46
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('autogen_mailer', '0008_suppressedaddress'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EmailVariant',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('index', models.PositiveSmallIntegerField()),
+                ('subject', models.TextField()),
+                ('body_text', models.TextField()),
+                ('body_html', models.TextField()),
+                ('generated_at', models.DateTimeField(auto_now_add=True)),
+                ('campaign', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='variants', to='autogen_mailer.emailcampaign')),
+            ],
+            options={
+                'ordering': ['index'],
+                'unique_together': {('campaign', 'index')},
+            },
+        ),
+        migrations.AddField(
+            model_name='recipient',
+            name='variant',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='recipients', to='autogen_mailer.emailvariant'),
+        ),
+    ]
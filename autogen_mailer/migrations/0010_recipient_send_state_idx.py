@@ -0,0 +1,17 @@
+# Generated by Django 5.2 on 2026-10-19 19:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('autogen_mailer', '0009_emailvariant_recipient_variant'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='recipient',
+            index=models.Index(fields=['campaign', 'is_sent', 'id'], name='recipient_send_state_idx'),
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.2 on 2026-10-19 20:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('autogen_mailer', '0010_recipient_send_state_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Audience',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='emailcampaign',
+            name='audience',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='campaigns', to='autogen_mailer.audience'),
+        ),
+        migrations.CreateModel(
+            name='AudienceMember',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('email', models.EmailField(max_length=254)),
+                ('name', models.CharField(blank=True, max_length=255)),
+                ('audience', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='members', to='autogen_mailer.audience')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='recipient',
+            name='member',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='deliveries', to='autogen_mailer.audiencemember'),
+        ),
+        migrations.AddIndex(
+            model_name='recipient',
+            index=models.Index(fields=['campaign', 'member'], name='recipient_member_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='audiencemember',
+            index=models.Index(fields=['audience', 'id'], name='audience_member_page_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='audiencemember',
+            unique_together={('audience', 'email')},
+        ),
+    ]
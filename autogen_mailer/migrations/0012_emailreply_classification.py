@@ -0,0 +1,23 @@
+# Generated by Django 5.2 on 2026-10-19 20:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('autogen_mailer', '0011_audiences'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='emailreply',
+            name='classification',
+            field=models.CharField(blank=True, choices=[('human', 'Written by a person'), ('auto_reply', 'Automatic reply'), ('bounce', 'Delivery failure'), ('unsubscribe', 'Unsubscribe request')], max_length=20),
+        ),
+        migrations.AddField(
+            model_name='emailreply',
+            name='classification_reason',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2 on 2026-10-19 20:08
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def backfill_replied_at(apps, schema_editor):
+    # Replies answered before replied_at existed count from when they arrived
+    EmailReply = apps.get_model('autogen_mailer', 'EmailReply')
+    EmailReply.objects.filter(reply_sent=True, replied_at__isnull=True).update(replied_at=F('received_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('autogen_mailer', '0012_emailreply_classification'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='emailreply',
+            name='escalated',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='emailreply',
+            name='escalation_reason',
+            field=models.CharField(blank=True, max_length=20),
+        ),
+        migrations.AddField(
+            model_name='emailreply',
+            name='replied_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='emailreply',
+            index=models.Index(fields=['campaign', 'replied_at'], name='reply_budget_idx'),
+        ),
+        migrations.RunPython(backfill_replied_at, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-19 20:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('autogen_mailer', '0013_emailreply_budget'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='emailreply',
+            name='classification',
+            field=models.CharField(blank=True, choices=[('human', 'Written by a person'), ('auto_reply', 'Automatic reply'), ('bounce', 'Delivery failure'), ('unsubscribe', 'Unsubscribe request'), ('review', 'Needs a person')], max_length=20),
+        ),
+    ]
@@ -0,0 +1,75 @@
+# Generated by Django 5.2 on 2026-10-19 20:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import F
+from django.db.models.functions import Lower, Trim
+
+
+def normalize_members(apps, schema_editor):
+    # Lowercase member addresses. A member whose lowercased address is already
+    # in its audience is a duplicate: its rows move to that member and it goes
+    AudienceMember = apps.get_model('autogen_mailer', 'AudienceMember')
+    Recipient = apps.get_model('autogen_mailer', 'Recipient')
+    mixed_case = AudienceMember.objects.annotate(normalized=Lower(Trim('email'))).exclude(email=F('normalized'))
+    for member in list(mixed_case.order_by('id')):
+        existing = AudienceMember.objects.filter(audience_id=member.audience_id, email=member.normalized).first()
+        if existing is None:
+            AudienceMember.objects.filter(id=member.id).update(email=member.normalized)
+        else:
+            Recipient.objects.filter(member_id=member.id).update(member_id=existing.id)
+            AudienceMember.objects.filter(id=member.id).delete()
+
+
+def move_member_recipients(apps, schema_editor):
+    # Delivery state of audience members moves to AudienceDelivery; the full
+    # Recipient copies are dropped unless a reply points at them
+    AudienceDelivery = apps.get_model('autogen_mailer', 'AudienceDelivery')
+    Recipient = apps.get_model('autogen_mailer', 'Recipient')
+    member_rows = Recipient.objects.filter(member__isnull=False)
+    batch = []
+    for recipient in member_rows.filter(is_sent=True).iterator():
+        batch.append(AudienceDelivery(
+            campaign_id=recipient.campaign_id, member_id=recipient.member_id, state='sent',
+            sent_at=recipient.sent_at, account_id=recipient.account_id, variant_id=recipient.variant_id,
+            message_id=recipient.message_id, thread_id=recipient.thread_id
+        ))
+        if len(batch) >= 1000:
+            AudienceDelivery.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    AudienceDelivery.objects.bulk_create(batch, ignore_conflicts=True)
+    member_rows.filter(replies__isnull=True).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('autogen_mailer', '0014_emailreply_review_classification'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='recipient',
+            name='member',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='recipients', to='autogen_mailer.audiencemember'),
+        ),
+        migrations.CreateModel(
+            name='AudienceDelivery',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('state', models.CharField(choices=[('sent', 'Sent'), ('failed', 'Failed')], default='sent', max_length=10)),
+                ('sent_at', models.DateTimeField(blank=True, null=True)),
+                ('message_id', models.CharField(blank=True, max_length=255)),
+                ('thread_id', models.CharField(blank=True, max_length=255)),
+                ('account', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='audience_deliveries', to='autogen_mailer.emailaccount')),
+                ('campaign', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='audience_deliveries', to='autogen_mailer.emailcampaign')),
+                ('member', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='deliveries', to='autogen_mailer.audiencemember')),
+                ('variant', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='audience_deliveries', to='autogen_mailer.emailvariant')),
+            ],
+            options={
+                'unique_together': {('campaign', 'member')},
+            },
+        ),
+        migrations.RunPython(normalize_members, migrations.RunPython.noop),
+        migrations.RunPython(move_member_recipients, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2 on 2026-10-19 20:28
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def record_suppressing_bounces(apps, schema_editor):
+    # Bounces that suppressed someone were remembered through their SuppressedAddress rows
+    ProcessedBounce = apps.get_model('autogen_mailer', 'ProcessedBounce')
+    SuppressedAddress = apps.get_model('autogen_mailer', 'SuppressedAddress')
+    rows = (
+        SuppressedAddress.objects.filter(reason='bounce').exclude(source_message_id='')
+        .values('source_message_id').annotate(suppressed=Count('id')).order_by()
+    )
+    ProcessedBounce.objects.bulk_create(
+        (ProcessedBounce(message_id=row['source_message_id'], suppressed=row['suppressed']) for row in rows.iterator()),
+        batch_size=1000, ignore_conflicts=True
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('autogen_mailer', '0015_audience_deliveries'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProcessedBounce',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('message_id', models.CharField(max_length=255, unique=True)),
+                ('suppressed', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('campaign', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='bounces', to='autogen_mailer.emailcampaign')),
+            ],
+        ),
+        migrations.RunPython(record_suppressing_bounces, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,169 @@
+import base64
+import html
+import logging
+import re
+from email import encoders
+from email.mime.base import MIMEBase
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+logger = logging.getLogger(__name__)
+
+# Upper bound on the decoded size of a reply body we keep around.
+DEFAULT_MAX_BODY_BYTES = 64 * 1024
+
+_TAG_RE = re.compile(r'<[^>]+>')
+_BLOCK_TAG_RE = re.compile(r'<\s*(br|/p|/div|/tr|/li|/h\d)\b[^>]*>', re.IGNORECASE)
+_SCRIPT_STYLE_RE = re.compile(r'<(script|style|head)\b.*?</\1\s*>', re.IGNORECASE | re.DOTALL)
+_BLANK_LINES_RE = re.compile(r'\n\s*\n+')
+
+# "On Mon, 7 Apr 2025 at 10:00, Jane <jane@example.com> wrote:" -- Gmail and
+# most clients wrap this onto two lines, so it is matched across a newline.
+_WROTE_RE = re.compile(r'^\s*On\s.{0,300}?\bwrote:\s*$', re.IGNORECASE | re.MULTILINE | re.DOTALL)
+_ORIGINAL_MESSAGE_RE = re.compile(
+    r'^\s*(-{2,}\s*Original Message\s*-{2,}|_{10,}|From:\s.+\n\s*Sent:\s)',
+    re.IGNORECASE | re.MULTILINE
+)
+
+
+def iter_leaf_parts(payload):
+    """Yield the leaf parts of a Gmail payload in document order.
+
+    Walks nested multiparts with an explicit stack rather than recursion so
+    that pathological nesting cannot blow the interpreter stack.
+    """
+    stack = [payload]
+    while stack:
+        part = stack.pop()
+        children = part.get('parts')
+        if children:
+            # Reverse so the first child is popped first
+            stack.extend(reversed(children))
+        else:
+            yield part
+
+
+def decode_body_data(data, max_bytes=DEFAULT_MAX_BODY_BYTES):
+    """Decode base64url body data, decoding at most ``max_bytes`` of it"""
+    if not data:
+        return ""
+    if max_bytes:
+        # 4 base64 characters encode 3 bytes; only decode what we will keep
+        data = data[:((max_bytes + 2) // 3) * 4]
+    data += '=' * (-len(data) % 4)
+    return base64.urlsafe_b64decode(data).decode('utf-8', errors='ignore')
+
+
+def html_to_text(content):
+    """Reduce an HTML body to readable plain text"""
+    content = _SCRIPT_STYLE_RE.sub('', content)
+    content = _BLOCK_TAG_RE.sub('\n', content)
+    content = html.unescape(_TAG_RE.sub('', content))
+    return _BLANK_LINES_RE.sub('\n\n', content).strip()
+
+
+def extract_body(payload, fetch_attachment=None, max_bytes=DEFAULT_MAX_BODY_BYTES):
+    """Return the readable text body of a Gmail message payload.
+
+    ``text/plain`` is preferred; the first ``text/html`` part is only decoded
+    when no plain part exists. Bodies stored behind an ``attachmentId`` are
+    fetched through ``fetch_attachment(attachment_id)`` only when they are the
+    part we actually need. Named attachments are ignored.
+    """
+    html_part = None
+    for part in iter_leaf_parts(payload):
+        if part.get('filename'):
+            continue
+        mime_type = part.get('mimeType', '')
+        if mime_type == 'text/plain':
+            return _part_text(part, fetch_attachment, max_bytes)
+        if mime_type == 'text/html' and html_part is None:
+            html_part = part
+
+    if html_part is not None:
+        return html_to_text(_part_text(html_part, fetch_attachment, max_bytes))
+    return ""
+
+
+def _part_text(part, fetch_attachment, max_bytes):
+    body = part.get('body', {})
+    data = body.get('data')
+    if not data and body.get('attachmentId') and fetch_attachment:
+        data = fetch_attachment(body['attachmentId'])
+    return decode_body_data(data, max_bytes)
+
+
+def strip_quoted_history(text):
+    """Drop the quoted original message a reply carries along"""
+    cut = len(text)
+    for pattern in (_WROTE_RE, _ORIGINAL_MESSAGE_RE):
+        match = pattern.search(text)
+        if match:
+            cut = min(cut, match.start())
+    lines = [line for line in text[:cut].splitlines() if not line.lstrip().startswith('>')]
+    return '\n'.join(lines).strip()
+
+
+def get_header(message, name):
+    """Return the first header value called ``name`` from a Gmail message"""
+    name = name.lower()
+    for header in message.get('payload', {}).get('headers', []):
+        if header['name'].lower() == name:
+            return header['value']
+    return None
+
+
+def build_message(sender, to, subject, body_text, body_html=None, attachments=None, headers=None):
+    """Build an outgoing message: text and HTML alternatives plus attachments.
+
+    Attachments are file-like objects with a ``name``; one that cannot be
+    read is logged and left out rather than failing the whole message.
+    ``headers`` are extra header fields, e.g. List-Unsubscribe.
+    """
+    message = MIMEMultipart('mixed')
+    message['to'] = to
+    message['from'] = sender
+    message['subject'] = subject
+    for name, value in (headers or {}).items():
+        message[name] = value
+
+    msg_body = MIMEMultipart('alternative')
+    msg_body.attach(MIMEText(body_text, 'plain'))
+    msg_body.attach(MIMEText(body_html or body_text, 'html'))
+    message.attach(msg_body)
+
+    for attachment in attachments or ():
+        try:
+            if hasattr(attachment, 'seek'):
+                attachment.seek(0)
+
+            file_content = attachment.read()
+            maintype, subtype = attachment_mime_type(attachment.name)
+
+            part = MIMEBase(maintype, subtype)
+            part.set_payload(file_content)
+            encoders.encode_base64(part)
+            part.add_header('Content-Disposition', 'attachment', filename=attachment.name)
+            message.attach(part)
+        except Exception as e:
+            logger.error("Failed to process attachment %s: %s", attachment.name, e)
+            continue
+    return message
+
+
+def attachment_mime_type(filename):
+    """Determine MIME types for attachments"""
+    filename = filename.lower()
+    if filename.endswith(('.png', '.jpg', '.jpeg')):
+        return 'image', filename.split('.')[-1]
+    elif filename.endswith('.pdf'):
+        return 'application', 'pdf'
+    elif filename.endswith('.docx'):
+        return 'application', 'vnd.openxmlformats-officedocument.wordprocessingml.document'
+    elif filename.endswith('.doc'):
+        return 'application', 'msword'
+    elif filename.endswith(('.xls', '.xlsx')):
+        return 'application', 'vnd.ms-excel'
+    elif filename.endswith('.txt'):
+        return 'text', 'plain'
+    return 'application', 'octet-stream'
@@ -1,6 +1,27 @@
 from django.db import models
 from django.contrib.auth.models import User
 
+class Audience(models.Model):
+    """A reusable recipient list; campaigns reference it instead of copying it"""
+    name = models.CharField(max_length=255)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.name
+
+class AudienceMember(models.Model):
+    audience = models.ForeignKey(Audience, related_name='members', on_delete=models.CASCADE)
+    # Stored lowercased, so an address is only listed (and mailed) once
+    email = models.EmailField()
+    name = models.CharField(max_length=255, blank=True)
+
+    class Meta:
+        unique_together = ('audience', 'email')
+        indexes = [
+            # Keyset paging over an audience while sending
+            models.Index(fields=['audience', 'id'], name='audience_member_page_idx'),
+        ]
+
 class EmailCampaign(models.Model):
     TONE_CHOICES = [
         ('professional', 'Professional'),
@@ -13,20 +34,100 @@ class EmailCampaign(models.Model):
     topic = models.TextField()
     details = models.TextField()
     tone = models.CharField(max_length=100, choices=TONE_CHOICES, default='professional')
+    # Sent to the members of this list on top of the campaign's own recipients
+    audience = models.ForeignKey(Audience, null=True, blank=True, on_delete=models.PROTECT, related_name='campaigns')
     created_at = models.DateTimeField(auto_now_add=True)
     
     def __str__(self):
         return self.name
 
+class EmailAccount(models.Model):
+    """A mailbox campaigns can be sent from, with its own credentials and quota"""
+    PROTOCOL_CHOICES = [
+        ('imap', 'IMAP'),
+        ('pop3', 'POP3'),
+    ]
+
+    user = models.ForeignKey(User, null=True, blank=True, on_delete=models.CASCADE)
+    email = models.EmailField(unique=True)
+    display_name = models.CharField(max_length=255, blank=True)
+    smtp_server = models.CharField(max_length=255, default='smtp.gmail.com')
+    smtp_port = models.IntegerField(default=587)
+    imap_server = models.CharField(max_length=255, blank=True)
+    imap_port = models.IntegerField(default=993, blank=True)
+    protocol = models.CharField(max_length=4, choices=PROTOCOL_CHOICES, default='imap')
+    use_ssl = models.BooleanField(default=True)
+    use_oauth = models.BooleanField(default=True)
+    # Authorized-user JSON for the Gmail API, refreshed in place
+    oauth_token = models.TextField(blank=True, null=True)
+    daily_quota = models.PositiveIntegerField(default=500)
+    max_per_second = models.FloatField(default=2.0)
+    is_active = models.BooleanField(default=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_sync = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return self.email
+
+class EmailVariant(models.Model):
+    """One version of a campaign's email in an A/B test"""
+    campaign = models.ForeignKey(EmailCampaign, related_name='variants', on_delete=models.CASCADE)
+    index = models.PositiveSmallIntegerField()
+    subject = models.TextField()
+    body_text = models.TextField()
+    body_html = models.TextField()
+    generated_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ('campaign', 'index')
+        ordering = ['index']
+
 class Recipient(models.Model):
     campaign = models.ForeignKey(EmailCampaign, related_name='recipients', on_delete=models.CASCADE)
     email = models.EmailField()
     name = models.CharField(max_length=255, blank=True)
     is_sent = models.BooleanField(default=False)
     sent_at = models.DateTimeField(null=True, blank=True)
+    # Account the email went out from; replies are answered from it too
+    account = models.ForeignKey(EmailAccount, null=True, blank=True, on_delete=models.SET_NULL, related_name='recipients')
+    message_id = models.CharField(max_length=255, blank=True)
+    thread_id = models.CharField(max_length=255, blank=True)
+    # Variant the recipient was sent, when the campaign is an A/B test
+    variant = models.ForeignKey(EmailVariant, null=True, blank=True, on_delete=models.SET_NULL, related_name='recipients')
+    # Audience member who replied; their delivery state is an AudienceDelivery
+    member = models.ForeignKey(AudienceMember, null=True, blank=True, on_delete=models.SET_NULL, related_name='recipients')
     
     class Meta:
         unique_together = ('campaign', 'email')
+        indexes = [
+            # Keyset paging over a campaign's unsent recipients (id > last_id)
+            models.Index(fields=['campaign', 'is_sent', 'id'], name='recipient_send_state_idx'),
+            models.Index(fields=['campaign', 'member'], name='recipient_member_idx'),
+        ]
+
+class AudienceDelivery(models.Model):
+    """Delivery state of one audience member in one campaign.
+
+    Only the state is stored per campaign; the address is read through
+    ``member``. A member without a row has not been sent to yet.
+    """
+    STATE_CHOICES = [
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+    ]
+
+    campaign = models.ForeignKey(EmailCampaign, related_name='audience_deliveries', on_delete=models.CASCADE)
+    member = models.ForeignKey(AudienceMember, related_name='deliveries', on_delete=models.CASCADE)
+    state = models.CharField(max_length=10, choices=STATE_CHOICES, default='sent')
+    sent_at = models.DateTimeField(null=True, blank=True)
+    account = models.ForeignKey(EmailAccount, null=True, blank=True, on_delete=models.SET_NULL, related_name='audience_deliveries')
+    variant = models.ForeignKey(EmailVariant, null=True, blank=True, on_delete=models.SET_NULL, related_name='audience_deliveries')
+    message_id = models.CharField(max_length=255, blank=True)
+    thread_id = models.CharField(max_length=255, blank=True)
+
+    class Meta:
+        # Also the index member-range lookups use while sending
+        unique_together = ('campaign', 'member')
 
 class GeneratedEmail(models.Model):
     campaign = models.OneToOneField(EmailCampaign, related_name='generated_email', on_delete=models.CASCADE)
@@ -36,6 +137,14 @@ class GeneratedEmail(models.Model):
     generated_at = models.DateTimeField(auto_now_add=True)
 
 class EmailReply(models.Model):
+    CLASSIFICATION_CHOICES = [
+        ('human', 'Written by a person'),
+        ('auto_reply', 'Automatic reply'),
+        ('bounce', 'Delivery failure'),
+        ('unsubscribe', 'Unsubscribe request'),
+        ('review', 'Needs a person'),
+    ]
+
     campaign = models.ForeignKey(EmailCampaign, on_delete=models.CASCADE, related_name='replies')
     recipient = models.ForeignKey(Recipient, on_delete=models.CASCADE, related_name='replies')
     original_message_id = models.CharField(max_length=255)
@@ -44,6 +153,75 @@ class EmailReply(models.Model):
     received_at = models.DateTimeField(auto_now_add=True)
     processed = models.BooleanField(default=False)
     reply_sent = models.BooleanField(default=False)
+    # Set by reply_classifier; blank until the reply has been classified
+    classification = models.CharField(max_length=20, choices=CLASSIFICATION_CHOICES, blank=True)
+    classification_reason = models.CharField(max_length=255, blank=True)
+    # When the AI reply went out; reply budgets count these
+    replied_at = models.DateTimeField(null=True, blank=True)
+    # Left for a person: the classifier was unsure, or the thread or recipient ran out of reply budget
+    escalated = models.BooleanField(default=False)
+    escalation_reason = models.CharField(max_length=20, blank=True)
+
+    class Meta:
+        unique_together = ('reply_message_id', 'recipient')
+        indexes = [
+            # Reply budget lookups: replies sent in a campaign within the window
+            models.Index(fields=['campaign', 'replied_at'], name='reply_budget_idx'),
+        ]
+
+class SuppressedAddress(models.Model):
+    """An address no campaign may send to again"""
+    REASON_CHOICES = [
+        ('bounce', 'Hard bounce'),
+        ('unsubscribe', 'Unsubscribed'),
+        ('complaint', 'Complaint'),
+        ('manual', 'Added manually'),
+    ]
+
+    # Stored lowercased
+    email = models.EmailField(unique=True)
+    reason = models.CharField(max_length=20, choices=REASON_CHOICES, default='manual')
+    # DSN status and diagnostic code for bounces
+    detail = models.TextField(blank=True)
+    campaign = models.ForeignKey(EmailCampaign, null=True, blank=True, on_delete=models.SET_NULL, related_name='suppressions')
+    # Bounce message the address was taken from, so it is only parsed once
+    source_message_id = models.CharField(max_length=255, blank=True, db_index=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.email
+
+class ProcessedBounce(models.Model):
+    """A bounce message reply discovery has read, so it is downloaded only once.
+
+    Transient (4.x.x) bounces suppress nobody; without this they would be
+    fetched and parsed again on every discovery run.
+    """
+    message_id = models.CharField(max_length=255, unique=True)
+    campaign = models.ForeignKey(EmailCampaign, null=True, blank=True, on_delete=models.SET_NULL, related_name='bounces')
+    # Addresses it reported as permanently failed (and suppressed)
+    suppressed = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+class LLMCallMetric(models.Model):
+    CALL_TYPE_CHOICES = [
+        ('generate', 'Generate'),
+        ('reply', 'Reply'),
+        ('other', 'Other'),
+    ]
+
+    campaign = models.ForeignKey(EmailCampaign, null=True, blank=True, on_delete=models.SET_NULL, related_name='llm_calls')
+    call_type = models.CharField(max_length=20, choices=CALL_TYPE_CHOICES, default='other')
+    backend = models.CharField(max_length=20)
+    model = models.CharField(max_length=100)
+    latency_ms = models.FloatField()
+    prompt_tokens = models.IntegerField(default=0)
+    completion_tokens = models.IntegerField(default=0)
+    success = models.BooleanField(default=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
-        unique_together = ('reply_message_id', 'recipient')
\ No newline at end of file
+        indexes = [
+            models.Index(fields=['call_type', 'created_at']),
+        ]
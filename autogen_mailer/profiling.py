@@ -0,0 +1,132 @@
+import contextvars
+import json
+import logging
+import os
+import time
+import uuid
+from collections import defaultdict
+
+logger = logging.getLogger(__name__)
+
+# Categories shown in the Server-Timing header, in order
+CATEGORIES = ('db', 'http', 'llm')
+# Slowest queries kept in a profile dump
+MAX_DUMPED_QUERIES = 20
+
+_current_profile = contextvars.ContextVar('request_profile', default=None)
+
+
+class RequestProfile:
+    """Time spent per category while serving one request"""
+
+    def __init__(self, path, method):
+        self.id = uuid.uuid4().hex[:12]
+        self.path = path
+        self.method = method
+        self.started = time.monotonic()
+        self.started_at = time.time()
+        self.durations = defaultdict(float)
+        self.counts = defaultdict(int)
+        self.queries = []
+
+    def add(self, category, seconds):
+        self.durations[category] += seconds
+        self.counts[category] += 1
+
+    def add_query(self, sql, seconds):
+        self.add('db', seconds)
+        self.queries.append((seconds, sql))
+
+    def total(self):
+        return time.monotonic() - self.started
+
+    def server_timing(self):
+        """Render the breakdown as a Server-Timing header value"""
+        total = self.total()
+        accounted = 0.0
+        entries = []
+        for category in CATEGORIES:
+            seconds = self.durations.get(category, 0.0)
+            accounted += seconds
+            entries.append(
+                f'{category};dur={seconds * 1000:.1f};desc="{self.counts.get(category, 0)} calls"'
+            )
+        entries.append(f'app;dur={max(total - accounted, 0) * 1000:.1f}')
+        entries.append(f'total;dur={total * 1000:.1f}')
+        return ', '.join(entries)
+
+    def as_dict(self, status_code=None):
+        slowest = sorted(self.queries, key=lambda query: query[0], reverse=True)[:MAX_DUMPED_QUERIES]
+        return {
+            'id': self.id,
+            'path': self.path,
+            'method': self.method,
+            'status': status_code,
+            'started_at': self.started_at,
+            'total_ms': round(self.total() * 1000, 1),
+            'breakdown': {
+                category: {
+                    'ms': round(self.durations.get(category, 0.0) * 1000, 1),
+                    'count': self.counts.get(category, 0),
+                }
+                for category in CATEGORIES
+            },
+            'slowest_queries': [
+                {'ms': round(seconds * 1000, 2), 'sql': sql} for seconds, sql in slowest
+            ],
+        }
+
+
+def current_profile():
+    return _current_profile.get()
+
+
+def start_profile(path, method):
+    profile = RequestProfile(path, method)
+    return profile, _current_profile.set(profile)
+
+
+def end_profile(token):
+    _current_profile.reset(token)
+
+
+def record(category, seconds):
+    """Attribute ``seconds`` to ``category`` if the current request is profiled"""
+    profile = _current_profile.get()
+    if profile is not None:
+        profile.add(category, seconds)
+
+
+def query_timer(execute, sql, params, many, context):
+    """Execute wrapper timing every query of a profiled request"""
+    profile = _current_profile.get()
+    if profile is None:
+        return execute(sql, params, many, context)
+    started = time.monotonic()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        profile.add_query(sql, time.monotonic() - started)
+
+
+def install_query_timer(sender, connection, **kwargs):
+    """``connection_created`` receiver adding ``query_timer`` to new connections.
+
+    Installed on the connection itself rather than per request, so queries
+    run from ``sync_to_async`` threads of an async view are timed as well.
+    """
+    if query_timer not in connection.execute_wrappers:
+        connection.execute_wrappers.append(query_timer)
+
+
+def dump_profile(directory, profile, status_code, stats=None):
+    """Write the profile (and cProfile stats, if captured) under ``directory``"""
+    os.makedirs(directory, exist_ok=True)
+    base = os.path.join(directory, f"{int(profile.started_at)}-{profile.id}")
+    try:
+        with open(f"{base}.json", 'w') as dump:
+            json.dump(profile.as_dict(status_code), dump, indent=2)
+        if stats is not None:
+            stats.dump_stats(f"{base}.prof")
+    except OSError as e:
+        logger.warning("Could not write profile %s: %s", profile.id, e)
@@ -0,0 +1,120 @@
+"""HTML email bodies rendered from compiled, cached layouts.
+
+Each kind of email ('campaign', 'reply') is a fragment in
+templates/autogen_mailer/email/ that is placed inside ``layout.html``. The
+first time a kind is rendered, its source is assembled and the rules of
+``email.css`` are written into style attributes (many mail clients drop
+<style> blocks). The result is then compiled once per process. After that a
+render is a plain autoescaped template render. The plain-text alternative is
+derived from the HTML.
+"""
+import functools
+import re
+from dataclasses import dataclass
+from pathlib import Path
+
+from django.template import Context, engines
+
+from .mime_utils import html_to_text
+
+TEMPLATE_DIR = Path(__file__).resolve().parent / 'templates' / 'autogen_mailer' / 'email'
+CONTENT_MARKER = '<!-- content -->'
+
+_COMMENT_RE = re.compile(r'/\*.*?\*/', re.DOTALL)
+_RULE_RE = re.compile(r'([^{}]+)\{([^{}]*)\}')
+_SELECTOR_RE = re.compile(r'^([a-zA-Z][\w-]*)?(?:\.([\w-]+))?$')
+_OPEN_TAG_RE = re.compile(r'<([a-zA-Z][\w-]*)(\s[^<>]*?)?(/?)>')
+_CLASS_RE = re.compile(r'\sclass\s*=\s*"([^"]*)"', re.IGNORECASE)
+_STYLE_RE = re.compile(r'\sstyle\s*=\s*"([^"]*)"', re.IGNORECASE)
+_PARAGRAPH_BREAK_RE = re.compile(r'\n\s*\n')
+
+
+@dataclass(frozen=True)
+class RenderedEmail:
+    html: str
+    text: str
+
+
+def parse_declarations(block):
+    """``{property: value}`` of a CSS declaration block, in order"""
+    declarations = {}
+    for declaration in block.split(';'):
+        prop, _, value = declaration.partition(':')
+        if prop.strip() and value.strip():
+            declarations[prop.strip().lower()] = value.strip()
+    return declarations
+
+
+def parse_css(css):
+    """``(tag, class, declarations)`` rules, least specific first.
+
+    Only ``tag``, ``.class`` and ``tag.class`` selectors are understood;
+    anything else raises ValueError so a stylesheet mistake shows up when
+    the layouts are compiled rather than as an unstyled email.
+    """
+    rules = []
+    for selectors, block in _RULE_RE.findall(_COMMENT_RE.sub('', css)):
+        declarations = parse_declarations(block)
+        for selector in selectors.split(','):
+            match = _SELECTOR_RE.match(selector.strip())
+            if match is None or not any(match.groups()):
+                raise ValueError(f"Unsupported selector in email CSS: {selector.strip()!r}")
+            tag, cls = match.groups()
+            specificity = (cls is not None) * 10 + (tag is not None)
+            rules.append((specificity, len(rules), tag and tag.lower(), cls, declarations))
+    rules.sort(key=lambda rule: rule[:2])
+    return [rule[2:] for rule in rules]
+
+
+def inline_css(source, css):
+    """Write the rules of ``css`` into the style attributes of ``source``'s tags.
+
+    Declarations already in a tag's style attribute win over the stylesheet.
+    """
+    rules = parse_css(css)
+
+    def apply(match):
+        tag, attrs, closing = match.group(1), match.group(2) or '', match.group(3)
+        class_match = _CLASS_RE.search(attrs)
+        classes = set(class_match.group(1).split()) if class_match else set()
+        declarations = {}
+        for rule_tag, rule_class, rule_declarations in rules:
+            if rule_tag in (None, tag.lower()) and (rule_class is None or rule_class in classes):
+                declarations.update(rule_declarations)
+        if not declarations:
+            return match.group(0)
+        style_match = _STYLE_RE.search(attrs)
+        if style_match:
+            declarations.update(parse_declarations(style_match.group(1)))
+            attrs = attrs[:style_match.start()] + attrs[style_match.end():]
+        style = '; '.join(f'{prop}: {value}' for prop, value in declarations.items())
+        return f'<{tag}{attrs} style="{style}"{closing}>'
+
+    return _OPEN_TAG_RE.sub(apply, source)
+
+
+@functools.lru_cache(maxsize=None)
+def get_template(kind):
+    """The compiled template of an email kind, built on first use"""
+    layout = (TEMPLATE_DIR / 'layout.html').read_text(encoding='utf-8')
+    fragment = (TEMPLATE_DIR / f'{kind}.html').read_text(encoding='utf-8')
+    css = (TEMPLATE_DIR / 'email.css').read_text(encoding='utf-8')
+    source = inline_css(layout.replace(CONTENT_MARKER, fragment), css)
+    return engines['django'].engine.from_string(source)
+
+
+def plain_text(html):
+    """Plain-text alternative of a rendered email"""
+    text = '\n'.join(line.strip() for line in html_to_text(html).split('\n'))
+    return _PARAGRAPH_BREAK_RE.sub('\n\n', text).strip()
+
+
+def paragraphs(text):
+    """Blank-line separated paragraphs of ``text``"""
+    return [paragraph.strip() for paragraph in _PARAGRAPH_BREAK_RE.split(text) if paragraph.strip()]
+
+
+def render_email(kind, **context):
+    """Render an email kind; every context value is autoescaped"""
+    html = get_template(kind).render(Context(context))
+    return RenderedEmail(html=html, text=plain_text(html))
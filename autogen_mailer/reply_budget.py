@@ -0,0 +1,58 @@
+"""Caps on how many AI replies one recipient and one thread can get.
+
+Two auto-responders the classifier did not recognise can keep replying to
+each other. Without a cap, every round would cost an LLM call and a Gmail
+send. Once a recipient or a thread has used its budget in the rolling
+window, further replies are escalated to a person instead of answered.
+"""
+import logging
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Count
+from django.utils import timezone
+
+from .models import EmailReply
+
+logger = logging.getLogger(__name__)
+
+THREAD_BUDGET = 'thread_budget'
+RECIPIENT_BUDGET = 'recipient_budget'
+
+
+class ReplyBudget:
+    """AI replies left per thread and per recipient of a campaign.
+
+    Usage is counted from ``EmailReply.replied_at`` when the budget is
+    built. That is a single query on the (campaign, replied_at) index.
+    Replies are then reserved in memory as they are accepted, so one batch
+    cannot overrun the budget either. A budget of None disables that cap.
+    """
+
+    def __init__(self, campaign, now=None):
+        self.per_thread = getattr(settings, 'MAILER_REPLY_BUDGET_PER_THREAD', 3)
+        self.per_recipient = getattr(settings, 'MAILER_REPLY_BUDGET_PER_RECIPIENT', 5)
+        window = timedelta(hours=getattr(settings, 'MAILER_REPLY_BUDGET_WINDOW_HOURS', 24))
+        since = (now or timezone.now()) - window
+        rows = (
+            EmailReply.objects.filter(campaign=campaign, replied_at__gte=since)
+            .values_list('recipient_id', 'original_message_id')
+            .annotate(sent=Count('id'))
+            .order_by()
+        )
+        self.threads = Counter()
+        self.recipients = Counter()
+        for recipient_id, thread, sent in rows:
+            self.threads[thread] += sent
+            self.recipients[recipient_id] += sent
+
+    def reserve(self, reply):
+        """Take one reply from the budget; returns None, or the budget that is exhausted"""
+        if self.per_thread is not None and self.threads[reply.original_message_id] >= self.per_thread:
+            return THREAD_BUDGET
+        if self.per_recipient is not None and self.recipients[reply.recipient_id] >= self.per_recipient:
+            return RECIPIENT_BUDGET
+        self.threads[reply.original_message_id] += 1
+        self.recipients[reply.recipient_id] += 1
+        return None
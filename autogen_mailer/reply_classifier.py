@@ -0,0 +1,194 @@
+"""Sort replies before any of them reach the LLM.
+
+Most of the mail that lands in a campaign thread was not written by a
+person: out-of-office notices, delivery failures that are not formal
+bounce reports, and one-line "unsubscribe" requests. Answering these
+wastes tokens, and answering an auto-responder can start a reply loop.
+
+``classify`` works locally and in order:
+- headers: Auto-Submitted (RFC 3834), X-Autoreply, Precedence;
+- sender and subject rules;
+- weighted keyword phrases on the cleaned reply.
+
+Only ``human`` replies are answered. Unsubscribes go to the suppression
+list. Keyword hits that are too weak or ambiguous to act on (a single
+phrase, a question, a negation) are ``review`` and go to a person.
+Everything else is marked processed without an answer.
+"""
+import re
+from dataclasses import dataclass
+
+from .mime_utils import get_header
+from .reply_cleaner import clean_reply
+
+HUMAN = 'human'
+AUTO_REPLY = 'auto_reply'
+BOUNCE = 'bounce'
+UNSUBSCRIBE = 'unsubscribe'
+# Keyword hits too weak or too ambiguous to act on: a person decides
+REVIEW = 'review'
+
+# Headers reply discovery fetches so replies are classified without a download
+CLASSIFIER_HEADERS = [
+    'Subject', 'Auto-Submitted', 'X-Autoreply', 'X-Autorespond', 'X-Auto-Response-Suppress', 'Precedence'
+]
+
+_NO_REPLY_SENDER_RE = re.compile(r'\b(no-?reply|do-?not-?reply|mailer-daemon|postmaster)@', re.IGNORECASE)
+_AUTO_REPLY_SUBJECT_RE = re.compile(
+    r'^\s*(auto(matic)?[ -]?(reply|response)|auto:|out of (the )?office|ooo\b|abwesenheitsnotiz|'
+    r'r[ée]ponse automatique|respuesta autom[áa]tica|away from (the )?office)',
+    re.IGNORECASE
+)
+_BOUNCE_SUBJECT_RE = re.compile(
+    r'^\s*(undeliverable|undelivered mail|delivery status notification \(failure\)|'
+    r'mail delivery (failed|failure|subsystem)|returned mail|failure notice)',
+    re.IGNORECASE
+)
+
+# (pattern, weight) per classification. One phrase is never enough: a reply
+# needs KEYWORD_THRESHOLD, i.e. several signals, or a line that says nothing
+# else (an unsubscribe-only line).
+KEYWORD_MODELS = {
+    UNSUBSCRIBE: [
+        (re.compile(
+            r'^\s*(please\s+)?(unsubscribe|remove|stop|opt[ -]?out)( me)?'
+            r'( (from|off) (this|the|your|all) (mailing |email )?(list|emails?|mailings?))?'
+            r'( now)?(,?\s*(please|thanks|thank you))?[.!]*\s*$',
+            re.IGNORECASE | re.MULTILINE
+        ), 3),
+        (re.compile(r'\bunsubscribe\b', re.IGNORECASE), 2),
+        (re.compile(r'\b(remove|take) me (off|from)\b', re.IGNORECASE), 2),
+        (re.compile(r'\bopt(ing)?[ -]out\b', re.IGNORECASE), 2),
+        (re.compile(r'\b(stop|quit) (emailing|contacting|sending|mailing)\b', re.IGNORECASE), 2),
+        (re.compile(r'\bnot interested\b', re.IGNORECASE), 1),
+        (re.compile(r'\b(mailing|email|distribution) list\b', re.IGNORECASE), 1),
+    ],
+    AUTO_REPLY: [
+        (re.compile(r'\b(i am|i\'m|i will be|i\'ll be) (currently )?(out of|away from) (the )?office\b', re.IGNORECASE), 2),
+        (re.compile(r'\b(on (annual |parental |maternity )?leave|on vacation|on holiday)\b', re.IGNORECASE), 1),
+        (re.compile(r'\blimited access to (my )?e-?mail\b', re.IGNORECASE), 2),
+        (re.compile(r'\b(return|be back)( to the office)? on\b', re.IGNORECASE), 1),
+        (re.compile(r'\b(this is an |this )(automated|automatic|auto-generated) (reply|response|message)\b', re.IGNORECASE), 3),
+        (re.compile(r'\bfor (urgent|immediate) (matters|assistance|requests)\b', re.IGNORECASE), 1),
+        (re.compile(r'\b(no longer (with|works? (at|for))|has left the company)\b', re.IGNORECASE), 2),
+    ],
+    BOUNCE: [
+        (re.compile(r'\b(could not be|wasn\'?t|was not|couldn\'?t be) delivered\b', re.IGNORECASE), 2),
+        (re.compile(r'\bdelivery (has )?failed\b', re.IGNORECASE), 2),
+        (re.compile(r'\b(address|mailbox|recipient) (not found|unknown|unavailable|does not exist)\b', re.IGNORECASE), 2),
+        (re.compile(r'\b[45]\d\d[ -][45]\.\d\.\d{1,3}\b'), 2),
+    ],
+}
+KEYWORD_THRESHOLD = 3
+# A phrase this strong that does not reach the threshold, or that appears in
+# a question or after a negation, sends the reply to a person
+AMBIGUOUS_WEIGHT = 2
+# Keyword matches only count on short replies: a long message that mentions
+# "unsubscribe" in passing was still written to be answered
+KEYWORD_MAX_WORDS = 80
+
+# Sentences end at . ! ? followed by a space, or at the end of a line (so 5.1.1 stays whole)
+_SENTENCE_RE = re.compile(r'.+?(?:[.!?]+(?=\s|$)|$)', re.MULTILINE)
+# A negation up to two words before the phrase: "don't unsubscribe", "do not want to opt out"
+_NEGATION_RE = re.compile(r"\b(don'?t|do not|doesn'?t|never|not|no need to)\s+(\w+\s+){0,2}$", re.IGNORECASE)
+
+
+@dataclass(frozen=True)
+class Classification:
+    label: str
+    reason: str
+
+    @property
+    def needs_reply(self):
+        return self.label == HUMAN
+
+
+def _header_rules(headers):
+    auto_submitted = (headers.get('auto-submitted') or '').strip().lower()
+    if auto_submitted and auto_submitted != 'no':
+        return Classification(AUTO_REPLY, f"Auto-Submitted: {auto_submitted}")
+    for name in ('x-autoreply', 'x-autorespond'):
+        if headers.get(name):
+            return Classification(AUTO_REPLY, f"{name} header")
+    if (headers.get('x-auto-response-suppress') or '').strip().lower() in ('all', 'oof', 'autoreply'):
+        return Classification(AUTO_REPLY, "X-Auto-Response-Suppress header")
+    precedence = (headers.get('precedence') or '').strip().lower()
+    if precedence in ('auto_reply', 'bulk', 'junk', 'list'):
+        return Classification(AUTO_REPLY, f"Precedence: {precedence}")
+    return None
+
+
+def _text_rules(sender, subject):
+    if _BOUNCE_SUBJECT_RE.match(subject):
+        return Classification(BOUNCE, "delivery failure subject")
+    if _AUTO_REPLY_SUBJECT_RE.match(subject):
+        return Classification(AUTO_REPLY, "automatic reply subject")
+    if _NO_REPLY_SENDER_RE.search(sender):
+        return Classification(AUTO_REPLY, "no-reply sender")
+    return None
+
+
+def _hedged(sentence, offset):
+    """Whether a phrase at ``offset`` in ``sentence`` is asked about or negated"""
+    return sentence.rstrip().endswith('?') or bool(_NEGATION_RE.search(sentence[:offset]))
+
+
+def _keyword_model(text):
+    """Score the weighted phrases sentence by sentence.
+
+    A match inside a question ("can I unsubscribe later?") or right after
+    a negation ("don't unsubscribe me") does not count towards the score.
+    It can only make the reply ambiguous.
+    """
+    if len(text.split()) > KEYWORD_MAX_WORDS:
+        return None
+    sentences = [match for match in _SENTENCE_RE.finditer(text) if match.group().strip()]
+    best = None
+    ambiguous = None
+    for label, phrases in KEYWORD_MODELS.items():
+        score = 0
+        for pattern, weight in phrases:
+            matched = hedged = False
+            for sentence in sentences:
+                # The unsubscribe-only line pattern is anchored to whole lines
+                for match in pattern.finditer(sentence.group()):
+                    if _hedged(sentence.group(), match.start()):
+                        hedged = True
+                    else:
+                        matched = True
+            if matched:
+                score += weight
+            elif hedged and weight >= AMBIGUOUS_WEIGHT:
+                ambiguous = ambiguous or (label, "question or negation")
+        if score >= KEYWORD_THRESHOLD:
+            if best is None or score > best[1]:
+                best = (label, score)
+        elif score >= AMBIGUOUS_WEIGHT:
+            ambiguous = ambiguous or (label, f"score {score}")
+    if best is not None:
+        return Classification(best[0], f"keywords (score {best[1]})")
+    if ambiguous is not None:
+        return Classification(REVIEW, f"ambiguous {ambiguous[0]} keywords ({ambiguous[1]})")
+    return None
+
+
+def classify(content, headers=None, sender='', subject=''):
+    """Classify a reply from its body and, when known, its headers.
+
+    ``headers`` maps lowercased header names to values. The first stage
+    that decides wins; a reply no stage claims is ``human``.
+    """
+    headers = headers or {}
+    subject = subject or headers.get('subject') or ''
+    return (
+        _header_rules(headers)
+        or _text_rules(sender, subject)
+        or _keyword_model(clean_reply(content))
+        or Classification(HUMAN, "")
+    )
+
+
+def classify_message(message, content, sender=''):
+    """``classify`` for a Gmail message fetched with CLASSIFIER_HEADERS"""
+    headers = {name.lower(): get_header(message, name) for name in CLASSIFIER_HEADERS}
+    return classify(content, {name: value for name, value in headers.items() if value}, sender=sender)
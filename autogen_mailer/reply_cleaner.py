@@ -0,0 +1,107 @@
+import logging
+import re
+from functools import lru_cache
+
+from .mime_utils import strip_quoted_history
+
+logger = logging.getLogger(__name__)
+
+# Rough characters-per-token ratio used when no tokenizer is available
+CHARS_PER_TOKEN = 4
+
+_SIGNATURE_DELIMITER_RE = re.compile(r'^(--|__+)\s*$')
+_DEVICE_FOOTER_RE = re.compile(
+    r'^\s*(Sent from my \w+|Sent from (Mail|Outlook|Yahoo Mail) for \w+|Get Outlook for \w+)',
+    re.IGNORECASE
+)
+_VALEDICTION_RE = re.compile(
+    r'^\s*((best|kind|warm|many)\s+)?(regards|thanks|thank you|cheers|sincerely|best)[,!.]?\s*$',
+    re.IGNORECASE
+)
+# A valediction is only treated as the start of a signature this close to the end
+_VALEDICTION_WINDOW = 6
+# Lines after a valediction must look like a signature (name, title, company)
+_SIGNATURE_LINE_MAX_WORDS = 6
+
+
+def _looks_like_signature(lines):
+    """Whether the lines after a valediction are a name/title block, not more message"""
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        words = line.split()
+        if len(words) > _SIGNATURE_LINE_MAX_WORDS or '?' in line:
+            return False
+        # A sentence of its own ("Also, call me tomorrow.") is still message text
+        if line[-1] in '.!' and len(words) > 3:
+            return False
+    return True
+
+
+def clean_reply(text):
+    """Reduce a reply to what the sender actually wrote.
+
+    Removes quoted history and "On ... wrote:" trailers, then the signature:
+    everything after a "-- " delimiter or a device footer, and a closing
+    valediction near the end of the message when only a signature follows
+    it. An opening "Thanks!" followed by questions is kept.
+    """
+    lines = strip_quoted_history(text or "").splitlines()
+
+    for index, line in enumerate(lines):
+        if _SIGNATURE_DELIMITER_RE.match(line) or _DEVICE_FOOTER_RE.match(line):
+            lines = lines[:index]
+            break
+
+    # Never cut the first line: a reply of just "Thanks!" is still a reply
+    for index in range(max(1, len(lines) - _VALEDICTION_WINDOW), len(lines)):
+        if _VALEDICTION_RE.match(lines[index]) and _looks_like_signature(lines[index + 1:]):
+            lines = lines[:index]
+            break
+
+    return "\n".join(lines).strip()
+
+
+@lru_cache(maxsize=None)
+def _get_encoding(model):
+    try:
+        import tiktoken
+    except ImportError:
+        logger.warning("tiktoken is not installed; estimating token counts")
+        return None
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        # Not an OpenAI model; its tokenizer is unknown
+        pass
+    except Exception as e:
+        logger.warning("Could not load tokenizer for %s, estimating token counts: %s", model, e)
+        return None
+    try:
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        # The BPE file is downloaded on first use and may be unreachable
+        logger.warning("Could not load cl100k_base for %s, estimating token counts: %s", model, e)
+        return None
+
+
+def count_tokens(text, model):
+    """Count the tokens ``text`` costs for ``model``"""
+    encoding = _get_encoding(model)
+    if encoding is None:
+        return -(-len(text) // CHARS_PER_TOKEN)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def truncate_to_tokens(text, max_tokens, model):
+    """Trim ``text`` to at most ``max_tokens`` tokens"""
+    if max_tokens <= 0:
+        return ""
+    encoding = _get_encoding(model)
+    if encoding is None:
+        return text[:max_tokens * CHARS_PER_TOKEN]
+    tokens = encoding.encode(text, disallowed_special=())
+    if len(tokens) <= max_tokens:
+        return text
+    return encoding.decode(tokens[:max_tokens])
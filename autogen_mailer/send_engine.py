@@ -0,0 +1,483 @@
+"""Campaign delivery with one queue per recipient domain.
+
+Recipients are split by the domain of their address. Each domain queue has
+its own cap on sends in flight and sends per second, and a shared worker
+pool drains the queues round-robin, so a cluster of gmail.com addresses
+neither bursts at one provider nor holds up everyone else. A domain that
+answers with a throttling error backs off on its own while the other
+domains keep sending. That is for SMTP servers deferring with a 4xx: when
+the Gmail API answers 429 or 5xx it is the sending account being rate
+limited, whatever the recipient's domain, so that account pauses instead
+and the other accounts keep sending to every domain.
+
+Sends run in worker threads; results, database writes and progress events
+are handled on the calling thread. The worker threads are shared by every
+campaign a process sends (``send_pool``).
+"""
+import itertools
+import logging
+import queue
+import smtplib
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connections
+from django.utils import timezone
+
+from . import events
+from .accounts import plan_sends
+from .audiences import MemberRow, audience_delivery_chunks, pending_audience_members, record_delivery
+from .metrics import EMAILS_SENT, SEND_QUEUE_DEPTH, SENDS_THROTTLED
+from .models import Recipient
+from .suppression import get_suppression_list, unsubscribe_headers
+from .transports import get_transport
+from .variants import variant_for
+
+logger = logging.getLogger(__name__)
+
+# Who a throttling error is about, and so what pauses
+ACCOUNT = 'account'
+DOMAIN = 'domain'
+
+
+@dataclass(frozen=True)
+class DomainLimits:
+    concurrency: int = 2
+    rate_per_second: float = 5.0
+
+
+def limits_for(domain):
+    """MAILER_DOMAIN_LIMITS for a domain, on top of its 'default' entry"""
+    configured = getattr(settings, 'MAILER_DOMAIN_LIMITS', {})
+    return DomainLimits(**{**configured.get('default', {}), **configured.get(domain, {})})
+
+
+def recipient_domain(email):
+    return email.rpartition('@')[2].strip().lower()
+
+
+class SuppressedError(Exception):
+    """The recipient was suppressed after the send was planned"""
+
+
+def throttle_scope(error):
+    """What a temporary send failure asks to slow down, or None for any other error.
+
+    ACCOUNT when the Gmail API rate limits the sending account (429, 5xx),
+    DOMAIN when the recipient's SMTP server defers with a 4xx.
+    """
+    # Only a loaded googleapiclient can have raised an HttpError; don't import it here
+    http_errors = sys.modules.get('googleapiclient.errors')
+    if http_errors is not None and isinstance(error, http_errors.HttpError):
+        status = error.resp.status
+        return ACCOUNT if status == 429 or status >= 500 else None
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return DOMAIN if all(400 <= code < 500 for code, _ in error.recipients.values()) else None
+    if isinstance(error, smtplib.SMTPResponseException):
+        return DOMAIN if 400 <= error.smtp_code < 500 else None
+    return None
+
+
+def pause_for(throttles, base, ceiling):
+    """Backoff after ``throttles`` throttles in a row, doubling each time"""
+    return min(base * 2 ** (throttles - 1), ceiling)
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def send_pool(workers):
+    """The process-wide pool of ``workers`` send threads, started on first use"""
+    with _pools_lock:
+        pool = _pools.get(workers)
+        if pool is None:
+            pool = _pools[workers] = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='send')
+    return pool
+
+
+class _Delivery:
+    __slots__ = ('recipient', 'account', 'attempts')
+
+    def __init__(self, recipient, account):
+        self.recipient = recipient
+        self.account = account
+        self.attempts = 0
+
+
+class DomainQueue:
+    """Pending deliveries of one domain with its in-flight count and pacing"""
+
+    def __init__(self, domain, limits):
+        self.domain = domain
+        self.limits = limits
+        self.pending = deque()
+        self.in_flight = 0
+        # Monotonic time before which no new send may start
+        self.next_start = 0.0
+        self.throttles = 0
+
+    def ready_at(self):
+        """When the next send may start, or None while there is nothing to start"""
+        if not self.pending or self.in_flight >= self.limits.concurrency:
+            return None
+        return self.next_start
+
+    def start(self, now, paused):
+        """Start the first delivery whose account is not ``paused``, or return None"""
+        for index, delivery in enumerate(self.pending):
+            if not paused(delivery.account):
+                break
+        else:
+            return None
+        del self.pending[index]
+        self.in_flight += 1
+        interval = 1.0 / self.limits.rate_per_second if self.limits.rate_per_second > 0 else 0.0
+        self.next_start = max(now, self.next_start) + interval
+        return delivery
+
+    def back_off(self, delivery, now, base, ceiling):
+        """Requeue a throttled delivery and pause the domain, doubling per throttle in a row"""
+        self.pending.appendleft(delivery)
+        self.throttles += 1
+        delay = pause_for(self.throttles, base, ceiling)
+        self.next_start = max(self.next_start, now + delay)
+        return delay
+
+
+class AccountBackoff:
+    """Pause of one sending account after the Gmail API throttled it"""
+    __slots__ = ('until', 'throttles')
+
+    def __init__(self):
+        # Monotonic time before which the account sends nothing
+        self.until = 0.0
+        self.throttles = 0
+
+    def back_off(self, now, base, ceiling):
+        self.throttles += 1
+        delay = pause_for(self.throttles, base, ceiling)
+        self.until = max(self.until, now + delay)
+        return delay
+
+
+def account_key(account):
+    return account.pk if account is not None else None
+
+
+class DeliveryEngine:
+    """Drain per-domain queues round-robin over a pool of ``workers`` threads"""
+
+    def __init__(self, workers=None, max_attempts=None, backoff=None, backoff_max=None, buffer=None,
+                 account_backoff=None, account_backoff_max=None):
+        self.workers = workers or getattr(settings, 'MAILER_SEND_WORKERS', 8)
+        self.buffer = buffer or getattr(settings, 'MAILER_SEND_BUFFER', 2000)
+        self.max_attempts = max_attempts or getattr(settings, 'MAILER_SEND_MAX_ATTEMPTS', 3)
+        self.backoff = backoff or getattr(settings, 'MAILER_DOMAIN_BACKOFF_SECONDS', 2.0)
+        self.backoff_max = backoff_max or getattr(settings, 'MAILER_DOMAIN_BACKOFF_MAX_SECONDS', 120.0)
+        self.account_backoff = account_backoff or getattr(settings, 'MAILER_ACCOUNT_BACKOFF_SECONDS', 2.0)
+        self.account_backoff_max = account_backoff_max or getattr(settings, 'MAILER_ACCOUNT_BACKOFF_MAX_SECONDS', 120.0)
+
+    def deliver(self, assignments, send, on_result):
+        """Call ``send(recipient, account)`` for every ``(recipient, account)`` pair.
+
+        ``assignments`` is read lazily and at most ``buffer`` deliveries are
+        queued at a time, so any iterable works and memory does not grow
+        with the campaign. ``on_result(recipient, account, result, error)``
+        is called on this thread once per recipient, after its last attempt.
+        """
+        assignments = iter(assignments)
+        domains = {}
+        # AccountBackoff per account_key, for accounts the Gmail API throttled
+        accounts = {}
+        rotation = deque()
+        completed = queue.Queue()
+        queued = in_flight = 0
+        exhausted = False
+        now = 0.0
+
+        def paused(account):
+            backoff = accounts.get(account_key(account))
+            return backoff is not None and backoff.until > now
+
+        pool = send_pool(self.workers)
+        while True:
+            if not exhausted and queued <= self.buffer // 2:
+                # Top the domain queues up and forget domains with nothing left to do
+                wanted = self.buffer - queued
+                for recipient, account in itertools.islice(assignments, wanted):
+                    domain = recipient_domain(recipient.email)
+                    if domain not in domains:
+                        domains[domain] = DomainQueue(domain, limits_for(domain))
+                    domains[domain].pending.append(_Delivery(recipient, account))
+                    queued += 1
+                    wanted -= 1
+                exhausted = wanted > 0
+                now = time.monotonic()
+                domains = {
+                    domain: domain_queue for domain, domain_queue in domains.items()
+                    if domain_queue.pending or domain_queue.in_flight or domain_queue.next_start > now
+                }
+                rotation = deque(domains.values())
+            if exhausted and not queued and not in_flight:
+                break
+
+            # Start sends one domain at a time until workers or ready domains run out
+            wake = None
+            started = True
+            while started and in_flight < self.workers:
+                started = False
+                now = time.monotonic()
+                for _ in range(len(rotation)):
+                    if in_flight >= self.workers:
+                        break
+                    domain_queue = rotation[0]
+                    rotation.rotate(-1)
+                    ready = domain_queue.ready_at()
+                    if ready is None:
+                        continue
+                    if ready > now:
+                        wake = ready if wake is None else min(wake, ready)
+                        continue
+                    delivery = domain_queue.start(now, paused)
+                    if delivery is None:
+                        # Every account with mail for this domain is paused
+                        resume = min(backoff.until for backoff in accounts.values() if backoff.until > now)
+                        wake = resume if wake is None else min(wake, resume)
+                        continue
+                    pool.submit(self._attempt, domain_queue, delivery, send, completed)
+                    queued -= 1
+                    in_flight += 1
+                    started = True
+
+            # Sleep until a send finishes or a paused domain or account may start again
+            timeout = max(wake - time.monotonic(), 0) if wake is not None else None
+            try:
+                item = completed.get(timeout=timeout)
+            except queue.Empty:
+                continue
+            while item is not None:
+                in_flight -= 1
+                if not self._finish(*item, accounts, on_result):
+                    queued += 1
+                try:
+                    item = completed.get_nowait()
+                except queue.Empty:
+                    item = None
+
+    def _attempt(self, domain_queue, delivery, send, completed):
+        delivery.attempts += 1
+        try:
+            result = send(delivery.recipient, delivery.account)
+        except Exception as error:
+            completed.put((domain_queue, delivery, None, error))
+        else:
+            completed.put((domain_queue, delivery, result, None))
+        finally:
+            # Token refreshes save the account from this thread
+            connections.close_all()
+
+    def _finish(self, domain_queue, delivery, result, error, accounts, on_result):
+        """Handle one finished attempt; returns 1 when the recipient is done"""
+        domain_queue.in_flight -= 1
+        scope = throttle_scope(error) if error is not None else None
+        if scope is not None and delivery.attempts < self.max_attempts:
+            SENDS_THROTTLED.labels(scope=scope).inc()
+            now = time.monotonic()
+            if scope == ACCOUNT:
+                key = account_key(delivery.account)
+                backoff = accounts.setdefault(key, AccountBackoff())
+                delay = backoff.back_off(now, self.account_backoff, self.account_backoff_max)
+                domain_queue.pending.appendleft(delivery)
+                logger.warning(
+                    "Gmail API throttled account %s sending to %s (%s); pausing the account for %.1fs",
+                    delivery.account or 'default mailbox', delivery.recipient.email, error, delay
+                )
+            else:
+                delay = domain_queue.back_off(delivery, now, self.backoff, self.backoff_max)
+                logger.warning(
+                    "%s throttled sending to %s (%s); pausing the domain for %.1fs",
+                    domain_queue.domain, delivery.recipient.email, error, delay
+                )
+            return 0
+        if error is None:
+            domain_queue.throttles = 0
+            backoff = accounts.get(account_key(delivery.account))
+            if backoff is not None:
+                backoff.throttles = 0
+        on_result(delivery.recipient, delivery.account, result, error)
+        return 1
+
+
+def unsent_recipient_chunks(campaign, chunk_size=None):
+    """Unsent recipients of a campaign as lists of ``(id, email)`` rows.
+
+    Pages by ``id > last_id`` over the (campaign, is_sent, id) index, so
+    every chunk costs the same however far into the campaign it is, and no
+    model instances or queryset caches are built. A campaign with an
+    audience gets its members first, as MemberRows (see
+    ``audience_delivery_chunks``), then its own recipients.
+    """
+    chunk_size = chunk_size or getattr(settings, 'MAILER_RECIPIENT_CHUNK_SIZE', 1000)
+    unsent = Recipient.objects.filter(campaign=campaign, is_sent=False).order_by('id')
+    if campaign.audience_id is not None:
+        yield from audience_delivery_chunks(campaign, chunk_size)
+        unsent = unsent.filter(member__isnull=True)
+    last_id = 0
+    while True:
+        rows = list(unsent.filter(id__gt=last_id).values_list('id', 'email', named=True)[:chunk_size])
+        if rows:
+            yield rows
+        if len(rows) < chunk_size:
+            return
+        last_id = rows[-1].id
+
+
+def unsent_recipient_count(campaign):
+    """How many rows ``unsent_recipient_chunks`` yields"""
+    # Members' Recipients (made when they reply) are sent through the audience
+    own = Recipient.objects.filter(campaign=campaign, is_sent=False, member__isnull=True).count()
+    return own + pending_audience_members(campaign)
+
+
+class SendReport:
+    """Counts of a campaign send, with the addresses behind them up to ``limit`` each"""
+
+    def __init__(self, limit=None):
+        self.limit = limit or getattr(settings, 'MAILER_SEND_REPORT_LIMIT', 1000)
+        self.success = 0
+        self.counts = {'failures': 0, 'suppressed': 0, 'deferred': 0}
+        self.entries = {'failures': [], 'suppressed': [], 'deferred': []}
+
+    def add(self, kind, entry):
+        self.counts[kind] += 1
+        if len(self.entries[kind]) < self.limit:
+            self.entries[kind].append(entry)
+
+    def as_dict(self):
+        return {
+            'success': self.success,
+            **self.entries,
+            **{f'{kind}_count': count for kind, count in self.counts.items()},
+        }
+
+
+def send_campaign(campaign, email_content, sender, attachments=None, engine=None, variants=None, chunk_size=None):
+    """Send the generated email to every unsent recipient of the campaign.
+
+    Recipients are read a chunk at a time (``unsent_recipient_chunks``),
+    checked against the suppression list and sharded across the sending
+    accounts, so memory stays flat however many recipients the campaign
+    has. Each successful send is saved before the next result is handled:
+    a worker that dies mid-send never leaves a delivered recipient unsent.
+
+    With ``variants`` (EmailVariants ordered by index) each recipient gets
+    the variant picked by ``variant_for`` instead of ``email_content``.
+    Returns ``{'success': count, 'failures': [{'email', 'error'}, ...],
+    'suppressed': [email, ...], 'deferred': [email, ...]}`` plus a
+    ``<kind>_count`` for each list, which is capped at
+    MAILER_SEND_REPORT_LIMIT entries. Deferred recipients are over every
+    account's quota and stay unsent for a later run.
+    """
+    # Read uploads once; every message gets its own file objects
+    files = [(attachment.name, attachment.read()) for attachment in attachments or ()]
+    suppressed = get_suppression_list()
+    suppressed.refresh()
+    report = SendReport()
+    total = unsent_recipient_count(campaign)
+    progress = events.SendProgress(campaign.id, total)
+    tracker = None
+
+    def assignments():
+        nonlocal tracker
+        for rows in unsent_recipient_chunks(campaign, chunk_size):
+            sendable, skipped = suppressed.partition(rows)
+            for row in skipped:
+                report.add('suppressed', row.email)
+            plan = plan_sends(sendable, tracker)
+            tracker = plan.tracker
+            for row in plan.deferred:
+                report.add('deferred', row.email)
+            # Only recipients actually handed to the engine count towards progress
+            progress.total -= len(skipped) + len(plan.deferred)
+            SEND_QUEUE_DEPTH.inc(len(plan.assignments))
+            yield from plan.assignments
+
+    def content_for(recipient):
+        """``(variant, subject, body_text, body_html)`` a recipient is sent"""
+        if variants:
+            variant = variant_for(recipient.email, variants)
+            return variant, variant.subject, variant.body_text, variant.body_html
+        return None, email_content['subject'], email_content['body_text'], email_content['body_html']
+
+    def send(recipient, account):
+        if recipient.email in suppressed:
+            raise SuppressedError(f"{recipient.email} is suppressed")
+        variant, subject, body_text, body_html = content_for(recipient)
+        transport = get_transport(account)
+        if account is not None and tracker is not None:
+            tracker.wait(account)
+        return transport.send_email(
+            sender=account.email if account else sender,
+            to=recipient.email,
+            subject=subject,
+            body_text=body_text,
+            body_html=body_html,
+            attachments=[ContentFile(content, name=name) for name, content in files] or None,
+            headers=unsubscribe_headers(recipient.email)
+        )
+
+    def on_result(recipient, account, sent, error):
+        try:
+            if isinstance(error, SuppressedError):
+                report.add('suppressed', recipient.email)
+                EMAILS_SENT.labels(result='suppressed').inc()
+                progress.record(recipient.email, error=error)
+                return
+            if error is not None:
+                raise error
+            fields = {
+                'sent_at': timezone.now(),
+                'account': account,
+                'message_id': sent.get('id', ''),
+                'thread_id': sent.get('threadId', ''),
+                'variant': content_for(recipient)[0],
+            }
+            # One write per send: cheap next to the send itself
+            if isinstance(recipient, MemberRow):
+                record_delivery(campaign, recipient, 'sent', **fields)
+            else:
+                Recipient.objects.filter(id=recipient.id).update(is_sent=True, **fields)
+            report.success += 1
+            EMAILS_SENT.labels(result='sent').inc()
+            progress.record(recipient.email)
+            logger.debug("Email sent to %s (%s attachments)", recipient.email, len(files))
+        except Exception as e:
+            logger.error("Failed to send to %s: %s", recipient.email, e)
+            if isinstance(recipient, MemberRow):
+                record_delivery(campaign, recipient, 'failed')
+            EMAILS_SENT.labels(result='failed').inc()
+            progress.record(recipient.email, error=e)
+            report.add('failures', {
+                'email': recipient.email,
+                'error': str(e)
+            })
+        finally:
+            SEND_QUEUE_DEPTH.dec()
+
+    try:
+        (engine or DeliveryEngine()).deliver(assignments(), send, on_result)
+    finally:
+        progress.finish()
+    if report.counts['deferred']:
+        logger.warning(
+            "%s recipients of campaign %s deferred: sending quota of every account is used up",
+            report.counts['deferred'], campaign.id
+        )
+    return report.as_dict()
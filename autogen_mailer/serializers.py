@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from .models import EmailCampaign, Recipient, GeneratedEmail,EmailReply
+from .models import Audience, EmailCampaign, Recipient, GeneratedEmail,EmailReply, EmailVariant
 from django.core.files.base import ContentFile
 import base64
 
@@ -16,6 +16,18 @@ class GeneratedEmailSerializer(serializers.ModelSerializer):
         model = GeneratedEmail
         fields = ['subject', 'body_text', 'body_html', 'generated_at']
 
+class EmailVariantSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = EmailVariant
+        fields = ['id', 'index', 'subject', 'body_text', 'body_html', 'generated_at']
+
+class AudienceSerializer(serializers.ModelSerializer):
+    member_count = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = Audience
+        fields = ['id', 'name', 'created_at', 'member_count']
+
 class EmailCampaignSerializer(serializers.ModelSerializer):
     recipients = RecipientSerializer(many=True, read_only=True)
     generated_email = GeneratedEmailSerializer(read_only=True)
@@ -34,7 +46,7 @@ class EmailCampaignSerializer(serializers.ModelSerializer):
     class Meta:
         model = EmailCampaign
         fields = [
-            'id', 'name', 'topic', 'details', 'tone', 'created_at',
+            'id', 'name', 'topic', 'details', 'tone', 'audience', 'created_at',
             'recipients', 'generated_email', 'attachments','replies'
         ]
         extra_kwargs = {
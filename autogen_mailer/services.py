@@ -0,0 +1,86 @@
+"""Lazily loaded integrations.
+
+The email generator (autogen, and through it openai), the Gmail client
+(googleapiclient and google-auth) and the reply handler are looked up here
+by name. Their modules are imported the first time a service is created,
+not when the URLconf loads. Worker boot and management commands such as
+``migrate`` skip those imports, and a worker that never generates never
+loads autogen.
+
+MAILER_SERVICES maps names to other dotted paths or factories.
+"""
+import contextlib
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+SERVICES = {
+    'email_generator': 'autogen_mailer.autogen_service.AutoGenEmailGenerator',
+    'gmail': 'autogen_mailer.gmail_service.GmailService',
+    'reply_handler': 'autogen_mailer.reply_handler.ReplyHandler',
+}
+
+_factories = {}
+_load_seconds = {}
+_lock = threading.Lock()
+
+
+def get_factory(name):
+    """The class (or callable) behind a service, importing it on first use"""
+    factory = _factories.get(name)
+    if factory is not None:
+        return factory
+    with _lock:
+        factory = _factories.get(name)
+        if factory is None:
+            target = {**SERVICES, **getattr(settings, 'MAILER_SERVICES', {})}[name]
+            started = time.perf_counter()
+            factory = import_string(target) if isinstance(target, str) else target
+            _load_seconds[name] = time.perf_counter() - started
+            _factories[name] = factory
+            logger.info("Loaded %s service in %.0f ms", name, _load_seconds[name] * 1000)
+    return factory
+
+
+def create(name, *args, **kwargs):
+    """Build a new instance of a service"""
+    return get_factory(name)(*args, **kwargs)
+
+
+def load(*names):
+    """Import services ahead of their first use (all of them by default)"""
+    for name in names or SERVICES:
+        get_factory(name)
+
+
+def loaded_services():
+    """``{name: seconds}`` each loaded service took to import"""
+    with _lock:
+        return dict(_load_seconds)
+
+
+@contextlib.contextmanager
+def override(name, factory):
+    """Use ``factory`` for a service inside the block"""
+    with _lock:
+        previous = _factories.get(name)
+        _factories[name] = factory
+    try:
+        yield
+    finally:
+        with _lock:
+            if previous is None:
+                _factories.pop(name, None)
+            else:
+                _factories[name] = previous
+
+
+def reset_services():
+    with _lock:
+        _factories.clear()
+        _load_seconds.clear()
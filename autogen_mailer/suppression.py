@@ -0,0 +1,213 @@
+"""Addresses that must not be mailed again: hard bounces, unsubscribes, complaints.
+
+Each process keeps the suppressed addresses as 64-bit digests in an
+AddressSet, so checking a recipient costs one hash and a probe or two
+however long the list grows. The set is loaded on first use and topped up
+with new rows by ``refresh()``. Rows deleted by another process are only
+forgotten here after a restart, which errs on the side of not sending.
+"""
+import hashlib
+import logging
+import threading
+from array import array
+
+from django.conf import settings
+from django.core import signing
+from django.urls import reverse
+
+from .models import SuppressedAddress
+
+logger = logging.getLogger(__name__)
+
+UNSUBSCRIBE_SALT = 'autogen_mailer.unsubscribe'
+
+
+def normalize(email):
+    return email.strip().lower()
+
+
+def address_key(email):
+    """64-bit digest of a normalized address; never 0, which marks a free slot"""
+    digest = hashlib.blake2b(normalize(email).encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big') or 1
+
+
+class AddressSet:
+    """Set of 64-bit keys in an open-addressing table with linear probing.
+
+    Slots are a flat ``array('Q')`` kept at most half full: 8-16 bytes per
+    address, against roughly 70 for a Python set of ints. Keys are uniform
+    hashes, so their low bits index the table directly. Lookups take no
+    lock; writers swap in a grown table as a whole.
+    """
+
+    def __init__(self, capacity=1024):
+        self._table = self._empty(capacity)
+        self._count = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _empty(capacity):
+        size = 1 << max(2 * capacity - 1, 1).bit_length()
+        return array('Q', bytes(8 * size)), size - 1
+
+    @staticmethod
+    def _probe(slots, mask, key):
+        index = key & mask
+        while slots[index] and slots[index] != key:
+            index = (index + 1) & mask
+        return index
+
+    def __len__(self):
+        return self._count
+
+    def __contains__(self, key):
+        slots, mask = self._table
+        return slots[self._probe(slots, mask, key)] == key
+
+    def add(self, key):
+        with self._lock:
+            slots, mask = self._table
+            if 2 * (self._count + 1) > len(slots):
+                slots, mask = self._grow(slots)
+            index = self._probe(slots, mask, key)
+            if not slots[index]:
+                slots[index] = key
+                self._count += 1
+
+    def discard(self, key):
+        with self._lock:
+            slots, mask = self._table
+            index = self._probe(slots, mask, key)
+            if slots[index] != key:
+                return
+            slots[index] = 0
+            self._count -= 1
+            # Shift later keys of the run back so their probes still reach them
+            hole, index = index, (index + 1) & mask
+            while slots[index]:
+                home = slots[index] & mask
+                if (index - home) & mask >= (index - hole) & mask:
+                    slots[hole], slots[index] = slots[index], 0
+                    hole = index
+                index = (index + 1) & mask
+
+    def _grow(self, slots):
+        new_slots, new_mask = self._empty(len(slots))
+        for key in slots:
+            if key:
+                new_slots[self._probe(new_slots, new_mask, key)] = key
+        self._table = (new_slots, new_mask)
+        return self._table
+
+
+class SuppressionList:
+    """The SuppressedAddress table mirrored into an AddressSet"""
+
+    def __init__(self):
+        self.addresses = AddressSet()
+        self._last_id = 0
+        self._lock = threading.Lock()
+
+    def __contains__(self, email):
+        return address_key(email) in self.addresses
+
+    def __len__(self):
+        return len(self.addresses)
+
+    def refresh(self):
+        """Load rows added since the last refresh, e.g. by other processes"""
+        added = 0
+        with self._lock:
+            rows = SuppressedAddress.objects.filter(id__gt=self._last_id).order_by('id').values_list('id', 'email')
+            for row_id, email in rows.iterator(chunk_size=10000):
+                self.addresses.add(address_key(email))
+                self._last_id = row_id
+                added += 1
+        return added
+
+    def add(self, email, reason='manual', campaign=None, detail='', source_message_id=''):
+        """Suppress an address; returns ``(SuppressedAddress, created)``"""
+        entry, created = SuppressedAddress.objects.get_or_create(
+            email=normalize(email),
+            defaults={
+                'reason': reason,
+                'campaign': campaign,
+                'detail': detail,
+                'source_message_id': source_message_id,
+            }
+        )
+        self.addresses.add(address_key(entry.email))
+        if created:
+            logger.info("Suppressed %s (%s)", entry.email, reason, extra={'reason': reason})
+        return entry, created
+
+    def remove(self, email):
+        SuppressedAddress.objects.filter(email=normalize(email)).delete()
+        self.addresses.discard(address_key(email))
+
+    def partition(self, recipients):
+        """Split recipients into ``(sendable, suppressed)`` lists"""
+        sendable, suppressed = [], []
+        for recipient in recipients:
+            (suppressed if recipient.email in self else sendable).append(recipient)
+        return sendable, suppressed
+
+
+_suppression_list = None
+_suppression_lock = threading.Lock()
+
+
+def get_suppression_list():
+    """Return the process-wide SuppressionList, loading it on first use"""
+    global _suppression_list
+    with _suppression_lock:
+        if _suppression_list is None:
+            suppression_list = SuppressionList()
+            suppression_list.refresh()
+            logger.info("Loaded %s suppressed addresses", len(suppression_list))
+            _suppression_list = suppression_list
+        return _suppression_list
+
+
+def reset_suppression_list():
+    """Drop the loaded list so the next use reloads it from the database"""
+    global _suppression_list
+    with _suppression_lock:
+        _suppression_list = None
+
+
+def is_suppressed(email):
+    return email in get_suppression_list()
+
+
+def suppress(email, reason='manual', campaign=None, detail='', source_message_id=''):
+    return get_suppression_list().add(email, reason, campaign, detail, source_message_id)
+
+
+def unsubscribe_token(email):
+    return signing.dumps(normalize(email), salt=UNSUBSCRIBE_SALT)
+
+
+def email_from_token(token):
+    """The address an unsubscribe token was made for; raises signing.BadSignature"""
+    return signing.loads(token, salt=UNSUBSCRIBE_SALT)
+
+
+def unsubscribe_url(email):
+    """Absolute unsubscribe link, or None without MAILER_PUBLIC_URL"""
+    base_url = getattr(settings, 'MAILER_PUBLIC_URL', '')
+    if not base_url:
+        return None
+    return base_url.rstrip('/') + reverse('unsubscribe', kwargs={'token': unsubscribe_token(email)})
+
+
+def unsubscribe_headers(email):
+    """List-Unsubscribe headers with RFC 8058 one-click support"""
+    url = unsubscribe_url(email)
+    if url is None:
+        return {}
+    return {
+        'List-Unsubscribe': f'<{url}>',
+        'List-Unsubscribe-Post': 'List-Unsubscribe=One-Click',
+    }
@@ -1,3 +1,720 @@
-from django.test import TestCase
+import asyncio
+import base64
+import itertools
+import json
+import smtplib
+import threading
+import time
+from datetime import timedelta
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+import httplib2
+from django.core import signing
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from googleapiclient.errors import HttpError
+
+from . import services
+from .accounts import QuotaTracker, plan_sends, shard_recipients
+from .audiences import (
+    MemberRow, add_members, audience_delivery_chunks, clone_campaign, pending_audience_members, record_delivery,
+    recipient_for_reply
+)
+from .autogen_service import AutoGenEmailGenerator, EmailStream, EmailStreamParser
+from .benchmarks.fakes import FakeGmailService
+from .bounces import parse_bounce
+from .models import (
+    Audience, EmailAccount, EmailCampaign, EmailReply, GeneratedEmail, ProcessedBounce, Recipient, SuppressedAddress
+)
+from .reply_budget import RECIPIENT_BUDGET, THREAD_BUDGET, ReplyBudget
+from .reply_classifier import AUTO_REPLY, BOUNCE, HUMAN, REVIEW, UNSUBSCRIBE, classify
+from .reply_cleaner import _get_encoding, clean_reply, count_tokens, truncate_to_tokens
+from .send_engine import DeliveryEngine, unsent_recipient_chunks, unsent_recipient_count
+from .suppression import AddressSet, email_from_token, reset_suppression_list, unsubscribe_token
+from .variants import save_variants, variant_for, variant_index
+
+
+class CleanReplyTests(SimpleTestCase):
+    def test_removes_quoted_history_and_signature(self):
+        text = (
+            "Sounds good, let's talk on Friday.\n"
+            "\n"
+            "Best regards,\n"
+            "Jane Doe\n"
+            "Head of Marketing\n"
+            "\n"
+            "On Mon, Jan 6, 2025 at 10:00 AM Sales <sales@example.com> wrote:\n"
+            "> Would you like a demo?"
+        )
+        self.assertEqual(clean_reply(text), "Sounds good, let's talk on Friday.")
+
+    def test_keeps_questions_after_an_opening_thanks(self):
+        text = (
+            "Hi Sowjanya,\n"
+            "Thanks!\n"
+            "Could you send the pricing for 50 seats?\n"
+            "Also what is the contract length?"
+        )
+        self.assertEqual(clean_reply(text), text)
+
+    def test_keeps_sentences_after_a_valediction(self):
+        text = "Thanks\nI will forward this to our finance team today."
+        self.assertEqual(clean_reply(text), text)
+
+    def test_keeps_a_reply_that_is_only_thanks(self):
+        self.assertEqual(clean_reply("Thanks!"), "Thanks!")
+
+    def test_cuts_at_signature_delimiter_and_device_footer(self):
+        self.assertEqual(clean_reply("Yes please.\n-- \nJane"), "Yes please.")
+        self.assertEqual(clean_reply("Yes please.\nSent from my iPhone"), "Yes please.")
+
+
+class TokenCountTests(SimpleTestCase):
+    def setUp(self):
+        _get_encoding.cache_clear()
+        self.addCleanup(_get_encoding.cache_clear)
+
+    def test_unreachable_fallback_tokenizer_estimates(self):
+        with mock.patch('tiktoken.get_encoding', side_effect=ConnectionError("offline")):
+            self.assertEqual(count_tokens("x" * 10, 'llama-3'), 3)
+            self.assertEqual(truncate_to_tokens("x" * 10, 2, 'llama-3'), "x" * 8)
+
+
+class ReplyClassifierTests(SimpleTestCase):
+    def assertClassified(self, label, *texts, **kwargs):
+        for text in texts:
+            with self.subTest(text=text):
+                self.assertEqual(classify(text, **kwargs).label, label)
+
+    def test_headers(self):
+        self.assertClassified(AUTO_REPLY, "Thanks for your email", headers={'auto-submitted': 'auto-replied'})
+        self.assertClassified(HUMAN, "Thanks for your email", headers={'auto-submitted': 'no'})
+
+    def test_unsubscribe_needs_an_only_line_or_several_signals(self):
+        self.assertClassified(
+            UNSUBSCRIBE,
+            "STOP",
+            "Please unsubscribe me.",
+            "Remove me from your list please",
+            "Not interested. Please stop emailing me.",
+        )
+
+    def test_negated_or_asked_about_unsubscribe_goes_to_a_person(self):
+        self.assertClassified(
+            REVIEW,
+            "Please don't unsubscribe me, I want the pricing sheet.",
+            "If I sign up, can I unsubscribe later?",
+        )
+
+    def test_single_bounce_phrase_goes_to_a_person(self):
+        self.assertClassified(
+            REVIEW,
+            "Our last order could not be delivered on time, can you help?",
+            "The parcel could not be delivered.",
+        )
+
+    def test_bounce_with_several_signals(self):
+        self.assertClassified(BOUNCE, "Delivery has failed to these recipients: 550 5.1.1 recipient address not found.")
+
+    def test_out_of_office(self):
+        self.assertClassified(AUTO_REPLY, "I am currently out of the office and will return on Monday.")
+
+    def test_questions_are_human(self):
+        self.assertClassified(
+            HUMAN,
+            "Thanks, can you send pricing for 50 seats?",
+            "Hi Sowjanya,\nThanks!\nCould you send the pricing for 50 seats?\nAlso what is the contract length?",
+        )
+
+
+class AddressSetTests(SimpleTestCase):
+    def test_add_and_discard(self):
+        addresses = AddressSet()
+        addresses.add(42)
+        addresses.add(42)
+        self.assertIn(42, addresses)
+        self.assertEqual(len(addresses), 1)
+        addresses.discard(42)
+        addresses.discard(42)
+        self.assertNotIn(42, addresses)
+        self.assertEqual(len(addresses), 0)
+
+    def test_grows_and_keeps_every_key(self):
+        addresses = AddressSet(capacity=1)
+        keys = range(1, 5001)
+        for key in keys:
+            addresses.add(key * 0x9E3779B97F4A7C15 % 2 ** 64 or 1)
+        self.assertEqual(len(addresses), 5000)
+        for key in keys:
+            self.assertIn(key * 0x9E3779B97F4A7C15 % 2 ** 64 or 1, addresses)
+
+    def test_discard_shifts_the_rest_of_the_run_back(self):
+        # 8 slots: 8, 16 and 24 all hash to slot 0, 1 to slot 1 (pushed to slot 3)
+        addresses = AddressSet(capacity=4)
+        for key in (8, 16, 24, 1):
+            addresses.add(key)
+        addresses.discard(16)
+        for key in (8, 24, 1):
+            self.assertIn(key, addresses)
+        slots, mask = addresses._table
+        self.assertEqual(list(slots[:4]), [8, 24, 1, 0])
+
+    def test_discard_across_the_end_of_the_table(self):
+        # 7, 15 and 23 all hash to the last slot and wrap around to 0 and 1
+        addresses = AddressSet(capacity=4)
+        for key in (7, 15, 23):
+            addresses.add(key)
+        addresses.discard(7)
+        self.assertIn(15, addresses)
+        self.assertIn(23, addresses)
+        self.assertNotIn(7, addresses)
+
+    def test_lookups_during_growth_take_no_lock(self):
+        addresses = AddressSet(capacity=1)
+        present = range(1, 1001)
+        for key in present:
+            addresses.add(key)
+        misses = []
+        done = threading.Event()
+
+        def write():
+            for key in range(1001, 50001):
+                addresses.add(key)
+            done.set()
+
+        writer = threading.Thread(target=write)
+        writer.start()
+        with addresses._lock:
+            # Readers must not wait for a writer holding the lock
+            self.assertIn(1, addresses)
+        while not done.is_set():
+            misses.extend(key for key in present if key not in addresses)
+        writer.join()
+        self.assertEqual(misses, [])
+        self.assertEqual(len(addresses), 50000)
+
+
+def _encode(text):
+    return base64.urlsafe_b64encode(text.encode('utf-8')).decode('ascii')
+
+
+def _message(headers, parts=()):
+    return {
+        'id': 'bounce-1',
+        'payload': {
+            'mimeType': 'multipart/report',
+            'headers': [{'name': name, 'value': value} for name, value in headers.items()],
+            'parts': list(parts),
+        },
+    }
+
+
+def _dsn(*blocks):
+    report = "Reporting-MTA: dns; mx.example.com\n\n" + "\n\n".join(blocks)
+    return {'mimeType': 'message/delivery-status', 'body': {'data': _encode(report)}}
+
+
+class ParseBounceTests(SimpleTestCase):
+    def test_delivery_status_report(self):
+        message = _message({'Content-Type': 'multipart/report; report-type=delivery-status'}, [
+            {'mimeType': 'text/plain', 'body': {'data': _encode("Delivery failed")}},
+            _dsn(
+                "Final-Recipient: rfc822; Jane@Example.com\nAction: failed\nStatus: 5.1.1\n"
+                "Diagnostic-Code: smtp; 550 5.1.1 user unknown",
+                "Final-Recipient: rfc822; bob@example.com\nAction: delayed\nStatus: 4.4.1",
+                "Final-Recipient: rfc822; carol@example.com\nAction: delivered\nStatus: 2.0.0",
+            ),
+        ])
+        bounces = parse_bounce(message)
+        self.assertEqual([(b.email, b.status, b.permanent) for b in bounces], [
+            ('jane@example.com', '5.1.1', True),
+            ('bob@example.com', '4.4.1', False),
+        ])
+        self.assertEqual(bounces[0].diagnostic, "smtp; 550 5.1.1 user unknown")
+
+    def test_status_part_stored_as_attachment(self):
+        part = {'mimeType': 'message/delivery-status', 'body': {'attachmentId': 'att-1'}}
+        report = "Reporting-MTA: dns; mx\n\nFinal-Recipient: rfc822; jane@example.com\nAction: failed\nStatus: 5.2.2"
+        bounces = parse_bounce(_message({}, [part]), lambda attachment_id: _encode(report))
+        self.assertEqual([(b.email, b.status) for b in bounces], [('jane@example.com', '5.2.2')])
+
+    def test_x_failed_recipients_without_a_status_part(self):
+        message = _message({'X-Failed-Recipients': 'Jane@example.com, bob@example.org'}, [
+            {'mimeType': 'text/plain', 'body': {'data': _encode("Mail delivery failed")}},
+        ])
+        self.assertEqual(
+            [(b.email, b.status) for b in parse_bounce(message)],
+            [('jane@example.com', '5.0.0'), ('bob@example.org', '5.0.0')]
+        )
+
+    def test_not_a_bounce(self):
+        self.assertEqual(parse_bounce(_message({}, [{'mimeType': 'text/plain', 'body': {'data': _encode("Hi")}}])), [])
+
+
+class UnsubscribeTokenTests(SimpleTestCase):
+    def test_round_trip_normalizes_the_address(self):
+        self.assertEqual(email_from_token(unsubscribe_token(" Jane@Example.com ")), "jane@example.com")
+
+    def test_tampered_token_is_rejected(self):
+        token = unsubscribe_token("jane@example.com")
+        with self.assertRaises(signing.BadSignature):
+            email_from_token(token[:-1] + ('A' if token[-1] != 'A' else 'B'))
+
+    def test_token_from_another_salt_is_rejected(self):
+        with self.assertRaises(signing.BadSignature):
+            email_from_token(signing.dumps("jane@example.com"))
+
+
+class RecordBouncesTests(TestCase):
+    def setUp(self):
+        reset_suppression_list()
+        self.addCleanup(reset_suppression_list)
+        self.campaign = EmailCampaign.objects.create(name="c", topic="t", details="d")
+        self.service = FakeGmailService()
+        self.downloads = 0
+
+    def _serve(self, message):
+        def get_message(message_id):
+            self.downloads += 1
+            return message
+        self.service.get_message = get_message
+
+    def test_transient_bounce_is_downloaded_once(self):
+        self._serve(_message({}, [_dsn("Final-Recipient: rfc822; bob@example.com\nAction: delayed\nStatus: 4.4.1")]))
+        self.assertEqual(self.service._record_bounces(self.campaign, 'bounce-1'), 0)
+        self.assertEqual(self.service._record_bounces(self.campaign, 'bounce-1'), 0)
+        self.assertEqual(self.downloads, 1)
+        self.assertFalse(SuppressedAddress.objects.exists())
+        self.assertEqual(ProcessedBounce.objects.get().suppressed, 0)
+
+    def test_permanent_bounce_suppresses_once(self):
+        self._serve(_message({}, [_dsn("Final-Recipient: rfc822; jane@example.com\nAction: failed\nStatus: 5.1.1")]))
+        self.assertEqual(self.service._record_bounces(self.campaign, 'bounce-1'), 1)
+        self.assertEqual(self.service._record_bounces(self.campaign, 'bounce-1'), 0)
+        self.assertEqual(self.downloads, 1)
+        self.assertEqual(SuppressedAddress.objects.get().email, 'jane@example.com')
+
+
+class EmailStreamParserTests(SimpleTestCase):
+    def stream(self, text, size):
+        parser = EmailStreamParser()
+        events = []
+        for start in range(0, len(text), size):
+            events.extend(parser.feed(text[start:start + size]))
+        events.extend(parser.close())
+        return events
+
+    def test_events_add_up_to_the_saved_email(self):
+        text = (
+            "  Subject: First draft  \n\n---\n"
+            "Hi there,   \n\n   We have news.\n---\n"
+            "Subject: Launch day\nSee you soon.  "
+        )
+        # AutoGenEmailGenerator.__init__ connects to the LLM; _format_email needs none of it
+        saved = AutoGenEmailGenerator.__new__(AutoGenEmailGenerator)._format_email(text)
+        for size in (1, 3, len(text)):
+            with self.subTest(size=size):
+                events = self.stream(text, size)
+                subjects = [data['subject'] for kind, data in events if kind == 'subject']
+                body = "".join(data['text'] for kind, data in events if kind == 'body')
+                self.assertEqual(subjects, ["First draft", "Launch day"])
+                self.assertEqual(subjects[-1], saved['subject'])
+                self.assertEqual(body, saved['body_text'])
+
+    def test_missing_subject_falls_back_like_the_saved_email(self):
+        events = self.stream("Just a body.", 4)
+        self.assertEqual(events, [('body', {'text': "Just a body."}), ('subject', {'subject': "Important Update"})])
+
+    def test_blank_subject_falls_back_like_the_saved_email(self):
+        events = self.stream("Subject:   \n---\nBody.", 4)
+        self.assertEqual(events, [('subject', {'subject': "Important Update"}), ('body', {'text': "Body."})])
+
+
+class SlowGenerator:
+    """Email generator whose completions take ``delays[topic]`` seconds"""
+
+    def __init__(self, delays):
+        self.delays = delays
+
+    async def acomplete_email(self, context):
+        await asyncio.sleep(self.delays[context['purpose']])
+        return {'subject': context['purpose'], 'body_text': "Body", 'body_html': "<p>Body</p>"}
+
+
+class SlowStreamGenerator:
+    """Email generator that writes the subject, then stalls before the body"""
+
+    def astream_email(self, context):
+        async def chunks():
+            yield "Subject: Hello\n---\n"
+            await asyncio.sleep(1.0)
+            yield "Body."
+        return EmailStream(chunks(), AutoGenEmailGenerator.__new__(AutoGenEmailGenerator)._format_email)
+
+
+async def timed_events(response, started):
+    """``(seconds since started, event type, data)`` of a text/event-stream response"""
+    arrivals = []
+    async for chunk in response.streaming_content:
+        if chunk.startswith(b'id:'):
+            lines = dict(line.split(': ', 1) for line in chunk.decode().strip().split('\n'))
+            arrivals.append((time.monotonic() - started, lines['event'], json.loads(lines['data'])))
+    return arrivals
+
+
+class StreamGenerateContentTests(TestCase):
+    def setUp(self):
+        self.campaign = EmailCampaign.objects.create(name="c", topic="t", details="d")
+
+    async def test_subject_arrives_before_the_body_is_written(self):
+        with services.override('email_generator', SlowStreamGenerator):
+            started = time.monotonic()
+            response = await self.async_client.post(f'/api/campaigns/{self.campaign.id}/generate_content/?stream=1')
+            arrivals = await timed_events(response, started)
+
+        self.assertEqual([event for _, event, _ in arrivals], ['subject', 'body', 'done'])
+        self.assertLess(arrivals[0][0], 0.5)
+        self.assertEqual(arrivals[-1][2]['body_text'], "Body.")
+
+
+class BulkGenerateTests(TestCase):
+    def setUp(self):
+        self.fast = EmailCampaign.objects.create(name="fast", topic="fast", details="d")
+        self.slow = EmailCampaign.objects.create(name="slow", topic="slow", details="d")
+
+    async def test_first_result_arrives_before_the_slowest_campaign_finishes(self):
+        generator = SlowGenerator({'fast': 0.05, 'slow': 1.0})
+        with services.override('email_generator', lambda: generator):
+            started = time.monotonic()
+            response = await self.async_client.post(
+                '/api/campaigns/bulk_generate/', {'campaign_ids': [self.slow.id, self.fast.id]},
+                content_type='application/json'
+            )
+            self.assertEqual(response.status_code, 200)
+            arrivals = await timed_events(response, started)
+
+        (first_at, _, first), (_, _, second), (_, _, done) = arrivals
+        self.assertEqual(first['campaign_id'], self.fast.id)
+        self.assertEqual(first['generated_email']['subject'], "fast")
+        self.assertLess(first_at, 0.5)
+        self.assertEqual(second['campaign_id'], self.slow.id)
+        self.assertEqual(done, {'generated': 2, 'failed': 0})
+
+
+class AudienceTests(TestCase):
+    def setUp(self):
+        self.audience = Audience.objects.create(name="List")
+        add_members(self.audience, [("Ann@Example.com", "Ann"), ("bob@example.com", "Bob"), ("cy@example.com", "Cy")])
+        self.ann, self.bob, self.cy = self.audience.members.order_by('id')
+        self.campaign = EmailCampaign.objects.create(name="c", topic="t", details="d", audience=self.audience)
+        self.account = EmailAccount.objects.create(email="sender@example.com", daily_quota=10)
+
+    def deliver(self, member, state='sent'):
+        record_delivery(self.campaign, MemberRow(member.id, member.email), state, sent_at=timezone.now(), account=self.account)
+
+    def test_members_are_lowercased_and_listed_once(self):
+        self.assertEqual(add_members(self.audience, [("ANN@example.com", "Ann"), ("dee@example.com", "")]), 1)
+        self.assertEqual(self.ann.email, "ann@example.com")
+        self.assertEqual(self.audience.members.count(), 4)
+
+    def test_only_sent_deliveries_leave_the_send_queue(self):
+        self.deliver(self.ann)
+        self.deliver(self.bob, state='failed')
+        Recipient.objects.create(campaign=self.campaign, email="own@example.com")
+        chunks = list(unsent_recipient_chunks(self.campaign, chunk_size=2))
+        self.assertEqual(
+            [[row.email for row in chunk] for chunk in chunks],
+            [["bob@example.com"], ["cy@example.com"], ["own@example.com"]]
+        )
+        self.assertEqual(pending_audience_members(self.campaign), 2)
+        self.assertEqual(unsent_recipient_count(self.campaign), 3)
+        self.assertEqual([row.email for row in next(audience_delivery_chunks(self.campaign))], ["bob@example.com", "cy@example.com"])
+
+    def test_reply_recipient_counts_once(self):
+        self.deliver(self.ann)
+        self.assertIsNone(recipient_for_reply(self.campaign, "bob@example.com"))
+        recipient = recipient_for_reply(self.campaign, "ANN@example.com")
+        self.assertEqual((recipient.member, recipient.account), (self.ann, self.account))
+        self.assertEqual(recipient_for_reply(self.campaign, "ann@example.com"), recipient)
+        self.assertEqual(QuotaTracker([self.account]).remaining[self.account.id], 9)
+        self.assertEqual(unsent_recipient_count(self.campaign), 2)
+
+    def test_clone_shares_the_audience(self):
+        GeneratedEmail.objects.create(campaign=self.campaign, subject="S", body_text="B", body_html="<p>B</p>")
+        clone = clone_campaign(self.campaign)
+        self.assertEqual(clone.audience, self.audience)
+        self.assertEqual(clone.generated_email.subject, "S")
+        self.assertFalse(clone.recipients.exists())
+
+    def test_clone_copies_own_recipients_next_to_the_audience(self):
+        self.deliver(self.ann)
+        recipient_for_reply(self.campaign, "ann@example.com")
+        Recipient.objects.create(campaign=self.campaign, email="own@example.com", is_sent=True)
+        clone = clone_campaign(self.campaign)
+        self.assertEqual(clone.audience, self.audience)
+        self.assertEqual(list(clone.recipients.values_list('email', 'is_sent')), [("own@example.com", False)])
+        self.assertEqual(unsent_recipient_count(clone), 4)
+
+    def test_clone_makes_own_recipients_an_audience(self):
+        campaign = EmailCampaign.objects.create(name="own", topic="t", details="d")
+        Recipient.objects.create(campaign=campaign, email="own@example.com", name="Own")
+        clone = clone_campaign(campaign)
+        self.assertNotEqual(clone.audience, None)
+        self.assertEqual(list(clone.audience.members.values_list('email', 'name')), [("own@example.com", "Own")])
+        self.assertIsNone(EmailCampaign.objects.get(id=campaign.id).audience)
+
+
+def recipients(*emails):
+    return [SimpleNamespace(email=email) for email in emails]
+
+
+# Pacing out of the way unless a test is about it
+FAST_DOMAINS = {'default': {'concurrency': 1, 'rate_per_second': 0}}
+
+
+class DeliveryEngineTests(SimpleTestCase):
+    def deliver(self, engine, assignments, send):
+        results = []
+        engine.deliver(assignments, send, lambda recipient, account, result, error: results.append((recipient, result, error)))
+        return results
+
+    @override_settings(MAILER_DOMAIN_LIMITS=FAST_DOMAINS)
+    def test_domains_take_turns(self):
+        order = []
+
+        def send(recipient, account):
+            order.append(recipient.email.split('@')[1])
+
+        batch = recipients(*(f"{i}@big.com" for i in range(6)), "1@small.com", "2@small.com")
+        results = self.deliver(DeliveryEngine(workers=1), [(recipient, None) for recipient in batch], send)
+        self.assertEqual(len(results), 8)
+        self.assertEqual(order[:4], ["big.com", "small.com", "big.com", "small.com"])
+
+    @override_settings(MAILER_DOMAIN_LIMITS={'default': {'concurrency': 2, 'rate_per_second': 0}})
+    def test_domain_concurrency_is_capped(self):
+        lock = threading.Lock()
+        running = [0, 0]
+
+        def send(recipient, account):
+            with lock:
+                running[0] += 1
+                running[1] = max(running)
+            time.sleep(0.02)
+            with lock:
+                running[0] -= 1
+
+        batch = recipients(*(f"{i}@example.com" for i in range(10)))
+        self.deliver(DeliveryEngine(workers=8), [(recipient, None) for recipient in batch], send)
+        self.assertEqual(running[1], 2)
+
+    @override_settings(MAILER_DOMAIN_LIMITS={'default': {'concurrency': 4, 'rate_per_second': 20}})
+    def test_domain_rate_is_capped(self):
+        starts = []
+
+        def send(recipient, account):
+            starts.append(time.monotonic())
+
+        batch = recipients(*(f"{i}@example.com" for i in range(5)))
+        self.deliver(DeliveryEngine(workers=8), [(recipient, None) for recipient in batch], send)
+        # Four gaps of 1/20s
+        self.assertGreaterEqual(max(starts) - min(starts), 0.18)
+
+    @override_settings(MAILER_DOMAIN_LIMITS=FAST_DOMAINS)
+    def test_throttled_recipient_is_retried_until_max_attempts(self):
+        attempts = {}
+
+        def send(recipient, account):
+            attempts[recipient.email] = attempts.get(recipient.email, 0) + 1
+            if recipient.email == "stuck@example.com" or attempts[recipient.email] == 1:
+                raise smtplib.SMTPResponseException(421, b"Try again later")
+            return "sent"
+
+        engine = DeliveryEngine(workers=2, max_attempts=3, backoff=0.01, backoff_max=0.02)
+        batch = recipients("stuck@example.com", "late@example.com")
+        results = {recipient.email: (result, error) for recipient, result, error in self.deliver(engine, [(recipient, None) for recipient in batch], send)}
+        self.assertEqual(attempts, {"stuck@example.com": 3, "late@example.com": 2})
+        self.assertEqual(results["late@example.com"], ("sent", None))
+        self.assertIsNone(results["stuck@example.com"][0])
+        self.assertEqual(results["stuck@example.com"][1].smtp_code, 421)
+
+    @override_settings(MAILER_DOMAIN_LIMITS=FAST_DOMAINS)
+    def test_paused_account_does_not_hold_up_other_accounts(self):
+        throttled, other = SimpleNamespace(pk=1), SimpleNamespace(pk=2)
+        started = time.monotonic()
+        finished = {}
+
+        def send(recipient, account):
+            if account is throttled and recipient.email not in finished:
+                finished[recipient.email] = None
+                raise HttpError(httplib2.Response({'status': 429}), b'{}')
+            finished[recipient.email] = time.monotonic() - started
+            return "sent"
+
+        batch = recipients("a@example.com", "b@example.com", "c@example.com")
+        assignments = [(batch[0], throttled), (batch[1], other), (batch[2], other)]
+        results = self.deliver(DeliveryEngine(workers=1, account_backoff=1.0), assignments, send)
+        self.assertEqual([error for _, _, error in results], [None] * 3)
+        self.assertLess(finished["c@example.com"], 0.5)
+        self.assertGreaterEqual(finished["a@example.com"], 1.0)
+
+    @override_settings(MAILER_DOMAIN_LIMITS={'default': {'concurrency': 2, 'rate_per_second': 0}})
+    def test_every_recipient_is_delivered_past_the_buffer(self):
+        batch = recipients(*(f"{i}@{('a', 'b', 'c')[i % 3]}.com" for i in range(25)))
+        results = self.deliver(DeliveryEngine(workers=4, buffer=4), ((recipient, None) for recipient in batch), lambda recipient, account: "sent")
+        self.assertCountEqual([recipient.email for recipient, _, _ in results], [recipient.email for recipient in batch])
+
+
+@override_settings(MAILER_REPLY_BUDGET_PER_THREAD=2, MAILER_REPLY_BUDGET_PER_RECIPIENT=3, MAILER_REPLY_BUDGET_WINDOW_HOURS=24)
+class ReplyBudgetTests(TestCase):
+    def setUp(self):
+        self.campaign = EmailCampaign.objects.create(name="c", topic="t", details="d")
+        self.ann = Recipient.objects.create(campaign=self.campaign, email="ann@example.com")
+        self.bob = Recipient.objects.create(campaign=self.campaign, email="bob@example.com")
+        self.ids = itertools.count(1)
+
+    def reply(self, recipient, thread, hours_ago=None):
+        """A reply in ``thread``; answered ``hours_ago`` when given"""
+        return EmailReply.objects.create(
+            campaign=self.campaign, recipient=recipient, original_message_id=thread,
+            reply_message_id=f"reply-{next(self.ids)}", reply_content="Hi",
+            replied_at=timezone.now() - timedelta(hours=hours_ago) if hours_ago is not None else None
+        )
+
+    def test_thread_budget_runs_out(self):
+        self.reply(self.ann, "t1", hours_ago=1)
+        self.reply(self.ann, "t1", hours_ago=2)
+        budget = ReplyBudget(self.campaign)
+        self.assertEqual(budget.reserve(self.reply(self.ann, "t1")), THREAD_BUDGET)
+        self.assertIsNone(budget.reserve(self.reply(self.ann, "t2")))
+
+    def test_recipient_budget_runs_out(self):
+        for thread in ("t1", "t2", "t3"):
+            self.reply(self.ann, thread, hours_ago=1)
+        budget = ReplyBudget(self.campaign)
+        self.assertEqual(budget.reserve(self.reply(self.ann, "t4")), RECIPIENT_BUDGET)
+        self.assertIsNone(budget.reserve(self.reply(self.bob, "t5")))
+
+    def test_replies_outside_the_window_do_not_count(self):
+        self.reply(self.ann, "t1", hours_ago=25)
+        self.reply(self.ann, "t1", hours_ago=30)
+        self.reply(self.ann, "t1")
+        self.assertIsNone(ReplyBudget(self.campaign).reserve(self.reply(self.ann, "t1")))
+
+    def test_one_batch_shares_the_budget(self):
+        self.reply(self.ann, "t1", hours_ago=1)
+        budget = ReplyBudget(self.campaign)
+        first, second = self.reply(self.ann, "t1"), self.reply(self.ann, "t1")
+        self.assertIsNone(budget.reserve(first))
+        self.assertEqual(budget.reserve(second), THREAD_BUDGET)
+
+    @override_settings(MAILER_REPLY_BUDGET_PER_THREAD=None)
+    def test_none_disables_a_cap(self):
+        for _ in range(3):
+            self.reply(self.ann, "t1", hours_ago=1)
+        self.assertEqual(ReplyBudget(self.campaign).reserve(self.reply(self.ann, "t1")), RECIPIENT_BUDGET)
+
+
+class QuotaTests(TestCase):
+    def setUp(self):
+        self.campaign = EmailCampaign.objects.create(name="c", topic="t", details="d")
+        self.big = EmailAccount.objects.create(email="big@example.com", daily_quota=3)
+        self.small = EmailAccount.objects.create(email="small@example.com", daily_quota=1)
+
+    def sent(self, account, hours_ago, **fields):
+        return Recipient.objects.create(
+            campaign=self.campaign, email=f"{account.id}-{hours_ago}@example.org", is_sent=True,
+            account=account, sent_at=timezone.now() - timedelta(hours=hours_ago), **fields
+        )
+
+    def test_usage_is_counted_over_the_last_day(self):
+        self.sent(self.big, hours_ago=1)
+        self.sent(self.big, hours_ago=25)
+        audience = Audience.objects.create(name="List")
+        add_members(audience, [("member@example.org", "")])
+        member = audience.members.get()
+        self.campaign.audience = audience
+        self.campaign.save()
+        record_delivery(self.campaign, MemberRow(member.id, member.email), 'sent', sent_at=timezone.now(), account=self.small)
+        tracker = QuotaTracker([self.big, self.small])
+        self.assertEqual(tracker.remaining, {self.big.id: 2, self.small.id: 0})
+        # A member's reply Recipient repeats their delivery and uses no more quota
+        recipient_for_reply(self.campaign, member.email)
+        self.assertEqual(QuotaTracker([self.big, self.small]).remaining, {self.big.id: 2, self.small.id: 0})
+
+    def test_recipients_are_split_by_remaining_quota(self):
+        tracker = QuotaTracker([self.big, self.small])
+        assignments, deferred = shard_recipients(["r1", "r2", "r3", "r4", "r5"], tracker)
+        self.assertEqual([recipient for recipient, _ in assignments], ["r1", "r2", "r3", "r4"])
+        self.assertCountEqual(
+            [account.email for _, account in assignments],
+            ["big@example.com", "big@example.com", "big@example.com", "small@example.com"]
+        )
+        self.assertEqual(deferred, ["r5"])
+        self.assertEqual(tracker.remaining, {self.big.id: 0, self.small.id: 0})
+
+    def test_later_chunks_are_deferred_once_quota_runs_out(self):
+        first = plan_sends(["r1", "r2", "r3"])
+        self.assertEqual((len(first.assignments), first.deferred), (3, []))
+        second = plan_sends(["r4", "r5"], first.tracker)
+        self.assertEqual((len(second.assignments), second.deferred), (1, ["r5"]))
+
+    def test_inactive_accounts_do_not_send(self):
+        self.small.is_active = False
+        self.small.save()
+        plan = plan_sends(["r1", "r2"])
+        self.assertEqual({account.email for _, account in plan.assignments}, {"big@example.com"})
+        self.big.is_active = False
+        self.big.save()
+        self.assertEqual(plan_sends(["r1"]).assignments, [("r1", None)])
+
+
+def variant_email(subject):
+    return {'subject': subject, 'body_text': "Body", 'body_html': "<p>Body</p>"}
+
+
+class VariantForTests(SimpleTestCase):
+    def test_an_address_always_gets_the_same_variant(self):
+        # Only the normalized address and the number of variants count
+        index = variant_index("ann@example.com", 3)
+        self.assertEqual(variant_index(" Ann@Example.com ", 3), index)
+        self.assertEqual(variant_for("ann@example.com", ["A", "B", "C"]), "ABC"[index])
+        self.assertEqual(variant_for("ann@example.com", ["X", "Y", "Z"]), "XYZ"[index])
+
+    def test_split_is_roughly_even(self):
+        counts = [0, 0, 0]
+        for i in range(3000):
+            counts[variant_index(f"user{i}@example.com", 3)] += 1
+        for count in counts:
+            self.assertAlmostEqual(count, 1000, delta=100)
+
+
+class VariantsTests(TestCase):
+    def setUp(self):
+        self.campaign = EmailCampaign.objects.create(name="c", topic="t", details="d")
+        self.url = f'/api/campaigns/{self.campaign.id}/variants/'
+
+    def test_saving_no_variants_is_refused(self):
+        with self.assertRaises(ValueError):
+            save_variants(self.campaign, [])
+
+    def test_first_variant_becomes_the_generated_email(self):
+        save_variants(self.campaign, [variant_email("A"), variant_email("B")])
+        self.assertEqual(list(self.campaign.variants.values_list('index', 'subject')), [(0, "A"), (1, "B")])
+        self.assertEqual(GeneratedEmail.objects.get(campaign=self.campaign).subject, "A")
+
+    def test_variants_are_locked_once_sending_started(self):
+        save_variants(self.campaign, [variant_email("A"), variant_email("B")])
+        recipient = Recipient.objects.create(campaign=self.campaign, email="ann@example.com")
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+        recipient.is_sent = True
+        recipient.save()
+        self.assertEqual(self.client.post(self.url, {'count': 2}, content_type='application/json').status_code, 409)
+        self.assertEqual(self.client.delete(self.url).status_code, 409)
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+        self.assertEqual(self.campaign.variants.count(), 2)
+
+    def test_variants_can_be_dropped_before_sending(self):
+        save_variants(self.campaign, [variant_email("A"), variant_email("B")])
+        self.assertEqual(self.client.delete(self.url).status_code, 204)
+        self.assertFalse(self.campaign.variants.exists())
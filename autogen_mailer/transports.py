@@ -0,0 +1,329 @@
+"""Outgoing mail transports, selected with the MAILER_TRANSPORT setting.
+
+- ``gmail``: one Gmail API call per message (the default).
+- ``smtp``: a pool of persistent, authenticated SMTP connections, each
+  reused for many messages.
+- ``file``: writes messages to a local Maildir, for load tests and offline
+  end-to-end runs.
+
+Every transport returns ``{'id': ..., 'threadId': ...}`` like the Gmail API.
+"""
+import contextlib
+import json
+import logging
+import mailbox
+import os
+import queue
+import smtplib
+import ssl
+import threading
+import time
+from email.utils import make_msgid
+
+from django.conf import settings
+
+from . import profiling, services
+from .mime_utils import build_message
+
+logger = logging.getLogger(__name__)
+
+
+class Transport:
+    """Base class: builds the MIME message and hands it to ``send_message``"""
+    name = None
+
+    def __init__(self, sender):
+        # Sender used when the caller has none of its own
+        self.sender = sender
+
+    def send_email(self, sender, to, subject, body_text, body_html=None, attachments=None, headers=None):
+        """Send an email with optional attachments"""
+        return self.send_message(build_message(sender, to, subject, body_text, body_html, attachments, headers))
+
+    def send_message(self, message):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class GmailTransport(Transport):
+    """Send through the Gmail API of the default mailbox or an EmailAccount.
+
+    googleapiclient's HTTP client is not thread-safe, so every call checks
+    a client out of a pool and puts it back afterwards. Clients live as
+    long as the transport, which is process-wide (``get_transport``), so a
+    mailbox authenticates once per pooled client rather than once per send
+    thread and campaign. Clients are built one at a time: the first one
+    refreshes and saves an expired token, and the rest load the fresh one.
+    """
+    name = 'gmail'
+
+    def __init__(self, account=None):
+        self.account = account
+        # Most recently used first, like the SMTP pool
+        self._idle = queue.LifoQueue()
+        self._building = threading.Lock()
+
+    @contextlib.contextmanager
+    def client(self, interactive=True):
+        """Check a GmailService out of the pool, authenticating a new one if none is idle"""
+        try:
+            service = self._idle.get_nowait()
+        except queue.Empty:
+            with self._building:
+                # Authenticating can prompt or hit the network; only do it when needed
+                service = services.create('gmail', account=self.account, interactive=interactive)
+        try:
+            yield service
+        finally:
+            self._idle.put(service)
+
+    def connect(self):
+        """Authenticate a pooled client from stored credentials only"""
+        if self._idle.empty():
+            with self.client(interactive=False):
+                pass
+
+    @property
+    def sender(self):
+        with self.client() as service:
+            return service.get_hardcoded_user_email()
+
+    def send_message(self, message):
+        with self.client() as service:
+            return service.send_message(message)
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait()
+            except queue.Empty:
+                return
+
+
+class _PooledConnection:
+    def __init__(self, smtp):
+        self.smtp = smtp
+        self.sent = 0
+
+    def close(self):
+        try:
+            self.smtp.quit()
+        except (smtplib.SMTPException, OSError):
+            self.smtp.close()
+
+
+class SMTPTransport(Transport):
+    """SMTP over a pool of up to ``pool_size`` persistent connections.
+
+    Each connection is logged in once and then reused for up to
+    ``max_messages`` messages, saving the TCP, TLS and AUTH round trips a
+    fresh connection costs. A connection the server dropped while idle is
+    replaced and the message retried once. ``token_provider`` switches
+    AUTH to XOAUTH2 with the access token it returns.
+    """
+    name = 'smtp'
+
+    def __init__(self, host, port, sender, username=None, password=None, use_tls=True,
+                 use_ssl=False, pool_size=4, max_messages=100, timeout=30, token_provider=None):
+        super().__init__(sender=sender)
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.use_tls = use_tls
+        self.use_ssl = use_ssl
+        self.max_messages = max_messages
+        self.timeout = timeout
+        self.token_provider = token_provider
+        # Most recently used first: the connection least likely to have timed out
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(pool_size)
+
+    def _connect(self):
+        if self.use_ssl:
+            smtp = smtplib.SMTP_SSL(self.host, self.port, timeout=self.timeout,
+                                    context=ssl.create_default_context())
+        else:
+            smtp = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        try:
+            if self.use_tls and not self.use_ssl:
+                smtp.starttls(context=ssl.create_default_context())
+            if self.token_provider is not None:
+                smtp.ehlo()
+                auth_string = f"user={self.username}\1auth=Bearer {self.token_provider()}\1\1"
+                # On failure the server sends a challenge that must be answered empty
+                smtp.auth('XOAUTH2', lambda challenge=None: "" if challenge else auth_string)
+            elif self.username:
+                smtp.login(self.username, self.password)
+        except Exception:
+            smtp.close()
+            raise
+        return _PooledConnection(smtp)
+
+    def _checkout(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            return self._connect()
+
+    def _checkin(self, connection):
+        connection.sent += 1
+        if connection.sent >= self.max_messages:
+            connection.close()
+        else:
+            self._idle.put(connection)
+
+    def send_message(self, message):
+        if 'Message-ID' not in message:
+            sender = str(message['from'] or self.sender)
+            message['Message-ID'] = make_msgid(domain=sender.rpartition('@')[2] if '@' in sender else None)
+        started = time.monotonic()
+        self._slots.acquire()
+        try:
+            connection = self._checkout()
+            try:
+                try:
+                    connection.smtp.send_message(message)
+                except smtplib.SMTPServerDisconnected:
+                    # Dropped by the server while idle; retry once on a fresh connection
+                    connection = self._connect()
+                    connection.smtp.send_message(message)
+            except (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused, smtplib.SMTPDataError):
+                # The session is still good; reset it for the next message
+                try:
+                    connection.smtp.rset()
+                    self._idle.put(connection)
+                except (smtplib.SMTPException, OSError):
+                    connection.close()
+                raise
+            except Exception:
+                connection.close()
+                raise
+            self._checkin(connection)
+        finally:
+            self._slots.release()
+            profiling.record('http', time.monotonic() - started)
+        logger.info("Email sent to %s over SMTP with message ID: %s", message['to'], message['Message-ID'])
+        return {'id': message['Message-ID'], 'threadId': ''}
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+class FileSinkTransport(Transport):
+    """Store messages in a local Maildir instead of sending them"""
+    name = 'file'
+
+    def __init__(self, directory, sender):
+        super().__init__(sender=sender)
+        self.maildir = mailbox.Maildir(directory, create=True)
+        self._lock = threading.Lock()
+
+    def send_message(self, message):
+        with self._lock:
+            key = self.maildir.add(message)
+        logger.debug("Email to %s written to %s", message['to'], key)
+        return {'id': key, 'threadId': ''}
+
+
+def _oauth_token_provider(account):
+    """Access tokens for XOAUTH2 from the account's stored Gmail credentials"""
+    from google.auth.transport.requests import Request
+    from google.oauth2.credentials import Credentials
+
+    credentials = Credentials.from_authorized_user_info(json.loads(account.oauth_token))
+    lock = threading.Lock()
+
+    def token():
+        with lock:
+            if not credentials.valid:
+                credentials.refresh(Request())
+            return credentials.token
+    return token
+
+
+def build_transport(account=None):
+    """Create the MAILER_TRANSPORT transport for an account (None: the default sender)"""
+    name = getattr(settings, 'MAILER_TRANSPORT', 'gmail')
+    default_sender = getattr(settings, 'DEFAULT_FROM_EMAIL', 'your-email@example.com')
+    if name == 'gmail':
+        return GmailTransport(account)
+    if name == 'smtp':
+        options = {
+            'pool_size': getattr(settings, 'MAILER_SMTP_POOL_SIZE', 4),
+            'max_messages': getattr(settings, 'MAILER_SMTP_MAX_MESSAGES_PER_CONNECTION', 100),
+        }
+        if account is None:
+            return SMTPTransport(
+                settings.EMAIL_HOST, settings.EMAIL_PORT,
+                sender=getattr(settings, 'EMAIL_HOST_USER', '') or default_sender,
+                username=getattr(settings, 'EMAIL_HOST_USER', None),
+                password=getattr(settings, 'EMAIL_HOST_PASSWORD', None),
+                use_tls=getattr(settings, 'EMAIL_USE_TLS', False),
+                use_ssl=getattr(settings, 'EMAIL_USE_SSL', False),
+                **options
+            )
+        # use_ssl means an encrypted session: implicit TLS on 465, STARTTLS elsewhere
+        implicit_tls = account.use_ssl and account.smtp_port == 465
+        return SMTPTransport(
+            account.smtp_server, account.smtp_port,
+            sender=account.email,
+            username=account.email,
+            use_tls=account.use_ssl and not implicit_tls,
+            use_ssl=implicit_tls,
+            token_provider=_oauth_token_provider(account) if account.use_oauth and account.oauth_token else None,
+            **options
+        )
+    if name == 'file':
+        directory = getattr(settings, 'MAILER_FILE_SINK_DIR', 'sent_mail')
+        return FileSinkTransport(
+            os.path.join(directory, account.email if account else 'default'),
+            sender=account.email if account else default_sender
+        )
+    raise ValueError(f"Unknown MAILER_TRANSPORT: {name}")
+
+
+_transports = {}
+_transports_lock = threading.Lock()
+
+
+def get_transport(account=None):
+    """Return the process-wide transport for an account, creating it on first use"""
+    key = account.pk if account is not None else None
+    with _transports_lock:
+        transport = _transports.get(key)
+        if transport is None:
+            transport = _transports[key] = build_transport(account)
+    return transport
+
+
+def gmail_transport(account=None):
+    """The process-wide GmailTransport of an account, also when MAILER_TRANSPORT is another.
+
+    Reply discovery reads mailboxes through its pooled clients, and the
+    warmup authenticates them, so both use the clients sends do.
+    """
+    transport = get_transport(account)
+    if isinstance(transport, GmailTransport):
+        return transport
+    key = ('gmail', account.pk if account is not None else None)
+    with _transports_lock:
+        transport = _transports.get(key)
+        if transport is None:
+            transport = _transports[key] = GmailTransport(account)
+    return transport
+
+
+def close_transports():
+    """Close and forget every transport, e.g. after settings or accounts change"""
+    with _transports_lock:
+        transports = list(_transports.values())
+        _transports.clear()
+    for transport in transports:
+        transport.close()
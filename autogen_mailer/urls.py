@@ -1,14 +1,18 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import EmailCampaignViewSet, RecipientViewSet
-from .views import LoginView
+from .views import AudienceViewSet, EmailCampaignViewSet, RecipientViewSet
+from .views import LoginView, LLMMetricsView, send_events, unsubscribe
+from . import async_views
 router = DefaultRouter()
 router.register(r'campaigns', EmailCampaignViewSet, basename='campaign')
 router.register(r'recipients', RecipientViewSet, basename='recipient')
+router.register(r'audiences', AudienceViewSet, basename='audience')
 
 urlpatterns = [
     path('', include(router.urls)),
     path('login/', LoginView.as_view(), name='login'),
+    path('llm_metrics/', LLMMetricsView.as_view(), name='llm-metrics'),
+    path('unsubscribe/<str:token>/', unsubscribe, name='unsubscribe'),
     # Additional endpoints
     path('campaigns/<int:pk>/import_recipients/', 
          EmailCampaignViewSet.as_view({'post': 'import_recipients'}), 
@@ -19,12 +23,21 @@ urlpatterns = [
     path('campaigns/<int:pk>/send_emails/', 
          EmailCampaignViewSet.as_view({'post': 'send_emails'}), 
          name='send-emails'),
+    path('campaigns/<int:pk>/clone/',
+         EmailCampaignViewSet.as_view({'post': 'clone'}),
+         name='clone-campaign'),
+    path('campaigns/<int:pk>/variants/',
+         EmailCampaignViewSet.as_view({'get': 'variants', 'post': 'variants', 'delete': 'variants'}),
+         name='campaign-variants'),
     path('campaigns/<int:pk>/preview/', 
          EmailCampaignViewSet.as_view({'get': 'preview'}), 
          name='preview-email'),
     path('campaigns/<int:pk>/generate_and_send/',
      EmailCampaignViewSet.as_view({'post': 'generate_and_send'}),
      name='generate-and-send'),
+    path('campaigns/<int:pk>/send_events/',
+         send_events,
+         name='send-events'),
 
      # NEW REPLY HANDLING ENDPOINTS
     path('campaigns/<int:pk>/reply_stats/',
@@ -35,5 +48,19 @@ urlpatterns = [
          name='process-replies'),
     path('campaigns/<int:pk>/verify_replies/',
          EmailCampaignViewSet.as_view({'get': 'verify_replies'}),
-         name='verify-replies')
+         name='verify-replies'),
+
+    # Async variants of the I/O-bound actions (SERVER_MODE=asgi)
+    path('async/campaigns/<int:pk>/generate_content/',
+         async_views.generate_content,
+         name='async-generate-content'),
+    path('async/campaigns/<int:pk>/preview/',
+         async_views.preview,
+         name='async-preview-email'),
+    path('async/campaigns/<int:pk>/reply_stats/',
+         async_views.reply_stats,
+         name='async-reply-stats'),
+    path('async/campaigns/<int:pk>/process_replies/',
+         async_views.process_replies,
+         name='async-process-replies'),
 ]
@@ -0,0 +1,66 @@
+"""A/B tests: several versions of a campaign email, split across recipients.
+
+A recipient's variant depends only on their address and the number of
+variants, so re-running a send (or sending from another process) never
+moves anyone to a different version.
+"""
+import hashlib
+
+from django.db import transaction
+
+from .models import EmailVariant, GeneratedEmail
+
+
+def variant_index(email, count):
+    """Stable variant number in ``range(count)`` for an address"""
+    digest = hashlib.blake2b(email.strip().lower().encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big') % count
+
+
+def variant_for(email, variants):
+    """Pick the variant of ``variants`` (ordered by index) an address gets"""
+    return variants[variant_index(email, len(variants))]
+
+
+def sending_started(campaign):
+    """Whether any recipient of the campaign has been sent an email.
+
+    From then on the variants are fixed: changing their number would move
+    the remaining recipients to other versions, and deleting them would
+    lose which version the sent recipients got.
+    """
+    return (
+        campaign.recipients.filter(is_sent=True).exists()
+        or campaign.audience_deliveries.filter(state='sent').exists()
+    )
+
+
+@transaction.atomic
+def save_variants(campaign, emails):
+    """Replace the campaign's variants with ``emails`` (generator output dicts).
+
+    The first variant also becomes the campaign's GeneratedEmail, which
+    previews and single-version flows keep using.
+    """
+    if not emails:
+        raise ValueError("No variants to save")
+    campaign.variants.all().delete()
+    variants = EmailVariant.objects.bulk_create(
+        EmailVariant(
+            campaign=campaign,
+            index=index,
+            subject=email['subject'],
+            body_text=email['body_text'],
+            body_html=email['body_html']
+        )
+        for index, email in enumerate(emails)
+    )
+    GeneratedEmail.objects.update_or_create(
+        campaign=campaign,
+        defaults={
+            'subject': emails[0]['subject'],
+            'body_text': emails[0]['body_text'],
+            'body_html': emails[0]['body_html']
+        }
+    )
+    return variants
@@ -3,16 +3,34 @@ from rest_framework.response import Response
 from rest_framework.decorators import action
 from rest_framework.parsers import MultiPartParser, JSONParser
 from django.shortcuts import get_object_or_404
-from .models import EmailCampaign, Recipient, GeneratedEmail, EmailReply
-from .serializers import EmailCampaignSerializer, RecipientSerializer, GeneratedEmailSerializer
-from .autogen_service import AutoGenEmailGenerator
-from .gmail_service import GmailService
+from django.conf import settings
+from .models import Audience, EmailCampaign, Recipient, GeneratedEmail, EmailReply, LLMCallMetric
+from .serializers import AudienceSerializer, EmailCampaignSerializer, RecipientSerializer, GeneratedEmailSerializer, EmailVariantSerializer
+from . import services
+from .accounts import discover_replies
+from .send_engine import send_campaign
+from .suppression import email_from_token, get_suppression_list, suppress
+from .variants import save_variants, sending_started
+from .bulk_generation import agenerate_campaigns
+from .audiences import add_members, clone_campaign
 import csv
+import itertools
 from io import TextIOWrapper
 from rest_framework.permissions import AllowAny
 from django.utils import timezone
+from django.db.models import Avg, Count, Q, Sum
+from datetime import timedelta
 import logging
-from .reply_handler import ReplyHandler
+from .instrumentation import llm_latency_snapshot, tag_llm_calls
+from .metrics import REGISTRY
+from . import events, warmup
+from .async_views import ageneration_events
+from django.core.handlers.asgi import ASGIRequest
+from django.core import signing
+from django.http import HttpResponse, HttpResponseBadRequest, JsonResponse
+from django.utils.html import format_html
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_http_methods
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.permissions import AllowAny
@@ -21,7 +39,6 @@ from django.contrib.auth.models import User
 from rest_framework import status
 
 logger = logging.getLogger(__name__)
-logger.setLevel(logging.INFO)
 class LoginView(APIView):
     permission_classes = [AllowAny]
 
@@ -68,43 +85,37 @@ class EmailCampaignViewSet(viewsets.ModelViewSet):
     def reply_stats(self, request, pk=None):
         """Get statistics about replies for a campaign"""
         campaign = self.get_object()
-        stats = {
-            'total_replies': EmailReply.objects.filter(campaign=campaign).count(),
-            'pending_replies': EmailReply.objects.filter(
-                campaign=campaign, 
-                processed=False
-            ).count(),
-            'sent_replies': EmailReply.objects.filter(
-                campaign=campaign, 
-                reply_sent=True
-            ).count(),
-        }
+        # One pass over the campaign's replies instead of a query per counter
+        stats = EmailReply.objects.filter(campaign=campaign).aggregate(
+            total_replies=Count('id'),
+            pending_replies=Count('id', filter=Q(processed=False)),
+            sent_replies=Count('id', filter=Q(reply_sent=True)),
+            # Settled without an LLM call (see reply_classifier)
+            auto_replies=Count('id', filter=Q(classification__in=['auto_reply', 'bounce'])),
+            unsubscribes=Count('id', filter=Q(classification='unsubscribe')),
+            escalated_replies=Count('id', filter=Q(escalated=True))
+        )
         return Response(stats)
 
     @action(detail=True, methods=['post'])
     def process_replies(self, request, pk=None):
         """Process replies for a specific campaign with detailed response"""
         try:
-            print("entered for replies")
             campaign = self.get_object()
-            gmail = GmailService()
-            print(gmail)
-            reply_handler = ReplyHandler()
-            print(reply_handler)
+            reply_handler = services.create('reply_handler')
             
-            # Step 1: Find new replies
-            found_count = gmail.process_replies_for_campaign(campaign)
-            print(found_count)
+            # Step 1: Find new replies in every mailbox the campaign was sent from
+            found_count = discover_replies(campaign)
             
             # Step 2: Process replies
             sent_count = reply_handler.process_pending_replies_for_campaign(campaign)
-            print(sent_count)
             
             # Get updated stats
             stats = self.reply_stats(request, pk).data
-            print(stats)
-            print(campaign.name)
-            print(campaign.id)
+            logger.info(
+                "Processed replies for campaign %s: %s found", campaign.id, found_count,
+                extra={'campaign_id': campaign.id, 'new_replies': found_count, 'stats': stats}
+            )
             
             return Response({
                 'status': 'success',
@@ -119,7 +130,7 @@ class EmailCampaignViewSet(viewsets.ModelViewSet):
             })
             
         except Exception as e:
-            logger.error(f"Error processing replies: {str(e)}", exc_info=True)
+            logger.error("Error processing replies: %s", e, exc_info=True)
             return Response(
                 {
                     'status': 'error',
@@ -147,7 +158,7 @@ class EmailCampaignViewSet(viewsets.ModelViewSet):
         last_processed = EmailReply.objects.filter(
             campaign=campaign,
             processed=True
-        ).order_by('-received_at').first()
+        ).select_related('recipient').order_by('-received_at').first()
         
         return Response({
             'status': 'success',
@@ -168,15 +179,13 @@ class EmailCampaignViewSet(viewsets.ModelViewSet):
             return Response({'error': 'No file provided'}, status=status.HTTP_400_BAD_REQUEST)
         
         try:
-            csv_file = TextIOWrapper(file.file, encoding='utf-8')
-            reader = csv.DictReader(csv_file)
-            
+            suppression_list = get_suppression_list()
+            suppression_list.refresh()
             recipients = []
-            for row in reader:
-                email = row.get('email', '').strip() if row.get('email') else ''
-                name = row.get('name', '').strip() if row.get('name') else ''
-                
-                if not email:  # Skip rows with empty email
+            suppressed = 0
+            for email, name in csv_recipient_rows(file):
+                if email in suppression_list:
+                    suppressed += 1
                     continue
                     
                 recipients.append(Recipient(
@@ -189,10 +198,13 @@ class EmailCampaignViewSet(viewsets.ModelViewSet):
                 return Response({'error': 'No valid recipients found in file'}, status=status.HTTP_400_BAD_REQUEST)
             
             Recipient.objects.bulk_create(recipients)
-            return Response({'message': f'{len(recipients)} recipients imported successfully'})
+            return Response({
+                'message': f'{len(recipients)} recipients imported successfully',
+                'suppressed': suppressed
+            })
         
         except Exception as e:
-            print("error")
+            logger.warning("Error importing recipients for campaign %s: %s", pk, e)
             return Response(
                 {'error': f'Error processing file: {str(e)}'}, 
                 status=status.HTTP_400_BAD_REQUEST
@@ -209,9 +221,20 @@ class EmailCampaignViewSet(viewsets.ModelViewSet):
             "tone": str(campaign.tone)
         }
         
-        generator = AutoGenEmailGenerator()
+        generator = services.create('email_generator')
+        if request.query_params.get('stream') in ('1', 'true'):
+            # Server-sent events: the subject as soon as it is written, then the body
+            if isinstance(request._request, ASGIRequest):
+                # Django's ASGI handler buffers a sync body to the end; stream from the event loop
+                with tag_llm_calls(campaign_id=campaign.id, call_type='generate'):
+                    stream = generator.astream_email(context)
+                return events.event_stream_response(ageneration_events(campaign, stream))
+            with tag_llm_calls(campaign_id=campaign.id, call_type='generate'):
+                stream = generator.stream_email(context)
+            return events.event_stream_response(generation_events(campaign, stream))
         try:
-            email_content = generator.generate_email(context)
+            with tag_llm_calls(campaign_id=campaign.id, call_type='generate'):
+                email_content = generator.generate_email(context)
             
             GeneratedEmail.objects.update_or_create(
                 campaign=campaign,
@@ -226,6 +249,112 @@ class EmailCampaignViewSet(viewsets.ModelViewSet):
         except Exception as e:
             return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
     
+    @action(detail=False, methods=['post'])
+    def bulk_generate(self, request):
+        """Generate the emails of many campaigns concurrently.
+
+        POST ``{"campaign_ids": [...]}``; streams server-sent events: one
+        ``result`` per campaign in the order they finish (the saved email or
+        an error), then ``done`` with the totals. Comment lines are sent
+        while waiting, so proxies keep the connection open.
+
+        Only offered under ASGI. A batch can stream for minutes, and a sync
+        gunicorn worker held that long is killed by its timeout
+        (GUNICORN_TIMEOUT, 30s), cutting the stream mid-batch.
+        """
+        if not isinstance(request._request, ASGIRequest):
+            return Response(
+                {'error': "Bulk generation streams for minutes and needs the ASGI server (SERVER_MODE=asgi)"},
+                status=status.HTTP_501_NOT_IMPLEMENTED
+            )
+        campaign_ids = request.data.get('campaign_ids')
+        max_campaigns = getattr(settings, 'MAILER_BULK_GENERATE_MAX_CAMPAIGNS', 500)
+        if not isinstance(campaign_ids, list) or not campaign_ids:
+            return Response({'error': 'campaign_ids must be a non-empty list'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(campaign_ids) > max_campaigns:
+            return Response({'error': f'At most {max_campaigns} campaigns per request'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            campaign_ids = list(dict.fromkeys(int(campaign_id) for campaign_id in campaign_ids))
+        except (TypeError, ValueError):
+            return Response({'error': 'campaign_ids must be integers'}, status=status.HTTP_400_BAD_REQUEST)
+        campaigns = list(EmailCampaign.objects.filter(id__in=campaign_ids))
+        missing = sorted(set(campaign_ids) - {campaign.id for campaign in campaigns})
+        if missing:
+            return Response({'error': 'Campaigns not found', 'missing': missing}, status=status.HTTP_404_NOT_FOUND)
+        return events.event_stream_response(events.keepalive(bulk_generation_events(campaigns)))
+
+    @action(detail=True, methods=['post'])
+    def clone(self, request, pk=None):
+        """Copy a campaign's content and audience into a new campaign.
+
+        The clone references the same audience; a campaign with only its
+        own recipients has them made into an audience once, and one with
+        both has its own recipients copied. Optional body: ``{"name": ...}``.
+        """
+        campaign = get_object_or_404(EmailCampaign, pk=pk)
+        clone = clone_campaign(campaign, name=request.data.get('name'))
+        return Response(EmailCampaignSerializer(clone).data, status=status.HTTP_201_CREATED)
+
+    @action(detail=True, methods=['get', 'post', 'delete'])
+    def variants(self, request, pk=None):
+        """A/B variants of the campaign email.
+
+        POST ``{"count": n}`` generates n variants in one LLM request and
+        replaces any existing ones; while variants exist, generate_and_send
+        splits recipients across them. GET lists them with sent and reply
+        counts; DELETE goes back to a single email. POST and DELETE answer
+        409 once any recipient has been sent to.
+        """
+        campaign = get_object_or_404(EmailCampaign, pk=pk)
+        if request.method != 'GET' and sending_started(campaign):
+            return Response(
+                {'error': 'Variants cannot change after sending has started'},
+                status=status.HTTP_409_CONFLICT
+            )
+        if request.method == 'DELETE':
+            campaign.variants.all().delete()
+            return Response(status=status.HTTP_204_NO_CONTENT)
+
+        if request.method == 'GET':
+            variants = campaign.variants.annotate(
+                # Members' sends are counted once, from their deliveries
+                sent=Count('recipients', filter=Q(recipients__is_sent=True, recipients__member__isnull=True), distinct=True),
+                audience_sent=Count('audience_deliveries', filter=Q(audience_deliveries__state='sent'), distinct=True),
+                replies=Count('recipients__replies', distinct=True)
+            )
+            return Response([
+                {
+                    **EmailVariantSerializer(variant).data,
+                    'sent': variant.sent + variant.audience_sent,
+                    'replies': variant.replies
+                }
+                for variant in variants
+            ])
+
+        max_variants = getattr(settings, 'MAILER_MAX_VARIANTS', 5)
+        try:
+            count = int(request.data.get('count', 2))
+        except (TypeError, ValueError):
+            return Response({'error': 'count must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+        if not 2 <= count <= max_variants:
+            return Response({'error': f'count must be between 2 and {max_variants}'}, status=status.HTTP_400_BAD_REQUEST)
+
+        details = campaign.details or ""
+        context = {
+            "purpose": str(campaign.topic),
+            "key_points": [point.strip() for point in details.split('\n') if point.strip()],
+            "tone": str(campaign.tone)
+        }
+        try:
+            generator = services.create('email_generator')
+            with tag_llm_calls(campaign_id=campaign.id, call_type='generate'):
+                emails = generator.generate_variants(context, count)
+            variants = save_variants(campaign, emails)
+            return Response(EmailVariantSerializer(variants, many=True).data, status=status.HTTP_201_CREATED)
+        except Exception as e:
+            logger.error("Variant generation failed for campaign %s: %s", campaign.id, e)
+            return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
     @action(detail=True, methods=['get'])
     def preview(self, request, pk=None):
         campaign = get_object_or_404(EmailCampaign, pk=pk)
@@ -257,7 +386,6 @@ class EmailCampaignViewSet(viewsets.ModelViewSet):
         
         # Validate files if any were provided
         if files:
-            print("entered for files in views")
             for file in files:
                 if file.size > 25 * 1024 * 1024:  # Gmail's 25MB limit
                     return Response(
@@ -273,86 +401,99 @@ class EmailCampaignViewSet(viewsets.ModelViewSet):
                     )
 
         try:
-            # Generate email content
-            generator = AutoGenEmailGenerator()
-            context = {
-                "purpose": str(campaign.topic),
-                "key_points": key_points,
-                "tone": str(campaign.tone)
-            }
-            email_content = generator.generate_email(context)
-            
-            # Save generated content
-            generated_email, created = GeneratedEmail.objects.update_or_create(
-                campaign=campaign,
-                defaults={
-                    'subject': email_content['subject'],
-                    'body_text': email_content['body_text'],
-                    'body_html': email_content['body_html']
+            variants = list(campaign.variants.all())
+            if variants:
+                # A/B test: send the stored variants instead of generating one email
+                email_content = None
+                generated_email = campaign.generated_email
+            else:
+                # Generate email content
+                generator = services.create('email_generator')
+                context = {
+                    "purpose": str(campaign.topic),
+                    "key_points": key_points,
+                    "tone": str(campaign.tone)
                 }
-            )
+                with tag_llm_calls(campaign_id=campaign.id, call_type='generate'):
+                    email_content = generator.generate_email(context)
+                
+                # Save generated content
+                generated_email, created = GeneratedEmail.objects.update_or_create(
+                    campaign=campaign,
+                    defaults={
+                        'subject': email_content['subject'],
+                        'body_text': email_content['body_text'],
+                        'body_html': email_content['body_html']
+                    }
+                )
             
-            # Send emails (with or without attachments)
-            gmail = GmailService()
+            # Send emails (with or without attachments), sharded across sending accounts
+            # and queued per recipient domain, a chunk of recipients at a time
             sender_email = self.get_hardcoded_user_email()
-            recipients = campaign.recipients.filter(is_sent=False)
-            
-            results = {'success': 0, 'failures': []}
-            
-            for recipient in recipients:
-                try:
-                    # Need to rewind file pointers if they exist
-                    attachment_files = []
-                    if files:
-                        print("entered gmail")
-                        for file in files:
-                            from django.core.files.uploadedfile import InMemoryUploadedFile
-                            from io import BytesIO
-                            
-                            file_content = file.read()
-                            new_file = InMemoryUploadedFile(
-                                BytesIO(file_content),
-                                None,
-                                file.name,
-                                file.content_type,
-                                len(file_content),
-                                None
-                            )
-                            attachment_files.append(new_file)
-                            file.seek(0)  # Rewind original file
-                    
-                    gmail.send_email(
-                        sender=sender_email,
-                        to=recipient.email,
-                        subject=email_content['subject'],
-                        body_text=email_content['body_text'],
-                        body_html=email_content['body_html'],
-                        attachments=attachment_files if attachment_files else None
-                    )
-                    recipient.is_sent = True
-                    recipient.sent_at = timezone.now()
-                    recipient.save()
-                    results['success'] += 1
-                    logger.info(f"Email {'with attachments ' if files else ''}sent to {recipient.email}")
-                except Exception as e:
-                    logger.error(f"Failed to send to {recipient.email}: {str(e)}")
-                    results['failures'].append({
-                        'email': recipient.email,
-                        'error': str(e)
-                    })
+            results = send_campaign(campaign, email_content, sender_email, attachments=files, variants=variants)
             
             return Response({
                 'message': f'Successfully sent {results["success"]} emails',
                 'failures': results['failures'],
-                'generated_email': GeneratedEmailSerializer(instance=generated_email).data
+                # Over every account's quota; left unsent for a later run
+                'deferred': results['deferred'],
+                # Bounced or unsubscribed; never sent
+                'suppressed': results['suppressed'],
+                # The lists above stop at MAILER_SEND_REPORT_LIMIT addresses
+                'counts': {kind: results[f'{kind}_count'] for kind in ('failures', 'deferred', 'suppressed')},
+                'generated_email': GeneratedEmailSerializer(instance=generated_email).data,
+                'variants': EmailVariantSerializer(variants, many=True).data
             })
             
         except Exception as e:
-            logger.error(f"Error in generate_and_send: {str(e)}", exc_info=True)
+            logger.error("Error in generate_and_send: %s", e, exc_info=True)
             return Response(
                 {'error': str(e)}, 
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
+class AudienceViewSet(viewsets.ModelViewSet):
+    """Reusable recipient lists; set a campaign's ``audience`` to send to one"""
+    serializer_class = AudienceSerializer
+    queryset = Audience.objects.annotate(member_count=Count('members')).order_by('-created_at')
+
+    def destroy(self, request, *args, **kwargs):
+        audience = self.get_object()
+        if audience.campaigns.exists():
+            return Response({'error': 'Audience is used by campaigns'}, status=status.HTTP_409_CONFLICT)
+        return super().destroy(request, *args, **kwargs)
+
+    @action(detail=True, methods=['post'])
+    def import_members(self, request, pk=None):
+        """Add the rows of an uploaded CSV (``email``, ``name`` columns) to the audience"""
+        audience = self.get_object()
+        file = request.FILES.get('file')
+        if not file:
+            return Response({'error': 'No file provided'}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            suppression_list = get_suppression_list()
+            suppression_list.refresh()
+            suppressed = 0
+
+            def rows():
+                nonlocal suppressed
+                for email, name in csv_recipient_rows(file):
+                    if email in suppression_list:
+                        suppressed += 1
+                        continue
+                    yield email, name
+
+            added = add_members(audience, rows())
+            return Response({
+                'message': f'{added} members added',
+                'suppressed': suppressed,
+                'member_count': audience.members.count()
+            })
+        except Exception as e:
+            logger.warning("Error importing members for audience %s: %s", pk, e)
+            return Response({'error': f'Error processing file: {str(e)}'}, status=status.HTTP_400_BAD_REQUEST)
+
+
 class RecipientViewSet(viewsets.ModelViewSet):
     serializer_class = RecipientSerializer
     
@@ -361,3 +502,170 @@ class RecipientViewSet(viewsets.ModelViewSet):
         if campaign_id:
             return Recipient.objects.filter(campaign_id=campaign_id)
         return Recipient.objects.none()
+
+
+class LLMMetricsView(APIView):
+    """Latency percentiles, token usage and error rates of LLM calls"""
+    permission_classes = [AllowAny]
+    PERCENTILES = (0.5, 0.9, 0.99)
+
+    def get(self, request):
+        try:
+            hours = int(request.query_params.get('hours', 24))
+        except ValueError:
+            return Response({'error': 'hours must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+        campaign_id = request.query_params.get('campaign_id')
+        if campaign_id:
+            try:
+                campaign_id = int(campaign_id)
+            except ValueError:
+                return Response({'error': 'campaign_id must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+
+        calls = LLMCallMetric.objects.filter(created_at__gte=timezone.now() - timedelta(hours=hours))
+        if campaign_id:
+            calls = calls.filter(campaign_id=campaign_id)
+
+        summary = {}
+        rows = calls.values('call_type').annotate(
+            calls=Count('id'),
+            errors=Count('id', filter=Q(success=False)),
+            prompt_tokens=Sum('prompt_tokens'),
+            completion_tokens=Sum('completion_tokens'),
+            avg_latency_ms=Avg('latency_ms')
+        )
+        for row in rows:
+            latencies = calls.filter(call_type=row['call_type']).order_by('latency_ms').values_list('latency_ms', flat=True)
+            summary[row['call_type']] = {
+                'calls': row['calls'],
+                'errors': row['errors'],
+                'error_rate': round(row['errors'] / row['calls'], 4),
+                'prompt_tokens': row['prompt_tokens'],
+                'completion_tokens': row['completion_tokens'],
+                'avg_latency_ms': round(row['avg_latency_ms'], 1),
+                # One OFFSET query per percentile instead of loading every row. The
+                # (call_type, created_at) index finds the window's rows; the database
+                # still sorts them by latency, but only one value comes back
+                **{
+                    f'p{round(q * 100)}_ms': round(latencies[min(int(q * row['calls']), row['calls'] - 1)], 1)
+                    for q in self.PERCENTILES
+                },
+            }
+
+        return Response({
+            'window_hours': hours,
+            'campaign_id': campaign_id,
+            'calls': summary,
+            'in_process': llm_latency_snapshot(),
+        })
+
+
+def csv_recipient_rows(file):
+    """``(email, name)`` of every row of an uploaded CSV that has an email"""
+    for row in csv.DictReader(TextIOWrapper(file.file, encoding='utf-8')):
+        email = row.get('email', '').strip() if row.get('email') else ''
+        name = row.get('name', '').strip() if row.get('name') else ''
+        if email:
+            yield email, name
+
+
+def metrics_view(request):
+    """Expose this process's metrics in the Prometheus text format"""
+    return HttpResponse(REGISTRY.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+def ready_view(request):
+    """Readiness probe: 200 once this worker has warmed up, 503 until then.
+
+    Under gunicorn the warmup runs before the worker accepts requests;
+    elsewhere (runserver, tests) the first probe starts it in the background.
+    """
+    ready, report = warmup.status()
+    if not ready:
+        warmup.warm_in_background()
+    return JsonResponse({'ready': ready, **report}, status=200 if ready else 503)
+
+
+def generation_events(campaign, stream):
+    """Encoded ``subject``/``body`` events of an EmailStream, then ``done`` with the saved email.
+
+    A failure ends the stream with an ``error`` event and saves nothing.
+    """
+    ids = itertools.count(1)
+    try:
+        for event_type, data in stream:
+            yield events.Event(next(ids), event_type, data).encode()
+        generated_email, created = GeneratedEmail.objects.update_or_create(
+            campaign=campaign,
+            defaults={
+                'subject': stream.email['subject'],
+                'body_text': stream.email['body_text'],
+                'body_html': stream.email['body_html']
+            }
+        )
+        yield events.Event(next(ids), 'done', GeneratedEmailSerializer(instance=generated_email).data).encode()
+    except Exception as e:
+        logger.error("Streamed generation failed for campaign %s: %s", campaign.id, e)
+        yield events.Event(next(ids), 'error', {'error': str(e)}).encode()
+
+
+async def bulk_generation_events(campaigns):
+    """Encoded ``result`` events of agenerate_campaigns as they finish, then ``done``"""
+    ids = itertools.count(1)
+    generated = failed = 0
+    async for campaign, generated_email, error in agenerate_campaigns(campaigns):
+        data = {'campaign_id': campaign.id}
+        if error is None:
+            generated += 1
+            data['generated_email'] = GeneratedEmailSerializer(instance=generated_email).data
+        else:
+            failed += 1
+            data['error'] = str(error)
+        yield events.Event(next(ids), 'result', data).encode()
+    yield events.Event(next(ids), 'done', {'generated': generated, 'failed': failed}).encode()
+
+
+def send_events(request, pk):
+    """Stream live send progress of a campaign as server-sent events.
+
+    Emits ``started``, one ``progress`` event per recipient (with rolling
+    sent/failed/remaining counters and rate) and ``finished``, then ends.
+    The latest event is replayed on connect. An EventSource reconnecting
+    after ``finished`` gets 204, which tells it to stop.
+
+    Only offered under ASGI, where a viewer waits on the event loop. A sync
+    worker would be held for the whole send and killed by its timeout.
+    The broker is in-process, so viewers only see sends running in the
+    same worker process.
+    """
+    if not isinstance(request, ASGIRequest):
+        return JsonResponse(
+            {'error': "Live send events need the ASGI server (SERVER_MODE=asgi)"},
+            status=status.HTTP_501_NOT_IMPLEMENTED
+        )
+    campaign = get_object_or_404(EmailCampaign, pk=pk)
+    topic = events.send_topic(campaign.id)
+    if events.is_finished(topic, request.headers.get('Last-Event-ID')):
+        return HttpResponse(status=204)
+    return events.event_stream_response(events.astream(topic))
+
+
+@csrf_exempt
+@require_http_methods(['GET', 'POST'])
+def unsubscribe(request, token):
+    """Unsubscribe link from List-Unsubscribe and campaign emails.
+
+    GET asks for confirmation, so link scanners that prefetch URLs do not
+    unsubscribe anyone; POST (also the RFC 8058 one-click request mail
+    clients send) suppresses the address.
+    """
+    try:
+        email = email_from_token(token)
+    except signing.BadSignature:
+        return HttpResponseBadRequest("Invalid unsubscribe link")
+    if request.method == 'GET':
+        return HttpResponse(format_html(
+            '<form method="post"><p>Stop emails to {}?</p><button type="submit">Unsubscribe</button></form>',
+            email
+        ))
+    suppress(email, 'unsubscribe')
+    return HttpResponse(format_html('<p>{} has been unsubscribed.</p>', email))
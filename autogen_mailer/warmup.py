@@ -0,0 +1,187 @@
+"""Warm a server process up before it takes traffic.
+
+``preload()`` builds read-only state: it imports the lazy services,
+reads the Gmail discovery document, compiles the email templates, loads
+the tokenizer and loads the suppression list. Under ``gunicorn
+--preload`` it runs once in the master, so every worker starts with it
+(shared copy-on-write). It closes the database connections it used,
+because those must not cross a fork.
+
+``warm_worker()`` runs in each worker after the fork and opens what
+cannot be shared: a database connection, the LLM gateway's HTTP client
+and an authenticated Gmail client per mailbox, put in the process-wide
+pool sends, replies and reply discovery check clients out of
+(``transports.gmail_transport``). It runs ``preload()`` first if the
+master did not. ``status()`` backs the readiness endpoint.
+
+OAuth refreshes can be slow, and a gunicorn worker that does not report
+back within its timeout is killed. The Gmail clients are therefore
+authenticated on a background thread that is waited for at most
+MAILER_WARMUP_GMAIL_SECONDS; past that the worker starts serving and the
+thread finishes on its own. Loading the tokenizer can download its BPE
+file, so it is waited for at most MAILER_WARMUP_TOKENIZER_SECONDS (0
+skips it). ``notify`` (the worker's heartbeat) is called after every step.
+
+A failing step is logged and reported but does not stop the warmup; the
+request that needs it will retry the work.
+"""
+import logging
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection, connections
+
+logger = logging.getLogger(__name__)
+
+_state = {'preload': None, 'worker': None}
+_lock = threading.Lock()
+
+
+def _run(phase, steps, notify=None):
+    report = {'pid': os.getpid(), 'started_at': time.time(), 'finished': False, 'steps': {}}
+    _state[phase] = report
+    for name, step in steps:
+        started = time.perf_counter()
+        error = None
+        try:
+            step()
+        except Exception as e:
+            error = str(e)
+            logger.warning("Warmup step %s failed: %s", name, e)
+        report['steps'][name] = {'ms': round((time.perf_counter() - started) * 1000, 1), 'error': error}
+        if notify is not None:
+            notify()
+    report['finished'] = True
+    logger.info(
+        "Warmup %s done in %.0f ms", phase, sum(step['ms'] for step in report['steps'].values()),
+        extra={'phase': phase, 'steps': report['steps']}
+    )
+    return report
+
+
+def _load_services():
+    from . import services
+    services.load()
+
+
+def _gmail_discovery():
+    from .gmail_service import discovery_document
+    discovery_document()
+
+
+def _compile_templates():
+    from .rendering import TEMPLATE_DIR, get_template
+    for path in TEMPLATE_DIR.glob('*.html'):
+        if path.stem != 'layout':
+            get_template(path.stem)
+
+
+def _load_tokenizer():
+    from .reply_cleaner import count_tokens
+
+    budget = getattr(settings, 'MAILER_WARMUP_TOKENIZER_SECONDS', 10)
+    if not budget:
+        return
+    # The first load downloads the BPE file unless it is cached
+    thread = threading.Thread(
+        target=count_tokens, args=("", getattr(settings, 'LLM_MODEL', 'gpt-3.5-turbo')),
+        name='tokenizer-warmup', daemon=True
+    )
+    thread.start()
+    thread.join(budget)
+    if thread.is_alive():
+        raise TimeoutError(f"Tokenizer still loading after {budget}s; continuing in the background")
+
+
+def _load_suppression_list():
+    from .suppression import get_suppression_list
+    get_suppression_list()
+
+
+def preload():
+    """Build the state workers can share; safe to call before forking"""
+    try:
+        return _run('preload', [
+            ('services', _load_services),
+            ('gmail_discovery', _gmail_discovery),
+            ('templates', _compile_templates),
+            ('tokenizer', _load_tokenizer),
+            ('suppression_list', _load_suppression_list),
+        ])
+    finally:
+        connections.close_all()
+
+
+def _gmail_accounts():
+    from .gmail_service import default_token_path
+    from .models import EmailAccount
+
+    limit = getattr(settings, 'MAILER_WARMUP_GMAIL_ACCOUNTS', 10)
+    # Only mailboxes that can authenticate without an interactive OAuth flow
+    accounts = list(EmailAccount.objects.filter(is_active=True).exclude(oauth_token__isnull=True).exclude(oauth_token='')[:limit])
+    if not accounts and not EmailAccount.objects.filter(is_active=True).exists() and os.path.exists(default_token_path()):
+        # No accounts: everything goes through the default mailbox
+        accounts = [None]
+    return accounts
+
+
+def _connect_gmail(accounts):
+    from .transports import gmail_transport
+
+    try:
+        for account in accounts:
+            # Never the browser OAuth flow: a mailbox without a usable token is skipped
+            try:
+                gmail_transport(account).connect()
+            except Exception as e:
+                logger.warning("Gmail warmup skipped %s: %s", account or 'default mailbox', e)
+    finally:
+        # Token refreshes save the account from this thread
+        connections.close_all()
+
+
+def _gmail_clients():
+    accounts = _gmail_accounts()
+    if not accounts:
+        return
+    thread = threading.Thread(target=_connect_gmail, args=(accounts,), name='gmail-warmup', daemon=True)
+    thread.start()
+    budget = getattr(settings, 'MAILER_WARMUP_GMAIL_SECONDS', 10)
+    thread.join(budget)
+    if thread.is_alive():
+        raise TimeoutError(f"Gmail clients still authenticating after {budget}s; continuing in the background")
+
+
+def warm_worker(notify=None):
+    """Open this process's own connections and clients, calling ``notify`` after each step"""
+    with _lock:
+        if _state['worker'] is not None:
+            return _state['worker']
+        if _state['preload'] is None:
+            preload()
+        from .llm_gateway import get_gateway
+        return _run('worker', [
+            ('database', connection.ensure_connection),
+            ('llm_gateway', get_gateway),
+            ('gmail_clients', _gmail_clients),
+        ], notify)
+
+
+def warm_in_background():
+    """Start ``warm_worker`` on a thread unless it has run or is running"""
+    if _state['worker'] is None and not _lock.locked():
+        threading.Thread(target=warm_worker, name='warmup', daemon=True).start()
+
+
+def status():
+    """``(ready, report)``: ready once this process's worker warmup has finished"""
+    worker = _state['worker']
+    preload_report = _state['preload']
+    return bool(worker and worker['finished']), {
+        'pid': os.getpid(),
+        # Ran in the gunicorn master when its pid differs from this process's
+        'preload': preload_report,
+        'worker': worker,
+    }
@@ -2,6 +2,7 @@
 ASGI config for email_automation project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Used when start.sh runs with SERVER_MODE=asgi (gunicorn with uvicorn workers).
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
@@ -13,4 +14,27 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'email_automation.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+from asgiref.wsgi import WsgiToAsgi  # noqa: E402
+from django.conf import settings  # noqa: E402
+from whitenoise import WhiteNoise  # noqa: E402
+
+
+def _not_found(environ, start_response):
+    start_response('404 Not Found', [('Content-Type', 'text/plain')])
+    return [b'Not Found']
+
+
+# WhiteNoise middleware is sync-only and would cost a thread per request,
+# so under ASGI only /static/ requests are handed to it
+static_application = WsgiToAsgi(
+    WhiteNoise(_not_found, root=settings.STATIC_ROOT, prefix=settings.STATIC_URL)
+)
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'http' and scope['path'].startswith(settings.STATIC_URL):
+        await static_application(scope, receive, send)
+    else:
+        await django_application(scope, receive, send)
@@ -38,6 +38,83 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 GOOGLE_OAUTH_CREDENTIALS_PATH = os.path.join(BASE_DIR, 'credentials', 'gmail_credentials.json')
 GOOGLE_OAUTH_TOKEN_PATH = os.path.join(BASE_DIR, 'credentials', 'gmail_token.json')
 
+# Reply bodies are truncated to this many bytes before they are stored
+REPLY_MAX_BODY_BYTES = 64 * 1024
+
+# Token ceiling for the prompt sent to the LLM when answering a reply
+REPLY_PROMPT_MAX_TOKENS = 1200
+
+# AI replies allowed per thread and per recipient in a rolling window; replies past
+# either budget are escalated to a person instead (stops auto-responder loops)
+MAILER_REPLY_BUDGET_PER_THREAD = 3
+MAILER_REPLY_BUDGET_PER_RECIPIENT = 5
+MAILER_REPLY_BUDGET_WINDOW_HOURS = 24
+
+# Language model gateway. LLM_BACKEND is 'openai' or 'stub' (offline, deterministic)
+LLM_BACKEND = os.environ.get('LLM_BACKEND', 'openai')
+LLM_MODEL = os.environ.get('LLM_MODEL', 'gpt-3.5-turbo')
+LLM_BASE_URL = os.environ.get('LLM_BASE_URL', 'https://api.openai.com/v1')
+# Only ever read from the environment; required when LLM_BACKEND is 'openai'
+OPENAI_API_KEY = os.environ.get('OPENAI_API_KEY')
+LLM_TIMEOUT = 60  # seconds per call, including time spent waiting for a slot
+LLM_MAX_CONCURRENCY = int(os.environ.get('LLM_MAX_CONCURRENCY', 8))  # calls in flight per process (each for sync and async callers)
+LLM_MAX_CONNECTIONS = 20
+LLM_MAX_RETRIES = 0
+LLM_STUB_LATENCY = float(os.environ.get('LLM_STUB_LATENCY', 0))
+# Store a row per LLM call for the llm_metrics endpoint
+LLM_METRICS_PERSIST = True
+
+# Outgoing mail: 'gmail' (Gmail API), 'smtp' (pooled connections; EMAIL_* above or the
+# account's SMTP server) or 'file' (Maildir under MAILER_FILE_SINK_DIR, nothing is sent)
+MAILER_TRANSPORT = os.environ.get('MAILER_TRANSPORT', 'gmail')
+MAILER_SMTP_POOL_SIZE = 4  # connections per sending account
+MAILER_SMTP_MAX_MESSAGES_PER_CONNECTION = 100
+MAILER_FILE_SINK_DIR = os.environ.get('MAILER_FILE_SINK_DIR', os.path.join(BASE_DIR, 'sent_mail'))
+
+# Campaign sends are queued per recipient domain and drained round-robin by
+# MAILER_SEND_WORKERS threads. MAILER_DOMAIN_LIMITS caps sends in flight and per
+# second for each domain; 'default' applies to domains not listed.
+MAILER_SEND_WORKERS = int(os.environ.get('MAILER_SEND_WORKERS', 8))
+MAILER_DOMAIN_LIMITS = {
+    'default': {'concurrency': 2, 'rate_per_second': 5},
+    'gmail.com': {'concurrency': 4, 'rate_per_second': 10},
+    'googlemail.com': {'concurrency': 4, 'rate_per_second': 10},
+}
+MAILER_SEND_MAX_ATTEMPTS = 3  # tries per recipient while its domain or sending account is throttled
+MAILER_DOMAIN_BACKOFF_SECONDS = 2.0  # first pause of a throttled domain, doubled each time in a row
+MAILER_DOMAIN_BACKOFF_MAX_SECONDS = 120.0
+# Gmail API 429/5xx answers rate limit the sending account, not the recipient's domain:
+# that account pauses, starting at this many seconds and doubling each time in a row
+MAILER_ACCOUNT_BACKOFF_SECONDS = 2.0
+MAILER_ACCOUNT_BACKOFF_MAX_SECONDS = 120.0
+MAILER_RECIPIENT_CHUNK_SIZE = 1000  # recipients read from the database per query while sending
+MAILER_SEND_BUFFER = 2000  # deliveries held in the domain queues at a time
+MAILER_SEND_REPORT_LIMIT = 1000  # addresses listed per kind (failures, deferred, suppressed) in a send response
+
+# Gunicorn workers authenticate up to this many Gmail accounts before taking traffic
+# (see gunicorn.conf.py and /ready)
+MAILER_WARMUP_GMAIL_ACCOUNTS = 10
+# Longest a worker waits for those OAuth refreshes before serving; the rest finish in the
+# background. Keep it well below the gunicorn timeout (GUNICORN_TIMEOUT, 30s)
+MAILER_WARMUP_GMAIL_SECONDS = 10
+# Longest preload waits for the tokenizer, whose first load downloads its BPE file unless
+# it is cached (TIKTOKEN_CACHE_DIR); 0 skips the step and token counts load on first use
+MAILER_WARMUP_TOKENIZER_SECONDS = int(os.environ.get('MAILER_WARMUP_TOKENIZER_SECONDS', 10))
+
+# Public base URL of this server, e.g. https://mailer.example.com. When set, campaign
+# emails carry List-Unsubscribe links to /api/unsubscribe/
+MAILER_PUBLIC_URL = os.environ.get('MAILER_PUBLIC_URL', '')
+
+# Upper bound on A/B variants generated in one request (they share one LLM call)
+MAILER_MAX_VARIANTS = 5
+
+# Bulk generation (campaigns/bulk_generate/) runs MAILER_GENERATE_WORKERS completions at
+# once; LLM_MAX_CONCURRENCY still caps the calls in flight across the process. It streams
+# for as long as the batch takes, so it is only served under SERVER_MODE=asgi: a sync
+# worker would be killed by the gunicorn timeout (GUNICORN_TIMEOUT) mid-batch
+MAILER_GENERATE_WORKERS = int(os.environ.get('MAILER_GENERATE_WORKERS', 8))
+MAILER_BULK_GENERATE_MAX_CAMPAIGNS = 500
+
 
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/5.2/howto/deployment/checklist/
@@ -75,7 +152,13 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
 ]
-MIDDLEWARE.insert(1, "whitenoise.middleware.WhiteNoiseMiddleware")
+# 'wsgi' (sync gunicorn workers) or 'asgi' (uvicorn workers, async views); set by start.sh
+SERVER_MODE = os.environ.get('SERVER_MODE', 'wsgi')
+if SERVER_MODE != 'asgi':
+    # WhiteNoise is sync-only middleware; asgi.py serves static files itself
+    MIDDLEWARE.insert(1, "whitenoise.middleware.WhiteNoiseMiddleware")
+MIDDLEWARE.insert(0, "autogen_mailer.middleware.MetricsMiddleware")  # Outermost, so it times the whole stack
+MIDDLEWARE.insert(1, "autogen_mailer.middleware.ProfilingMiddleware")
 CORS_ALLOWED_ORIGINS = [
     "http://localhost:5173",
     "http://127.0.0.1:8000",
@@ -158,6 +241,44 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+# Logging
+# JSON lines written from a background thread so request threads never block on stdout.
+# MAILER_DEBUG_PAYLOADS additionally dumps raw Gmail API payloads at DEBUG level.
+MAILER_LOG_LEVEL = os.environ.get('MAILER_LOG_LEVEL', 'INFO')
+MAILER_DEBUG_PAYLOADS = os.environ.get('MAILER_DEBUG_PAYLOADS', '') == '1'
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'json': {
+            '()': 'autogen_mailer.logging_utils.JsonFormatter',
+        },
+    },
+    'handlers': {
+        'queue': {
+            'class': 'autogen_mailer.logging_utils.QueueListenerHandler',
+            'formatter': 'json',
+        },
+    },
+    'root': {
+        'handlers': ['queue'],
+        'level': 'INFO',
+    },
+    'loggers': {
+        'autogen_mailer': {
+            'level': MAILER_LOG_LEVEL,
+        },
+    },
+}
+
+# Request profiling: send an `X-Profile: 1` (or `cprofile`) header, or sample a share of requests.
+# Results come back in a Server-Timing header; dumps are written when PROFILING_DUMP_DIR is set.
+PROFILING_ALLOW_HEADER = os.environ.get('PROFILING_ALLOW_HEADER', '1' if DEBUG else '') == '1'
+PROFILING_SAMPLE_RATE = float(os.environ.get('PROFILING_SAMPLE_RATE', 0))
+PROFILING_CPROFILE = False
+PROFILING_DUMP_DIR = os.environ.get('PROFILING_DUMP_DIR') or None
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -1,5 +1,6 @@
 from django.contrib import admin
 from django.urls import path, include
+from autogen_mailer.views import metrics_view, ready_view
 from rest_framework_simplejwt.views import (
     TokenObtainPairView,
     TokenRefreshView,
@@ -11,4 +12,6 @@ urlpatterns = [
     path('api/token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
     path('api/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
     path('api/', include('autogen_mailer.urls')),
+    path('metrics', metrics_view, name='metrics'),
+    path('ready', ready_view, name='ready'),
 ]
\ No newline at end of file
@@ -0,0 +1,31 @@
+"""Gunicorn settings; start.sh runs ``gunicorn -c gunicorn.conf.py``.
+
+The app is loaded in the master (``preload_app``), which then runs the
+warmup preload: imports, the Gmail discovery document, compiled email
+templates, the suppression list. Workers are forked with all of that
+already in memory and only open their own connections before taking
+traffic. GUNICORN_PRELOAD=0 makes every worker load and warm up on its own.
+
+A worker that is still warming up when ``timeout`` runs out is killed, so
+the worker warmup waits at most MAILER_WARMUP_GMAIL_SECONDS for Gmail
+OAuth refreshes (keep it well below the timeout) and beats the heartbeat
+after every step.
+"""
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1') == '1'
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+
+
+def when_ready(server):
+    # Runs in the master after the app is loaded, before the first fork
+    if preload_app:
+        from autogen_mailer import warmup
+        warmup.preload()
+
+
+def post_worker_init(worker):
+    # Runs in each worker once it has loaded the app, before it accepts requests
+    from autogen_mailer import warmup
+    warmup.warm_worker(notify=worker.notify)
@@ -12,5 +12,12 @@ python manage.py migrate --noinput  # Prevent interactive prompts
 echo "Collecting static files..."
 python manage.py collectstatic --noinput  # Avoid user input issues
 
+if [ "${SERVER_MODE:-wsgi}" = "asgi" ]; then
+    # Async workers: requests waiting on OpenAI or Gmail don't hold a worker
+    echo "Starting Django app with Gunicorn + Uvicorn workers (ASGI)..."
+    exec gunicorn -c gunicorn.conf.py -k uvicorn.workers.UvicornWorker email_automation.asgi:application
+fi
+
+# gunicorn.conf.py preloads the app and warms each worker up; /ready reports when done
 echo "Starting Django app with Gunicorn..."
-exec gunicorn --bind 0.0.0.0:8000 email_automation.wsgi:application
+exec gunicorn -c gunicorn.conf.py email_automation.wsgi:application